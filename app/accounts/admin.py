@@ -6,7 +6,8 @@ from .models import (
     MaintenanceIntervention,
     Device,
     Supplier,
-    Software
+    Software,
+    AuditEvent
 )
 
 
@@ -29,9 +30,28 @@ class CustomUserAdmin(UserAdmin):
     )
 
 
+class AuditEventAdmin(admin.ModelAdmin):
+    """
+    Read only list of the audit events.
+    """
+    list_display = ('timestamp', 'action', 'outcome', 'actor_username', 'object_repr', 'latency_ms')
+    list_filter = ('outcome', 'action')
+    search_fields = ('actor_username', 'object_repr')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Department)
 admin.site.register(MaintenanceIntervention)
 admin.site.register(Device)
 admin.site.register(Supplier)
 admin.site.register(Software)
+admin.site.register(AuditEvent, AuditEventAdmin)
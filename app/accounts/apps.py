@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import signals  # noqa: F401
+
+        if settings.LOG_WRITER_ENABLED:
+            from .logs import install_log_writer
+
+            install_log_writer(
+                ['', *settings.LOGGING.get('loggers', {})],
+                max_size=settings.LOG_QUEUE_SIZE,
+                flush_interval=settings.LOG_WRITER_FLUSH_INTERVAL
+            )
+
+        if settings.METRICS_ENABLED:
+            from django.db.backends.signals import connection_created
+            from .metrics import install_query_recorder
+
+            connection_created.connect(install_query_recorder, dispatch_uid='accounts.metrics')
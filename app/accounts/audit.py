@@ -0,0 +1,47 @@
+import logging
+
+audit_logger = logging.getLogger('accounts.audit')
+
+# Outcomes of an audited action
+SUCCESS = 'success'
+REJECTED = 'rejected'
+ERROR = 'error'
+
+
+def describe(obj):
+    """
+    Return the audit description of a model instance. Take it before deleting the
+    instance, which clears its primary key.
+    """
+    return {'type': obj._meta.label_lower, 'id': obj.pk, 'repr': str(obj)[:200]}
+
+
+def audit(action, actor, target=None, outcome=SUCCESS, latency_ms=None, level=logging.INFO, **details):
+    """
+    Record the audit event of `actor` performing `action` on `target` (a model
+    instance or its `describe` description), as a record of the `accounts.audit`
+    logger carrying the event in its `audit` attribute.
+    Nothing is built when the logger does not handle `level`.
+    - details: Other fields of the event, e.g. the reason of a rejection
+    """
+    if not audit_logger.isEnabledFor(level):
+        return
+    if target is not None and not isinstance(target, dict):
+        target = describe(target)
+    if actor is not None and actor.is_authenticated:
+        actor = {'id': actor.pk, 'username': actor.get_username()}
+    else:
+        actor = None
+    event = {
+        'action': action,
+        'outcome': outcome,
+        'actor': actor,
+        'object': target,
+        'latency_ms': round(latency_ms, 3) if latency_ms is not None else None,
+        'details': details,
+    }
+    audit_logger.log(
+        level, '%s %s: %s by %s',
+        action, outcome, target['repr'] if target else '-', actor['username'] if actor else 'anonymous',
+        extra={'audit': event}
+    )
@@ -0,0 +1,196 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .cache import cache_call
+
+TOKEN_CACHE_KEY = 'accounts:token:{key}'
+
+
+class TokenCache:
+    """
+    Two level cache of token key -> user.
+    - A bounded, in-process LRU answers the hot path without any I/O. Its entries
+      expire after `local_timeout` seconds, which bounds how long another process
+      may keep serving a token that was revoked elsewhere.
+    - The shared cache (Django's default cache) is consulted on a local miss and
+      is invalidated explicitly, so it can keep entries for `timeout` seconds. It is
+      skipped when the default cache is not shared by the workers
+      (SHARED_CACHE_ENABLED), as a revoked token would stay valid in the others.
+    """
+
+    def __init__(self, max_size, local_timeout, timeout):
+        self.max_size = max_size
+        self.local_timeout = local_timeout
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        user = self._get_local(key, now)
+        if user is not None:
+            return user
+
+        if not settings.SHARED_CACHE_ENABLED:
+            return None
+        user = cache.get(TOKEN_CACHE_KEY.format(key=key))
+        if user is not None:
+            self._set_local(key, user, now)
+        return user
+
+    async def aget(self, key):
+        now = time.monotonic()
+        user = self._get_local(key, now)
+        if user is not None:
+            return user
+
+        if not settings.SHARED_CACHE_ENABLED:
+            return None
+        user = await cache_call(cache, 'get', TOKEN_CACHE_KEY.format(key=key))
+        if user is not None:
+            self._set_local(key, user, now)
+        return user
+
+    def set(self, key, user):
+        if settings.SHARED_CACHE_ENABLED:
+            cache.set(TOKEN_CACHE_KEY.format(key=key), user, self.timeout)
+        self._set_local(key, user, time.monotonic())
+
+    async def aset(self, key, user):
+        if settings.SHARED_CACHE_ENABLED:
+            await cache_call(cache, 'set', TOKEN_CACHE_KEY.format(key=key), user, self.timeout)
+        self._set_local(key, user, time.monotonic())
+
+    def delete(self, key):
+        cache.delete(TOKEN_CACHE_KEY.format(key=key))
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear_local(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get_local(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                return user
+            del self._entries[key]
+            return None
+
+    def _set_local(self, key, user, now):
+        with self._lock:
+            self._entries[key] = (user, now + self.local_timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+token_cache = TokenCache(
+    max_size=settings.TOKEN_AUTH_CACHE_SIZE,
+    local_timeout=settings.TOKEN_AUTH_LOCAL_CACHE_TIMEOUT,
+    timeout=settings.TOKEN_AUTH_CACHE_TIMEOUT,
+)
+
+
+def invalidate_token(key):
+    """
+    Drop a token from the token cache.
+    """
+    token_cache.delete(key)
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Drop every token of a user from the token cache.
+    """
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        token_cache.delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that resolves the token through the token cache and only
+    queries the Token and User tables on a miss.
+    Only active users are cached; logout (token deletion) and any change of the
+    user (deactivation, password change, permissions) invalidate the entry.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+        else:
+            token = Token(key=key, user=user)
+        return self.copy_credentials(user, token)
+
+    def get_token_key(self, request):
+        """
+        Return the token key sent in the Authorization header, or None when the
+        request does not use token authentication.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.')
+            )
+
+    async def aauthenticate(self, request):
+        """
+        Async version of `authenticate`: a token cache hit is answered on the event
+        loop, a miss queries the Token and User tables in a thread.
+        """
+        key = self.get_token_key(request)
+        if key is None:
+            return None
+        user = await token_cache.aget(key)
+        if user is None:
+            user, token = await sync_to_async(super().authenticate_credentials)(key)
+            await token_cache.aset(key, user)
+        else:
+            token = Token(key=key, user=user)
+        return self.copy_credentials(user, token)
+
+    def copy_credentials(self, user, token):
+        # Hand out a copy, so attributes memoized during the request (such as the
+        # email verified flag) never leak into the shared entry.
+        user = copy.copy(user)
+        token.user = user
+        return user, token
+
+
+class AsyncSessionAuthentication(SessionAuthentication):
+    """
+    Session authentication that can also authenticate async requests, loading the
+    session and the user with `request.auser()`.
+    """
+
+    async def aauthenticate(self, request):
+        user = await request._request.auser()
+        if not user or not user.is_active:
+            return None
+        self.enforce_csrf(request)
+        return (user, None)
@@ -0,0 +1,586 @@
+import asyncio
+import base64
+import datetime
+import itertools
+import math
+import random
+import statistics
+import time
+
+from allauth.account.models import EmailAddress
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection, connections, transaction
+from django.db.utils import load_backend
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .authentication import CachedTokenAuthentication, token_cache
+from .constants import ACTIVE, INACTIVE, PENDING
+from .models import Department, User, MaintenanceIntervention, Device, Software, Supplier
+from .pagination import KeysetPagination
+from .search import search_queryset
+
+
+def measure(function, iterations):
+    """
+    Call `function` `iterations` times and return the timing summary in microseconds,
+    and the calls per second (one call at a time).
+    """
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'mean_us': round(statistics.fmean(timings), 1),
+        'p50_us': round(timings[len(timings) // 2], 1),
+        'p95_us': round(timings[math.ceil(len(timings) * 0.95) - 1], 1),
+        'p99_us': round(timings[math.ceil(len(timings) * 0.99) - 1], 1),
+        'per_second': round(iterations / (sum(timings) / 1_000_000), 1),
+    }
+
+
+def bench_auth(iterations=1000):
+    """
+    Compare the per request overhead of the DRF authentication classes.
+    The benchmark user and token are created in a transaction that is rolled back.
+    """
+    results = {}
+    with transaction.atomic():
+        user = User.objects.create_user(
+            username='benchmark-auth',
+            email='benchmark-auth@example.com',
+            password='benchmark-password'
+        )
+        token = Token.objects.create(user=user)
+        factory = APIRequestFactory()
+        basic = base64.b64encode(b'benchmark-auth:benchmark-password').decode()
+        scenarios = [
+            ('basic', BasicAuthentication(), f"Basic {basic}"),
+            ('token', TokenAuthentication(), f"Token {token.key}"),
+            ('cached_token', CachedTokenAuthentication(), f"Token {token.key}"),
+        ]
+        for name, authenticator, header in scenarios:
+            request = Request(factory.get('/', HTTP_AUTHORIZATION=header))
+
+            def authenticate():
+                assert authenticator.authenticate(request)[0].pk == user.pk
+
+            # Warm up the connection and the token cache before measuring.
+            authenticate()
+            results[name] = measure(authenticate, iterations)
+        transaction.set_rollback(True)
+    token_cache.delete(token.key)
+    return results
+
+
+def bench_search(iterations=200):
+    """
+    Measure typeahead searches (first page of ranked results) on the current data.
+    Each resource is searched with a fragment of one of its own rows; resources
+    without rows are skipped.
+    """
+    scenarios = [
+        ('device_serial_number', Device, ['serial_number', 'brand', 'name'], 'serial_number'),
+        ('software_name', Software, ['name', 'license_key'], 'name'),
+        ('supplier_name', Supplier, ['name'], 'name'),
+        ('user_last_name', User, ['first_name', 'last_name', 'email'], 'last_name'),
+    ]
+    results = {}
+    for name, model, fields, sample_field in scenarios:
+        sample = model.objects.exclude(**{sample_field: ''}).values_list(sample_field, flat=True).last()
+        if not sample:
+            continue
+        words = [sample[-6:]]
+        queryset = search_queryset(model.objects.all(), fields, words)
+
+        def search():
+            list(queryset[:KeysetPagination.page_size + 1])
+
+        search()
+        results[name] = dict(measure(search, iterations), term=words[0])
+    return results
+
+
+def bench_connections(iterations=200):
+    """
+    Compare the database work of a request, one `SELECT 1`, in each connection mode:
+    - new_connection: connect, query and disconnect (no pool, CONN_MAX_AGE=0)
+    - persistent: reuse the connection of the thread, checked with a query at the
+      start of each request (CONN_MAX_AGE with CONN_HEALTH_CHECKS)
+    - pooled: take a connection from the pool (checked), query and give it back
+    Each mode runs on its own connection to the default database, registered under
+    a benchmark alias while it is measured.
+    """
+    settings_dict = connections['default'].settings_dict
+    options = {key: value for key, value in settings_dict['OPTIONS'].items() if key != 'pool'}
+    backend = load_backend(settings_dict['ENGINE'])
+    pool = settings_dict['OPTIONS'].get('pool') or {'min_size': 1, 'max_size': 2}
+    wrappers = {
+        'new_connection': backend.DatabaseWrapper(
+            {**settings_dict, 'OPTIONS': options, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+            alias='benchmark-new-connection'
+        ),
+        'persistent': backend.DatabaseWrapper(
+            {**settings_dict, 'OPTIONS': options, 'CONN_MAX_AGE': None, 'CONN_HEALTH_CHECKS': True},
+            alias='benchmark-persistent'
+        ),
+    }
+    if connections['default'].vendor == 'postgresql' and hasattr(backend.DatabaseWrapper, 'pool'):
+        wrappers['pooled'] = backend.DatabaseWrapper(
+            {**settings_dict, 'OPTIONS': {**options, 'pool': pool}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True},
+            alias='benchmark-pooled'
+        )
+
+    results = {}
+    for name, wrapper in wrappers.items():
+        connections[wrapper.alias] = wrapper
+
+        def request():
+            # What request_started and request_finished do around a request.
+            wrapper.close_if_unusable_or_obsolete()
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            wrapper.close_if_unusable_or_obsolete()
+
+        try:
+            request()
+            results[name] = measure(request, iterations)
+        finally:
+            wrapper.close()
+            if name == 'pooled':
+                wrapper.close_pool()
+            del connections[wrapper.alias]
+    return results
+
+
+async def asgi_get(application, path, headers):
+    """
+    Send a GET request to an ASGI application, the way an ASGI server does, and
+    return the response status.
+    """
+    path, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'https' if settings.SECURE_SSL_REDIRECT else 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query_string.encode(),
+        'root_path': '',
+        'headers': [(name.encode(), value.encode()) for name, value in headers.items()],
+        'client': ('127.0.0.1', 50000),
+        'server': (headers['host'], 80),
+    }
+    status = None
+    body_sent = False
+    response_sent = asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Like a server, report the disconnection once the response is sent.
+        await response_sent.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            response_sent.set()
+
+    await application(scope, receive, send)
+    return status
+
+
+async def measure_concurrency(application, path, headers, concurrency, requests):
+    """
+    Send `requests` requests from `concurrency` concurrent clients and return the
+    throughput and the latency percentiles in milliseconds.
+    """
+    timings = []
+
+    async def client():
+        for _ in range(max(requests // concurrency, 1)):
+            start = time.perf_counter()
+            status = await asgi_get(application, path, headers)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert status == 200, f"{path} answered {status}"
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'requests_per_second': round(len(timings) / elapsed, 1),
+        'p50_ms': round(timings[len(timings) // 2], 1),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 1),
+    }
+
+
+def bench_concurrency(iterations=200, levels=(1, 4, 16, 64)):
+    """
+    Measure the throughput of the read endpoints served by AsyncReadMixin at
+    increasing client concurrency, through the ASGI handler like Uvicorn runs it,
+    with the async handlers and with the sync views (ASYNC_READ_ENABLED=False).
+    `iterations` requests are sent per concurrency level; the response cache is off,
+    so every request reaches the database.
+    The requests are served on their own connections, which can not see uncommitted
+    data: the benchmark staff user is committed and deleted at the end.
+    """
+    user = User.objects.create_user(username='benchmark-concurrency', email='benchmark-concurrency@example.com',
+                                    is_staff=True)
+    try:
+        EmailAddress.objects.create(user=user, email=user.email, verified=True, primary=True)
+        token = Token.objects.create(user=user)
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        headers = {'host': host, 'authorization': f"Token {token.key}", 'accept': 'application/json'}
+        paths = {'device_list': reverse('device-list')}
+        device = Device.objects.order_by('pk').first()
+        if device is not None:
+            paths['device_detail'] = reverse('device-detail', args=[device.pk])
+
+        async def run():
+            application = ASGIHandler()
+            results = {}
+            for name, path in paths.items():
+                for mode, enabled in (('sync', False), ('async', True)):
+                    with override_settings(ASYNC_READ_ENABLED=enabled, RESPONSE_CACHE_ENABLED=False):
+                        # Warm up the token cache and the connections.
+                        await measure_concurrency(application, path, headers, levels[-1], levels[-1])
+                        results.setdefault(name, {})[mode] = {
+                            str(concurrency): await measure_concurrency(
+                                application, path, headers, concurrency, iterations
+                            )
+                            for concurrency in levels
+                        }
+            return results
+
+        return asyncio.run(run())
+    finally:
+        token_cache.clear_local()
+        user.delete()
+
+
+def bench_metrics(iterations=500):
+    """
+    Measure the overhead of RequestMetricsMiddleware on the first page of the device
+    list, served through the WSGI handler without the middleware, with unsampled
+    requests (latency histogram only) and with sampled requests (database and
+    serialization timings too).
+    The benchmark user and token are created in a transaction that is rolled back.
+    """
+    middleware = [name for name in settings.MIDDLEWARE if name != 'accounts.middleware.RequestMetricsMiddleware']
+    scenarios = [
+        ('disabled', {'MIDDLEWARE': middleware}),
+        ('unsampled', {'METRICS_SAMPLE_RATE': 0.0}),
+        ('sampled', {'METRICS_SAMPLE_RATE': 1.0}),
+    ]
+    results = {}
+    with transaction.atomic():
+        user = User.objects.create_user(username='benchmark-metrics', email='benchmark-metrics@example.com',
+                                        is_staff=True)
+        EmailAddress.objects.create(user=user, email=user.email, verified=True, primary=True)
+        token = Token.objects.create(user=user)
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        path = reverse('device-list')
+        for name, overrides in scenarios:
+            with override_settings(RESPONSE_CACHE_ENABLED=False, METRICS_ENABLED=True, **overrides):
+                client = Client(HTTP_HOST=host, HTTP_AUTHORIZATION=f"Token {token.key}")
+
+                def request():
+                    assert client.get(path).status_code == 200
+
+                request()
+                results[name] = measure(request, iterations)
+        transaction.set_rollback(True)
+    token_cache.delete(token.key)
+    return results
+
+
+def bench_endpoints(iterations=100):
+    """
+    Drive every accounts endpoint and the login against the current data (see the
+    `generate_dataset` command), through the WSGI handler like Gunicorn runs it, as
+    a staff user authenticated by token. Reports, for each endpoint, the latency
+    percentiles, the requests per second (one client) and the database queries of
+    one request.
+    - Detail endpoints read the first row of their table, and are skipped when it is empty
+    - Writes use rows created for the benchmark in a transaction rolled back at the
+      end, so the data is left untouched
+    - Exports stream the whole table, and the login hashes the password: they run
+      max(1, iterations // 10) times
+    The response cache is off, so every request reaches the database.
+    """
+    slow_iterations = max(1, iterations // 10)
+    results = {}
+    with transaction.atomic(), override_settings(RESPONSE_CACHE_ENABLED=False):
+        password = 'benchmark-password'
+        user = User.objects.create_user(username='benchmark-endpoints', email='benchmark-endpoints@example.com',
+                                        password=password, is_staff=True)
+        EmailAddress.objects.create(user=user, email=user.email, verified=True, primary=True)
+        token = Token.objects.create(user=user)
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        client = Client(HTTP_HOST=host, HTTP_AUTHORIZATION=f"Token {token.key}")
+        anonymous = Client(HTTP_HOST=host)
+
+        supplier = Supplier.objects.create(name='Benchmark', telephone='benchmark')
+        software = Software.objects.create(name='Benchmark', version='1.0', supplier=supplier, license_key='KEY',
+                                           expire_date=datetime.date(2100, 1, 1), max_installations=iterations + 1)
+        device = Device.objects.create(user=user, brand='Benchmark', name='Benchmark', serial_number='BENCH',
+                                       purchase_date=datetime.date(2024, 1, 1))
+        install_devices = iter(Device.objects.bulk_create(
+            Device(user=user, brand='Benchmark', name='Benchmark', serial_number=f"BENCH-{index}",
+                   purchase_date=datetime.date(2024, 1, 1))
+            for index in range(iterations + 1)
+        ))
+        serials = (f"BENCH-NEW-{index}" for index in itertools.count())
+        # A team of 200 devices, reassigned and moved between statuses at every request.
+        other = User.objects.create_user(username='benchmark-endpoints-other', password=password)
+        team = Device.objects.bulk_create(
+            Device(user=user, brand='Benchmark', name='Benchmark', serial_number=f"BENCH-TEAM-{index}",
+                   purchase_date=datetime.date(2024, 1, 1))
+            for index in range(200)
+        )
+        assignees = itertools.cycle([other.pk, user.pk])
+        statuses = itertools.cycle([INACTIVE, ACTIVE])
+        # A software per request, the team installed on each and then removed from each.
+        licenses = Software.objects.bulk_create(
+            Software(name='Benchmark', version=f"{index}.0", supplier=supplier, license_key='KEY',
+                     expire_date=datetime.date(2100, 1, 1), max_installations=len(team))
+            for index in range(iterations + 1)
+        )
+        install_licenses = iter(licenses)
+        uninstall_licenses = iter(licenses)
+        team_items = {'items': [{'device_id': device.pk} for device in team]}
+
+        scenarios = [
+            # name, method, path and data (or functions returning them), client, iterations
+            ('login', 'post', reverse('rest_login'), {'username': user.username, 'password': password},
+             anonymous, slow_iterations),
+            ('search', 'get', f"{reverse('search')}?q={device.brand}", None, client, iterations),
+            ('stats', 'get', reverse('stats'), None, client, iterations),
+            ('stats_database', 'get', reverse('stats-database'), None, client, iterations),
+        ]
+        # basename, model, whether the viewset has an export
+        for basename, model, export in [('department', Department, False), ('user', User, False),
+                                        ('maintenanceintervention', MaintenanceIntervention, True),
+                                        ('device', Device, True), ('supplier', Supplier, False),
+                                        ('software', Software, True)]:
+            scenarios.append((f"{basename}_list", 'get', reverse(f"{basename}-list"), None, client, iterations))
+            pk = model.objects.order_by('pk').values_list('pk', flat=True).first()
+            if pk is not None:
+                scenarios.append((f"{basename}_detail", 'get', reverse(f"{basename}-detail", args=[pk]), None,
+                                  client, iterations))
+            if export:
+                scenarios.append((f"{basename}_export", 'get', reverse(f"{basename}-export", args=['csv']), None,
+                                  client, slow_iterations))
+        scenarios += [
+            ('device_list_filtered', 'get', f"{reverse('device-list')}?status=ACTIVE&ordering=-purchase_date", None,
+             client, iterations),
+            ('device_list_expanded', 'get', f"{reverse('device-list')}?expand=user,assigned_to,softwares", None,
+             client, iterations),
+            ('device_create', 'post', reverse('device-list'), lambda: {
+                'user': user.pk, 'brand': 'Benchmark', 'name': 'Benchmark', 'serial_number': next(serials),
+                'purchase_date': '2024-01-01'
+            }, client, iterations),
+            ('device_update', 'patch', reverse('device-detail', args=[device.pk]), {'name': 'Benchmark updated'},
+             client, iterations),
+            ('device_assign', 'post', reverse('device-assign', args=[device.pk]), {'user_id': user.pk}, client,
+             iterations),
+            ('device_bulk_assign', 'post', reverse('device-bulk-assign'), lambda: {'items': [
+                {'device_id': device.pk, 'user_id': assignee} for assignee in [next(assignees)] for device in team
+            ]}, client, iterations),
+            ('device_bulk_status', 'post', reverse('device-bulk-status'), lambda: {'items': [
+                {'device_id': device.pk, 'status': device_status} for device_status in [next(statuses)]
+                for device in team
+            ]}, client, iterations),
+            ('software_bulk_install', 'post',
+             lambda: reverse('software-bulk-install', args=[next(install_licenses).pk]), team_items, client,
+             iterations),
+            ('software_bulk_uninstall', 'post',
+             lambda: reverse('software-bulk-uninstall', args=[next(uninstall_licenses).pk]), team_items, client,
+             iterations),
+            ('software_install', 'post', reverse('software-install', args=[software.pk]),
+             lambda: {'device_id': next(install_devices).pk}, client, iterations),
+            ('user_activate', 'post', reverse('user-activate', args=[user.pk]), None, client, iterations),
+            ('maintenanceintervention_create', 'post', reverse('maintenanceintervention-list'), {
+                'device': device.pk, 'description': 'Benchmark', 'date_intervention': '2024-01-01',
+                'status': PENDING, 'technician': user.pk
+            }, client, iterations),
+        ]
+
+        for name, method, path, data, scenario_client, scenario_iterations in scenarios:
+            def request():
+                url = path() if callable(path) else path
+                payload = data() if callable(data) else data
+                if method == 'get':
+                    response = scenario_client.get(url)
+                else:
+                    response = getattr(scenario_client, method)(url, payload, content_type='application/json')
+                assert response.status_code < 300, f"{name}: {url} answered {response.status_code}"
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+
+            # The first request warms up the caches and counts the queries (the query
+            # log of the connection is reset by every request).
+            queries = []
+            with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                request()
+            results[name] = dict(measure(request, scenario_iterations), queries=len(queries))
+        transaction.set_rollback(True)
+    token_cache.delete(token.key)
+    return results
+
+
+def bench_visibility(iterations=200, installations=(1000, 10000, 100000)):
+    """
+    Measure the first page of the software a regular user sees (installed on one of
+    their devices) while the installations of the other devices grow to each of
+    `installations`: with the EXISTS semi-join of `Software.objects.visible_to`
+    and with the join plus DISTINCT it replaced. The rows are created in a
+    transaction that is rolled back.
+    """
+    results = {}
+    with transaction.atomic():
+        owner = User.objects.create_user(username='benchmark-visibility-owner', password='benchmark-password',
+                                         is_staff=True)
+        user = User.objects.create_user(username='benchmark-visibility', password='benchmark-password')
+        supplier = Supplier.objects.create(name='Benchmark', telephone='benchmark-visibility')
+        softwares = Software.objects.bulk_create(
+            Software(name=f"Benchmark {index}", version='1.0', supplier=supplier, license_key=f"KEY-{index}",
+                     expire_date=datetime.date(2100, 1, 1) + datetime.timedelta(days=index),
+                     max_installations=1_000_000)
+            for index in range(1000)
+        )
+        devices = Device.objects.bulk_create(
+            Device(user=owner, brand='Benchmark', name='Benchmark', serial_number=f"BENCH-VISIBILITY-{index}",
+                   purchase_date=datetime.date(2024, 1, 1), assigned_to=user if index < 5 else owner)
+            for index in range(max(installations) // 10 + 5)
+        )
+        through = Software.installed_on.through
+        # The devices of the user have a few softwares each, the others ten.
+        through.objects.bulk_create(
+            through(device=device, software=softwares[(index * 7 + offset) % len(softwares)])
+            for index, device in enumerate(devices[:5]) for offset in range(4)
+        )
+        others = ((device, software) for device in devices[5:] for software in random.sample(softwares, 10))
+        created = 0
+        page = KeysetPagination.page_size + 1
+        scenarios = [
+            ('exists', lambda: Software.objects.visible_to(user)),
+            ('join_distinct', lambda: Software.objects.filter(installed_on__assigned_to=user).distinct()),
+        ]
+        for total in installations:
+            through.objects.bulk_create(
+                (through(device=device, software=software) for device, software in itertools.islice(
+                    others, total - created)),
+                batch_size=5000
+            )
+            created = total
+            with connection.cursor() as cursor:
+                for model in (Device, Software, through):
+                    cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+            results[total] = {}
+            for name, queryset in scenarios:
+                def list_softwares():
+                    list(queryset().order_by('expire_date', 'id')[:page])
+
+                list_softwares()
+                results[total][name] = measure(list_softwares, iterations)
+        transaction.set_rollback(True)
+    return results
+
+
+def bench_bulk_writes(iterations=1000, batch=100):
+    """
+    Compare the rows per second written through the list endpoints of devices,
+    suppliers and software: `batch` new objects posted one per request (the single
+    object path), posted as one JSON array (bulk upsert) and partially updated as
+    one JSON array patched by id. Each scenario writes max(1, iterations // 50)
+    batches, through the WSGI handler as a staff user authenticated by token, in a
+    transaction rolled back at the end. Reports the timings of a batch, the rows
+    per second and the database queries of a batch, and the speedup of the bulk
+    upsert over the single object path.
+    """
+    batches = max(1, iterations // 50)
+    results = {}
+    with transaction.atomic(), override_settings(RESPONSE_CACHE_ENABLED=False):
+        user = User.objects.create_user(username='benchmark-bulk-writes', email='benchmark-bulk-writes@example.com',
+                                        password='benchmark-password', is_staff=True)
+        EmailAddress.objects.create(user=user, email=user.email, verified=True, primary=True)
+        token = Token.objects.create(user=user)
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        client = Client(HTTP_HOST=host, HTTP_AUTHORIZATION=f"Token {token.key}")
+        supplier = Supplier.objects.create(name='Benchmark', telephone='benchmark-bulk')
+        numbers = itertools.count()
+        # basename, function returning a new object
+        objects = [
+            ('device', lambda: {'user': user.pk, 'brand': 'Benchmark', 'name': 'Benchmark',
+                                'serial_number': f"BENCH-BULK-{next(numbers)}", 'purchase_date': '2024-01-01'}),
+            ('supplier', lambda: {'name': 'Benchmark', 'telephone': f"bench-{next(numbers)}"}),
+            ('software', lambda: {'name': 'Benchmark', 'version': f"bulk-{next(numbers)}", 'supplier': supplier.pk,
+                                  'license_key': 'KEY', 'expire_date': '2100-01-01', 'max_installations': 10}),
+        ]
+        for basename, new_object in objects:
+            url = reverse(f"{basename}-list")
+            created = []
+
+            def write(method, data):
+                response = getattr(client, method)(url, data, content_type='application/json')
+                assert response.status_code < 300, f"{basename}: {method} {url} answered {response.status_code}"
+                return response.json()
+
+            def single():
+                for _ in range(batch):
+                    write('post', new_object())
+
+            def bulk_create():
+                response = write('post', [new_object() for _ in range(batch)])
+                created.append([item['id'] for item in response['results']])
+
+            def bulk_update():
+                ids = created[len(created) - 1] if created else []
+                write('patch', [{'id': pk, 'name': 'Benchmark updated'} for pk in ids])
+
+            results[basename] = {}
+            for name, function in [('single', single), ('bulk_create', bulk_create), ('bulk_update', bulk_update)]:
+                # The first batch warms up the caches and counts the queries.
+                queries = []
+                with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                    function()
+                timing = measure(function, batches)
+                results[basename][name] = dict(timing, rows_per_second=round(timing['per_second'] * batch, 1),
+                                               queries=len(queries))
+            results[basename]['speedup'] = round(
+                results[basename]['bulk_create']['rows_per_second'] / results[basename]['single']['rows_per_second'], 1
+            )
+        transaction.set_rollback(True)
+    token_cache.delete(token.key)
+    return results
+
+
+BENCHMARKS = {
+    'auth': bench_auth,
+    'bulk_writes': bench_bulk_writes,
+    'concurrency': bench_concurrency,
+    'connections': bench_connections,
+    'endpoints': bench_endpoints,
+    'metrics': bench_metrics,
+    'search': bench_search,
+    'visibility': bench_visibility,
+}
@@ -0,0 +1,406 @@
+import itertools
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import stats
+from .cache import bump_generation_on_commit
+from .signals import touch
+from .models import Device, Software
+
+# Outcomes of an item of a bulk operation
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+REJECTED = 'rejected'
+
+# Outcomes counted in the response of the bulk actions and of the bulk writes
+ACTION_OUTCOMES = (UPDATED, UNCHANGED, REJECTED)
+WRITE_OUTCOMES = (CREATED, UPDATED, REJECTED)
+
+
+def result(item_id, outcome, error=None, **values):
+    item = {'id': item_id, 'result': outcome, **values}
+    if error is not None:
+        item['error'] = error
+    return item
+
+
+def summarize(results, outcomes=ACTION_OUTCOMES):
+    """
+    Return the response of a bulk operation: the count of each outcome and the
+    results of the items, in the order they were given.
+    """
+    counts = Counter(item['result'] for item in results)
+    return {**{outcome: counts[outcome] for outcome in outcomes}, 'results': results}
+
+
+def update_values(model, field, values, **fields):
+    """
+    Set `field` of each row to its value in `values` ({pk: value}) and the other
+    `fields` of all of them to the same value, with one UPDATE. On PostgreSQL the
+    rows are joined to a VALUES list: `bulk_update` builds a CASE expression with
+    a branch per row, which costs more to build than the update itself.
+    """
+    if not values:
+        return
+    if connection.vendor != 'postgresql':
+        model.objects.bulk_update(
+            [model(pk=pk, **{field: value}, **fields) for pk, value in values.items()], [field, *fields]
+        )
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    assignments = ', '.join(
+        [f"{quote(model._meta.get_field(field).column)} = changes.value"] +
+        [f"{quote(model._meta.get_field(name).column)} = %s" for name in fields]
+    )
+    rows = ', '.join(['(%s, %s)'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {assignments} FROM (VALUES {rows}) AS changes (id, value) "
+            f"WHERE {table}.{quote(model._meta.pk.column)} = changes.id",
+            [*fields.values(), *itertools.chain.from_iterable(values.items())]
+        )
+
+
+def lock_devices(device_ids):
+    """
+    Lock the rows of the devices, in primary key order so concurrent bulk
+    operations can not deadlock, and return {id: (status, assigned_to_id)}.
+    """
+    devices = Device.objects.select_for_update().filter(pk__in=set(device_ids)).order_by('pk')
+    return {pk: (status, assigned_to_id) for pk, status, assigned_to_id in
+            devices.values_list('pk', 'status', 'assigned_to_id')}
+
+
+def update_devices(devices, changes, field, departments=None):
+    """
+    Write `field` of the changed devices, and their `updated_at`, with one UPDATE
+    and move them between the summary counters, which the UPDATE does not signal.
+    - devices: {id: (status, assigned_to_id)} before the change
+    - changes: {id: new value of `field`}, `status` or `assigned_to_id`
+    - departments: Department id of every assignee, before and after, read when
+      not given
+    """
+    if not changes:
+        return
+    update_values(Device, field, changes, updated_at=timezone.now())
+
+    if departments is None:
+        departments = stats.get_departments(assigned_to_id for _, assigned_to_id in devices.values())
+    deltas = Counter()
+    for pk, value in changes.items():
+        status, assigned_to_id = devices[pk]
+        deltas[(stats.DEVICES, stats.device_key(status, departments.get(assigned_to_id)))] -= 1
+        if field == 'status':
+            status = value
+        else:
+            assigned_to_id = value
+        deltas[(stats.DEVICES, stats.device_key(status, departments.get(assigned_to_id)))] += 1
+    stats.apply_deltas(deltas)
+    bump_generation_on_commit(Device)
+
+
+def assign_devices(assignments):
+    """
+    Assign devices to users in one transaction.
+    - assignments: (device id, user id) pairs
+    The users are validated with one query, the changed devices written with one
+    UPDATE. Returns the result of each assignment: updated, unchanged (already
+    assigned to the user) or rejected (unknown device or user, device listed more
+    than once).
+    """
+    with transaction.atomic():
+        devices = lock_devices(device_id for device_id, _ in assignments)
+        # The requested users and the current assignees, with their departments.
+        users = stats.get_departments([user_id for _, user_id in assignments] +
+                                      [assigned_to_id for _, assigned_to_id in devices.values()])
+        counts = Counter(device_id for device_id, _ in assignments)
+        results = []
+        changes = {}
+        for device_id, user_id in assignments:
+            if device_id not in devices:
+                results.append(result(device_id, REJECTED, 'Device does not exist.', user_id=user_id))
+            elif counts[device_id] > 1:
+                results.append(result(device_id, REJECTED, 'Device listed more than once.', user_id=user_id))
+            elif user_id not in users:
+                results.append(result(device_id, REJECTED, 'User does not exist.', user_id=user_id))
+            elif devices[device_id][1] == user_id:
+                results.append(result(device_id, UNCHANGED, user_id=user_id))
+            else:
+                results.append(result(device_id, UPDATED, user_id=user_id))
+                changes[device_id] = user_id
+        update_devices(devices, changes, 'assigned_to_id', departments=users)
+    return results
+
+
+def transition_devices(transitions):
+    """
+    Move devices to a new status in one transaction.
+    - transitions: (device id, status) pairs, the statuses already validated
+    The changed devices are written with one UPDATE. Returns the result of each
+    transition: updated, unchanged (already in the status) or rejected (unknown
+    device, device listed more than once).
+    """
+    with transaction.atomic():
+        devices = lock_devices(device_id for device_id, _ in transitions)
+        counts = Counter(device_id for device_id, _ in transitions)
+        results = []
+        changes = {}
+        for device_id, status in transitions:
+            if device_id not in devices:
+                results.append(result(device_id, REJECTED, 'Device does not exist.', status=status))
+            elif counts[device_id] > 1:
+                results.append(result(device_id, REJECTED, 'Device listed more than once.', status=status))
+            elif devices[device_id][0] == status:
+                results.append(result(device_id, UNCHANGED, status=status))
+            else:
+                results.append(result(device_id, UPDATED, status=status))
+                changes[device_id] = status
+        update_devices(devices, changes, 'status')
+    return results
+
+
+def installations_written(software_id, device_ids):
+    """
+    Bump `updated_at` of the devices whose installations changed and invalidate the
+    cached responses: the installations table was written without signals.
+    """
+    touch(Device.objects.filter(pk__in=device_ids))
+    bump_generation_on_commit(Device)
+    bump_generation_on_commit(Software)
+
+
+def install_software(software_id, device_ids):
+    """
+    Install a software on devices in one transaction.
+    The seats are claimed with one conditional UPDATE of installed_count, which
+    matches no row when fewer seats are left than new installations: concurrent
+    installs can not exceed max_installations, and the row of the software stays
+    locked only from that UPDATE to the commit. The installations are then
+    inserted with one INSERT.
+    Returns the result of each device: updated (installed), unchanged (already
+    installed) or rejected (unknown device, device listed more than once, not
+    enough seats left for the new installations).
+    """
+    through = Software.installed_on.through
+    counts = Counter(device_ids)
+
+    def claim(seats):
+        return bool(seats) and Software.objects.filter(
+            pk=software_id, installed_count__lte=F('max_installations') - seats
+        ).update(installed_count=F('installed_count') + seats, updated_at=timezone.now())
+
+    with transaction.atomic():
+        devices = set(Device.objects.filter(pk__in=counts).values_list('pk', flat=True))
+        installed = set(through.objects.filter(software_id=software_id, device_id__in=devices)
+                        .values_list('device_id', flat=True))
+        new = [device_id for device_id in counts
+               if device_id in devices and counts[device_id] == 1 and device_id not in installed]
+        claimed = claim(len(new))
+        if not claimed and new:
+            # The seats may have been taken by a concurrent install of the same devices,
+            # committed while the claim waited: those are already installed, and the
+            # others may fit in the seats left.
+            raced = set(through.objects.filter(software_id=software_id, device_id__in=new)
+                        .values_list('device_id', flat=True))
+            if raced:
+                installed |= raced
+                new = [device_id for device_id in new if device_id not in raced]
+                claimed = claim(len(new))
+        if claimed:
+            # Installed by a concurrent request between the read and the claim: the
+            # claim waited for it to commit, so it is visible now.
+            raced = set(through.objects.filter(software_id=software_id, device_id__in=new)
+                        .values_list('device_id', flat=True))
+            if raced:
+                installed |= raced
+                new = [device_id for device_id in new if device_id not in raced]
+                Software.objects.filter(pk=software_id).update(installed_count=F('installed_count') - len(raced))
+            through.objects.bulk_create(through(software_id=software_id, device_id=device_id) for device_id in new)
+            stats.installations_changed({software_id: len(new)}, counted=True)
+            installations_written(software_id, new)
+
+        results = []
+        for device_id in device_ids:
+            if device_id not in devices:
+                results.append(result(device_id, REJECTED, 'Device does not exist.'))
+            elif counts[device_id] > 1:
+                results.append(result(device_id, REJECTED, 'Device listed more than once.'))
+            elif device_id in installed:
+                results.append(result(device_id, UNCHANGED))
+            elif not claimed:
+                results.append(result(device_id, REJECTED, 'Maximum number of installations reached.'))
+            else:
+                results.append(result(device_id, UPDATED))
+    return results
+
+
+def uninstall_software(software_id, device_ids):
+    """
+    Remove a software from devices in one transaction, with one DELETE. The seats
+    are released with one UPDATE of installed_count, by the number of rows the
+    DELETE removed.
+    Returns the result of each device: updated (uninstalled), unchanged (not
+    installed) or rejected (unknown device, device listed more than once).
+    """
+    through = Software.installed_on.through
+    counts = Counter(device_ids)
+    with transaction.atomic():
+        devices = set(Device.objects.filter(pk__in=counts).values_list('pk', flat=True))
+        removed = [device_id for device_id in counts if device_id in devices and counts[device_id] == 1]
+        installed = set(through.objects.filter(software_id=software_id, device_id__in=removed)
+                        .values_list('device_id', flat=True))
+        if installed:
+            deleted, _ = through.objects.filter(software_id=software_id, device_id__in=installed).delete()
+            stats.installations_changed({software_id: -deleted})
+            touch(Software.objects.filter(pk=software_id))
+            installations_written(software_id, installed)
+
+        results = []
+        for device_id in device_ids:
+            if device_id not in devices:
+                results.append(result(device_id, REJECTED, 'Device does not exist.'))
+            elif counts[device_id] > 1:
+                results.append(result(device_id, REJECTED, 'Device listed more than once.'))
+            elif device_id in installed:
+                results.append(result(device_id, UPDATED))
+            else:
+                results.append(result(device_id, UNCHANGED))
+    return results
+
+
+def get_keys(items, fields):
+    return [tuple(item.get(name) for name in fields) for item in items]
+
+
+def match_keys(fields, keys):
+    """
+    Return the filter matching the rows with one of the given keys (tuples of the
+    values of `fields`).
+    """
+    if len(fields) == 1:
+        return Q(**{f"{fields[0]}__in": [key[0] for key in keys]})
+    lookup = Q(pk__in=[])
+    for key in keys:
+        lookup |= Q(**dict(zip(fields, key)))
+    return lookup
+
+
+def upsert(model, items, natural_key, partial=False, queryset=None):
+    """
+    Create or update rows from the validated data of the items of a bulk write, in
+    one transaction.
+    - natural_key: Fields identifying the existing row of an item, like
+      ('telephone',); items without a value for it are created
+    - partial: Partially update existing rows identified by the `id` of the items
+    - queryset: Rows the user can write (the queryset of the endpoint), every row by
+      default. The other rows are never updated: their items are rejected.
+    The existing rows are read, and locked, with one query and written with one
+    INSERT ... ON CONFLICT DO UPDATE (bulk_create with update_conflicts), the new
+    rows with another one. When the user can write every row and the natural key is
+    unique, the conflict target is the natural key, so a row created concurrently
+    with the same key is updated instead of failing; otherwise it is the primary key,
+    and a concurrent row with the same natural key rejects the whole write. Returns
+    the result of each item: created, updated or rejected (key listed more than once,
+    matching several rows, unknown id, row not writable by the user or natural key
+    already used by another row).
+    """
+    key_fields = ('id',) if partial else natural_key
+    keys = get_keys(items, key_fields)
+    counts = Counter(key for key in keys if None not in key)
+    unique = len(natural_key) == 1 and model._meta.get_field(natural_key[0]).unique
+    restricted = queryset is not None and queryset.query.has_filters()
+    with transaction.atomic():
+        rows = defaultdict(list)
+        if counts:
+            for row in model.objects.select_for_update().filter(match_keys(key_fields, counts)).order_by('pk'):
+                rows[tuple(getattr(row, name) for name in key_fields)].append(row)
+        # Matching rows hidden from the user are left alone, like a single write would.
+        hidden = set()
+        if restricted and rows:
+            matched = {row.pk for matches in rows.values() for row in matches}
+            hidden = matched - set(queryset.filter(pk__in=matched).order_by().values_list('pk', flat=True))
+        # A partial update can move a row to a natural key used by another row.
+        used, holders = Counter(), {}
+        if partial and unique:
+            [field] = natural_key
+            used = Counter(item[field] for item in items if field in item)
+            holders = dict(model.objects.filter(**{f"{field}__in": used}).values_list(field, 'pk'))
+
+        written = []
+        created, updated = [], []
+        fields = {'updated_at'}
+        for item, key in zip(items, keys):
+            values = {name: value for name, value in item.items() if name != 'id'}
+            matches = rows.get(key, ()) if None not in key else ()
+            if None not in key and counts[key] > 1:
+                written.append((None, f"{model._meta.verbose_name.capitalize()} listed more than once."))
+            elif len(matches) > 1:
+                written.append((None, f"Matches {len(matches)} {model._meta.verbose_name_plural}, "
+                                      f"update them by id."))
+            elif partial and (not matches or matches[0].pk in hidden):
+                written.append((None, f"{model._meta.verbose_name.capitalize()} does not exist."))
+            elif matches and matches[0].pk in hidden:
+                written.append((None, f"{', '.join(natural_key).replace('_', ' ').capitalize()} already used."))
+            elif partial and unique and natural_key[0] in values and (
+                    holders.get(values[natural_key[0]], key[0]) != key[0] or used[values[natural_key[0]]] > 1):
+                written.append((None, f"{natural_key[0].replace('_', ' ').capitalize()} already used."))
+            elif matches:
+                [instance] = matches
+                for name, value in values.items():
+                    setattr(instance, name, value)
+                fields.update(values)
+                updated.append(instance)
+                written.append((instance, UPDATED))
+            else:
+                instance = model(**values)
+                fields.update(values)
+                created.append(instance)
+                written.append((instance, CREATED))
+
+        # The bulk write sends no signals: do their work for all the rows at once.
+        if model is Software:
+            fields.update(renew_softwares(updated))
+        if created or updated:
+            conflict_fields = natural_key if unique and not partial and not restricted else ()
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(
+                        created + updated,
+                        update_conflicts=True,
+                        unique_fields=list(conflict_fields) or [model._meta.pk.name],
+                        update_fields=sorted(fields - set(conflict_fields)),
+                    )
+            except IntegrityError:
+                if not conflict_fields and unique and not partial:
+                    # A row with the natural key of a new item was created concurrently.
+                    error = f"{natural_key[0].replace('_', ' ').capitalize()} written concurrently, retry."
+                    return [result(None, REJECTED, outcome if instance is None else error)
+                            for instance, outcome in written]
+                raise
+            if model is Device:
+                stats.devices_saved(created, updated)
+            elif model is Software:
+                stats.softwares_saved(created, updated)
+            for instance in updated:
+                if hasattr(instance, 'remember_loaded_values'):
+                    instance.remember_loaded_values()
+            bump_generation_on_commit(model)
+    return [result(key[0] if partial else None, REJECTED, outcome) if instance is None
+            else result(instance.pk, outcome) for (instance, outcome), key in zip(written, keys)]
+
+
+def renew_softwares(updated):
+    """
+    List the renewed licenses (new expiry date) again in the expiry digests, like
+    the `software_renewing` signal does on save. Returns the fields to write.
+    """
+    renewed = [software for software in updated
+               if software.get_loaded_values().get('expire_date') != software.expire_date]
+    for software in renewed:
+        software.expiry_notified_on = None
+    return {'expiry_notified_on'} if renewed else set()
@@ -0,0 +1,159 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+GENERATION_KEY = 'accounts:generation:{label}'
+RESPONSE_KEY = 'accounts:response:{digest}'
+
+# Cache backends living in the process memory. Async code calls them directly:
+# they never block on I/O, and their async API would only add a hop to a thread.
+IN_PROCESS_CACHES = (LocMemCache, DummyCache)
+
+
+async def cache_call(cache, method, *args):
+    """
+    Call a cache method from async code, through the async API of the backend
+    unless it lives in the process memory.
+    """
+    if isinstance(cache, IN_PROCESS_CACHES):
+        return getattr(cache, method)(*args)
+    return await getattr(cache, f"a{method}")(*args)
+
+
+def get_generations(models):
+    """
+    Return the current generation counter of each model.
+    A missing counter (never bumped or evicted) is created from the current time in
+    milliseconds, so it never goes back to a value used by older cache entries.
+    """
+    shared = caches[settings.RESPONSE_CACHE_SHARED_ALIAS]
+    keys = [GENERATION_KEY.format(label=model._meta.label_lower) for model in models]
+    generations = shared.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            shared.add(key, int(time.time() * 1000), None)
+            generations[key] = shared.get(key)
+    return [generations[key] for key in keys]
+
+
+async def aget_generations(models):
+    """
+    Async version of `get_generations`.
+    """
+    shared = caches[settings.RESPONSE_CACHE_SHARED_ALIAS]
+    keys = [GENERATION_KEY.format(label=model._meta.label_lower) for model in models]
+    generations = await cache_call(shared, 'get_many', keys)
+    for key in keys:
+        if key not in generations:
+            await cache_call(shared, 'add', key, int(time.time() * 1000), None)
+            generations[key] = await cache_call(shared, 'get', key)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(model):
+    """
+    Increment the generation counter of a model, which invalidates every cached
+    response that depends on it.
+    """
+    shared = caches[settings.RESPONSE_CACHE_SHARED_ALIAS]
+    key = GENERATION_KEY.format(label=model._meta.label_lower)
+    try:
+        shared.incr(key)
+    except ValueError:
+        shared.add(key, int(time.time() * 1000), None)
+
+
+def bump_generation_on_commit(model):
+    """
+    Bump the generation counter of a model once the current transaction commits, so
+    a concurrent request can not cache the old data under the new generation.
+    """
+    transaction.on_commit(lambda: bump_generation(model))
+
+
+class ResponseCache:
+    """
+    Two tier cache of serialized responses.
+    - local: Per-process LocMemCache, evicting the least recently used entries
+    - shared: Cache shared by every worker (Redis in production)
+    Entries are looked up in the local tier first; shared hits are copied to the
+    local tier. Hit and miss counters are kept per process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @property
+    def local(self):
+        return caches[settings.RESPONSE_CACHE_LOCAL_ALIAS]
+
+    @property
+    def shared(self):
+        return caches[settings.RESPONSE_CACHE_SHARED_ALIAS]
+
+    def make_key(self, *parts):
+        digest = hashlib.md5(':'.join(str(part) for part in parts).encode(), usedforsecurity=False)
+        return RESPONSE_KEY.format(digest=digest.hexdigest())
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        value = self.shared.get(key)
+        if value is not None:
+            self._count('shared_hits')
+            self.local.set(key, value, settings.RESPONSE_CACHE_TIMEOUT)
+            return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value, settings.RESPONSE_CACHE_TIMEOUT)
+        self.shared.set(key, value, settings.RESPONSE_CACHE_TIMEOUT)
+
+    async def aget(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        value = await cache_call(self.shared, 'get', key)
+        if value is not None:
+            self._count('shared_hits')
+            self.local.set(key, value, settings.RESPONSE_CACHE_TIMEOUT)
+            return value
+        self._count('misses')
+        return None
+
+    async def aset(self, key, value):
+        self.local.set(key, value, settings.RESPONSE_CACHE_TIMEOUT)
+        await cache_call(self.shared, 'set', key, value, settings.RESPONSE_CACHE_TIMEOUT)
+
+    def stats(self):
+        """
+        Return the hit/miss counters of this process and the hit ratio.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        stats['hit_ratio'] = round((stats['local_hits'] + stats['shared_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+response_cache = ResponseCache()
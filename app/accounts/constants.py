@@ -12,6 +12,8 @@ INACTIVE = 'INACTIVE'
 PENDING = 'PENDING'
 IN_PROGRESS = 'IN_PROGRESS'
 COMPLETED = 'COMPLETED'
+# Interventions not completed yet
+OPEN_MAINTENANCE_STATUSES = (PENDING, IN_PROGRESS)
 
 
 GENDER_CHOICES = (
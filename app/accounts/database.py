@@ -0,0 +1,49 @@
+import os
+
+from django.db import connections
+
+
+def get_connection_metrics():
+    """
+    Return the metrics of the database connections of this worker process, by alias.
+    Pooled aliases report the pool state and the counters accumulated since the pool
+    was opened:
+    - saturation: Share of the pool connections in use (1.0: requests are waiting)
+    - waiting: Requests waiting for a connection right now
+    - wait_ms_total / wait_ms_mean: Time spent waiting for a connection
+    - timeouts: Requests that gave up after DB_POOL_TIMEOUT seconds
+    """
+    metrics = {}
+    for alias in connections:
+        connection = connections[alias]
+        pool = getattr(connection, 'pool', None)
+        if pool is None:
+            metrics[alias] = {
+                'pooled': False,
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            }
+            continue
+
+        stats = pool.get_stats()
+        size, available = stats.get('pool_size', 0), stats.get('pool_available', 0)
+        requests = stats.get('requests_num', 0)
+        wait_ms = stats.get('requests_wait_ms', 0)
+        metrics[alias] = {
+            'pooled': True,
+            'min_size': stats.get('pool_min', pool.min_size),
+            'max_size': stats.get('pool_max', pool.max_size),
+            'size': size,
+            'available': available,
+            'in_use': size - available,
+            'saturation': round((size - available) / pool.max_size, 4),
+            'waiting': stats.get('requests_waiting', 0),
+            'requests': requests,
+            'wait_ms_total': wait_ms,
+            'wait_ms_mean': round(wait_ms / requests, 3) if requests else 0.0,
+            'timeouts': stats.get('requests_errors', 0),
+            'connections_opened': stats.get('connections_num', 0),
+            'connection_errors': stats.get('connections_errors', 0),
+            'connections_lost': stats.get('connections_lost', 0),
+        }
+    return {'pid': os.getpid(), 'databases': metrics}
@@ -0,0 +1,246 @@
+import datetime
+import random
+import uuid
+import zlib
+
+from allauth.account.models import EmailAddress
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.utils import timezone
+
+from . import stats
+from .cache import bump_generation
+from .constants import (
+    MAN, WOMAN, NONE,
+    ACTIVE, ON_MAINTENANCE, INACTIVE,
+    PENDING, IN_PROGRESS, COMPLETED
+)
+from .models import Department, User, MaintenanceIntervention, Device, Supplier, Software, Installation
+
+# Rows generated by default, see `generate`.
+DEFAULT_SCALE = {
+    'departments': 20,
+    'users': 1000,
+    'suppliers': 50,
+    'softwares': 500,
+    'devices': 10000,
+    'interventions_per_device': 2,
+    'installations_per_device': 3,
+}
+
+DEPARTMENTS = ['IT', 'HR', 'Finance', 'Sales', 'Marketing', 'Legal', 'Operations', 'Support', 'R&D', 'Logistics']
+FIRST_NAMES = ['Marco', 'Giulia', 'Luca', 'Sara', 'Andrea', 'Chiara', 'Matteo', 'Elena', 'Paolo', 'Francesca',
+               'Davide', 'Martina', 'Simone', 'Alessia', 'Giorgio', 'Valentina', 'Stefano', 'Laura']
+LAST_NAMES = ['Rossi', 'Russo', 'Ferrari', 'Esposito', 'Bianchi', 'Romano', 'Colombo', 'Ricci', 'Marino',
+              'Greco', 'Bruno', 'Gallo', 'Conti', 'De Luca', 'Mancini', 'Costa', 'Giordano', 'Rizzo']
+BRANDS = {
+    'Dell': ['Latitude 5440', 'OptiPlex 7010', 'Precision 3580', 'XPS 13'],
+    'HP': ['EliteBook 840', 'ProBook 450', 'EliteDesk 800', 'ZBook Firefly'],
+    'Lenovo': ['ThinkPad T14', 'ThinkPad X1 Carbon', 'ThinkCentre M70q', 'ThinkPad E16'],
+    'Apple': ['MacBook Air M2', 'MacBook Pro 14', 'iMac 24', 'Mac mini'],
+    'Microsoft': ['Surface Laptop 5', 'Surface Pro 9'],
+    'Samsung': ['Galaxy Tab S9', 'Galaxy S23'],
+}
+SUPPLIERS = ['Microsoft', 'Adobe', 'Oracle', 'Atlassian', 'JetBrains', 'Autodesk', 'SAP', 'Zoom', 'Slack', 'Kaspersky']
+SOFTWARES = ['Office', 'Acrobat Pro', 'Photoshop', 'IntelliJ IDEA', 'PyCharm', 'AutoCAD', 'Jira', 'Confluence',
+             'Zoom Workplace', 'Endpoint Security', 'Visual Studio', 'SQL Developer', 'Teams Premium']
+INTERVENTIONS = ['Battery replacement', 'Disk failure', 'Screen replacement', 'Operating system reinstall',
+                 'Keyboard replacement', 'Firmware update', 'Malware cleanup', 'Periodic check']
+MAX_INSTALLATIONS = [5, 10, 25, 50, 100, 250, 1000]
+
+# (value, weight)
+DEVICE_STATUSES = [(ACTIVE, 80), (INACTIVE, 15), (ON_MAINTENANCE, 5)]
+INTERVENTION_STATUSES = [(COMPLETED, 85), (IN_PROGRESS, 10), (PENDING, 5)]
+STAFF_SHARE = 0.05
+UNASSIGNED_SHARE = 0.15
+
+
+class RowWriter:
+    """
+    Insert rows, given as tuples of column values, with COPY on PostgreSQL with
+    psycopg 3 (`use_copy`) or with `bulk_create` in batches of `batch_size` rows.
+    """
+
+    def __init__(self, use_copy=None, batch_size=5000):
+        if use_copy is None:
+            use_copy = connection.vendor == 'postgresql' and is_psycopg3
+        self.use_copy = use_copy
+        self.batch_size = batch_size
+
+    def reserve_ids(self, model, count):
+        """
+        Take `count` values from the primary key sequence of the model.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                [model._meta.db_table, model._meta.pk.column, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def insert(self, model, fields, rows, returning=False):
+        """
+        Insert the rows into the table of the model. `fields` are the attribute
+        names of the values (`department_id` for foreign keys). Returns the primary
+        keys of the rows, in order, when `returning`.
+        """
+        if not rows:
+            return []
+        if not self.use_copy:
+            objs = model.objects.bulk_create(
+                [model(**dict(zip(fields, row))) for row in rows], batch_size=self.batch_size
+            )
+            return [obj.pk for obj in objs] if returning else None
+
+        if returning:
+            ids = self.reserve_ids(model, len(rows))
+            fields = [model._meta.pk.attname, *fields]
+            rows = [(pk, *row) for pk, row in zip(ids, rows)]
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+        with connection.cursor() as cursor:
+            with cursor.cursor.copy(f"COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+        return ids if returning else None
+
+
+def choose(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def generate(scale=None, seed=0, prefix='synthetic', password='synthetic-password', batch_size=5000,
+             use_copy=None, log=None):
+    """
+    Generate a synthetic inventory and return the number of rows created by table.
+    - scale: Rows to generate, updating DEFAULT_SCALE. Devices get on average the
+      given number of interventions and installations (never beyond the
+      `max_installations` of the software).
+    - seed: Seed of the random generator, the same seed and prefix give the same data
+    - prefix: Prefix of the usernames (and part of the unique values), so several
+      datasets can coexist. Every user gets `password` and a verified email, so
+      the dataset can be used to log in and call the API.
+    Devices and their interventions and installations are written in transactions
+    of `batch_size` devices. The writes bypass the signals: the installed_count of
+    the software and the dashboard counters are rebuilt and the cached responses
+    invalidated at the end.
+    """
+    scale = {**DEFAULT_SCALE, **(scale or {})}
+    if User.objects.filter(username__startswith=f"{prefix}-").exists():
+        raise ValueError(f"A dataset with the prefix '{prefix}' already exists.")
+    rng = random.Random(f"{prefix}:{seed}")
+    writer = RowWriter(use_copy=use_copy, batch_size=batch_size)
+    log = log or (lambda message: None)
+    now = timezone.now()
+    today = timezone.localdate()
+    # Digits unique to the prefix, for the unique telephone numbers.
+    tag = f"{zlib.crc32(prefix.encode()) % 100000:05d}"
+    counts = {}
+
+    def random_date(days_ago_min, days_ago_max):
+        return today - datetime.timedelta(days=rng.randint(days_ago_min, days_ago_max))
+
+    def random_uuid():
+        return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+    with transaction.atomic():
+        department_ids = writer.insert(Department, ['name', 'updated_at'], [
+            (f"{DEPARTMENTS[index % len(DEPARTMENTS)]} {prefix} {index}", now)
+            for index in range(scale['departments'])
+        ], returning=True)
+
+        supplier_ids = writer.insert(Supplier, ['name', 'telephone', 'updated_at'], [
+            (rng.choice(SUPPLIERS), f"{tag}{index:010d}", now) for index in range(scale['suppliers'])
+        ], returning=True)
+
+        password_hash = make_password(password)
+        user_rows = []
+        for index in range(scale['users']):
+            username = f"{prefix}-user-{index}"
+            is_staff = index < max(1, int(scale['users'] * STAFF_SHARE))
+            user_rows.append((
+                password_hash, None, False, username, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                f"{username}@example.com", is_staff, True, now, rng.choice((MAN, WOMAN, NONE)), None,
+                rng.choice(department_ids) if department_ids else None,
+            ))
+        user_ids = writer.insert(User, [
+            'password', 'last_login', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff',
+            'is_active', 'date_joined', 'gender', 'telephone', 'department_id',
+        ], user_rows, returning=True)
+        writer.insert(EmailAddress, ['user_id', 'email', 'verified', 'primary'], [
+            (user_id, row[6], True, True) for user_id, row in zip(user_ids, user_rows)
+        ])
+        staff_ids = [user_id for user_id, row in zip(user_ids, user_rows) if row[7]]
+
+        software_rows = [
+            (rng.choice(supplier_ids), rng.choice(SOFTWARES), f"{rng.randint(1, 30)}.{rng.randint(0, 9)}",
+             f"{rng.getrandbits(64):016X}", random_date(-3 * 365, 365), rng.choice(MAX_INSTALLATIONS), 0, None, now)
+            for _ in range(scale['softwares'] if supplier_ids else 0)
+        ]
+        software_ids = writer.insert(Software, [
+            'supplier_id', 'name', 'version', 'license_key', 'expire_date', 'max_installations',
+            'installed_count', 'expiry_notified_on', 'updated_at',
+        ], software_rows, returning=True)
+    counts.update(departments=len(department_ids), suppliers=len(supplier_ids), users=len(user_ids),
+                  softwares=len(software_ids), devices=0, interventions=0, installations=0)
+    log(f"Created {len(department_ids)} departments, {len(supplier_ids)} suppliers, {len(user_ids)} users "
+        f"and {len(software_ids)} softwares")
+
+    # Installations left for each software.
+    capacity = [row[5] for row in software_rows]
+    available = list(range(len(software_ids)))
+    for start in range(0, scale['devices'] if staff_ids else 0, batch_size):
+        size = min(batch_size, scale['devices'] - start)
+        with transaction.atomic():
+            device_rows = []
+            for _ in range(size):
+                brand = rng.choice(list(BRANDS))
+                device_rows.append((
+                    rng.choice(staff_ids), random_uuid(), brand, rng.choice(BRANDS[brand]),
+                    f"{brand[:2].upper()}{rng.getrandbits(40):010X}", choose(rng, DEVICE_STATUSES),
+                    random_date(0, 6 * 365), None if rng.random() < UNASSIGNED_SHARE else rng.choice(user_ids), now,
+                ))
+            device_ids = writer.insert(Device, [
+                'user_id', 'device_id', 'brand', 'name', 'serial_number', 'status', 'purchase_date',
+                'assigned_to_id', 'updated_at',
+            ], device_rows, returning=True)
+
+            intervention_rows = []
+            installation_rows = []
+            for device_id, device_row in zip(device_ids, device_rows):
+                for _ in range(rng.randint(0, 2 * scale['interventions_per_device'])):
+                    status = choose(rng, INTERVENTION_STATUSES)
+                    intervention_rows.append((
+                        device_id, rng.choice(INTERVENTIONS),
+                        random_date(0, 30) if status != COMPLETED else random_date(30, 3 * 365),
+                        rng.choice(staff_ids), status, now,
+                    ))
+                installed = set()
+                for _ in range(rng.randint(0, 2 * scale['installations_per_device'])):
+                    if not available:
+                        break
+                    position = rng.randrange(len(available))
+                    index = available[position]
+                    if index in installed:
+                        continue
+                    installed.add(index)
+                    installation_rows.append((software_ids[index], device_id, now))
+                    capacity[index] -= 1
+                    if not capacity[index]:
+                        available[position] = available[-1]
+                        available.pop()
+            writer.insert(MaintenanceIntervention, [
+                'device_id', 'description', 'date_intervention', 'technician_id', 'status', 'updated_at',
+            ], intervention_rows)
+            writer.insert(Installation, ['software_id', 'device_id', 'installed_at'], installation_rows)
+        counts['devices'] += len(device_ids)
+        counts['interventions'] += len(intervention_rows)
+        counts['installations'] += len(installation_rows)
+        log(f"Created {counts['devices']}/{scale['devices']} devices")
+
+    stats.rebuild()
+    for model in (Department, User, Supplier, Software, Device, MaintenanceIntervention):
+        bump_generation(model)
+    return counts
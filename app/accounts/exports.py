@@ -0,0 +1,216 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+
+from .models import (
+    MaintenanceIntervention,
+    Device,
+    Software
+)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """
+    File-like object that returns what is written, used to stream csv rows.
+    """
+
+    def write(self, value):
+        return value
+
+
+class InventoryExport:
+    """
+    Base class for the streaming inventory exports.
+    Rows are read with a server-side cursor (`QuerySet.iterator`, or `aiterator` when
+    served under ASGI) and written in batches of `chunk_size` rows, so the memory used
+    does not depend on the number of exported rows.
+    - name: Name of the export, used as file name
+    - fields: Column names, in output order
+    """
+    name = None
+    fields = []
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+
+    def get_queryset(self, queryset):
+        """
+        Add the joins needed by `get_row` to the queryset.
+        """
+        return queryset
+
+    def get_row(self, instance):
+        """
+        Return the exported values of an instance, keyed by field name.
+        """
+        raise NotImplementedError
+
+    def rows(self, queryset):
+        for instance in self.get_queryset(queryset).iterator(chunk_size=self.chunk_size):
+            yield self.get_row(instance)
+
+    async def arows(self, queryset):
+        async for instance in self.get_queryset(queryset).aiterator(chunk_size=self.chunk_size):
+            yield self.get_row(instance)
+
+    def get_encoder(self, export_format):
+        """
+        Return the header of the export (None without one) and the function encoding a row.
+        """
+        if export_format == 'csv':
+            writer = csv.DictWriter(Echo(), fieldnames=self.fields)
+            return writer.writeheader(), writer.writerow
+
+        def encode(row):
+            return json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+        return None, encode
+
+    def stream(self, queryset, export_format):
+        """
+        Yield the export of the queryset, in chunks of encoded text.
+        """
+        header, encode = self.get_encoder(export_format)
+        if header is not None:
+            yield header
+        batch = []
+        for row in self.rows(queryset):
+            batch.append(encode(row))
+            if len(batch) >= self.chunk_size:
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
+
+    async def astream(self, queryset, export_format):
+        """
+        Async version of `stream`. Under ASGI a StreamingHttpResponse consumes a sync
+        iterator whole before sending anything, an async one chunk by chunk.
+        """
+        header, encode = self.get_encoder(export_format)
+        if header is not None:
+            yield header
+        batch = []
+        async for row in self.arows(queryset):
+            batch.append(encode(row))
+            if len(batch) >= self.chunk_size:
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
+
+    def write(self, queryset, export_format, output):
+        """
+        Write the export of the queryset to a file-like object.
+        """
+        for chunk in self.stream(queryset, export_format):
+            output.write(chunk)
+
+    def streaming_response(self, queryset, export_format, asynchronous=False):
+        """
+        Return the response streaming the export, from an async iterator when the
+        response is served by the ASGI handler (`asynchronous`).
+        """
+        stream = self.astream if asynchronous else self.stream
+        response = StreamingHttpResponse(
+            stream(queryset, export_format),
+            content_type=EXPORT_FORMATS[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.name}.{export_format}"'
+        return response
+
+
+class DeviceExport(InventoryExport):
+    name = 'devices'
+    fields = [
+        'id', 'device_id', 'brand', 'name', 'serial_number', 'status', 'purchase_date',
+        'owner', 'assigned_to', 'assigned_to_email', 'department', 'softwares'
+    ]
+
+    def get_queryset(self, queryset):
+        return queryset.select_related('user', 'assigned_to__department').prefetch_related(
+            Prefetch('softwares', queryset=Software.objects.only('id', 'name', 'version'))
+        )
+
+    def get_row(self, device):
+        assigned_to = device.assigned_to
+        department = assigned_to.department if assigned_to else None
+        return {
+            'id': device.id,
+            'device_id': device.device_id,
+            'brand': device.brand,
+            'name': device.name,
+            'serial_number': device.serial_number,
+            'status': device.status,
+            'purchase_date': device.purchase_date,
+            'owner': device.user.username,
+            'assigned_to': assigned_to.username if assigned_to else None,
+            'assigned_to_email': assigned_to.email if assigned_to else None,
+            'department': department.name if department else None,
+            'softwares': ';'.join(f"{software.name} {software.version}" for software in device.softwares.all()),
+        }
+
+
+class SoftwareExport(InventoryExport):
+    name = 'softwares'
+    fields = [
+        'id', 'name', 'version', 'supplier', 'supplier_telephone', 'license_key',
+        'expire_date', 'max_installations', 'installations'
+    ]
+
+    def get_queryset(self, queryset):
+        return queryset.select_related('supplier')
+
+    def get_row(self, software):
+        return {
+            'id': software.id,
+            'name': software.name,
+            'version': software.version,
+            'supplier': software.supplier.name,
+            'supplier_telephone': software.supplier.telephone,
+            'license_key': software.license_key,
+            'expire_date': software.expire_date,
+            'max_installations': software.max_installations,
+            'installations': software.installed_count,
+        }
+
+
+class MaintenanceInterventionExport(InventoryExport):
+    name = 'maintenance-interventions'
+    fields = [
+        'id', 'device', 'device_serial_number', 'device_name', 'description',
+        'date_intervention', 'status', 'technician', 'department'
+    ]
+
+    def get_queryset(self, queryset):
+        return queryset.select_related('device__assigned_to__department', 'technician')
+
+    def get_row(self, intervention):
+        device = intervention.device
+        department = device.assigned_to.department if device.assigned_to else None
+        return {
+            'id': intervention.id,
+            'device': device.id,
+            'device_serial_number': device.serial_number,
+            'device_name': device.name,
+            'description': intervention.description,
+            'date_intervention': intervention.date_intervention,
+            'status': intervention.status,
+            'technician': intervention.technician.username if intervention.technician else None,
+            'department': department.name if department else None,
+        }
+
+
+EXPORTS = {
+    DeviceExport.name: (Device, DeviceExport),
+    SoftwareExport.name: (Software, SoftwareExport),
+    MaintenanceInterventionExport.name: (MaintenanceIntervention, MaintenanceInterventionExport),
+}
@@ -0,0 +1,120 @@
+import django_filters
+
+from .constants import (STATUS_DEVICE_CHOICES, STATUS_MAINTENANCE_CHOICES,
+                        OPEN_MAINTENANCE_STATUSES, COMPLETED)
+from .models import (
+    User,
+    MaintenanceIntervention,
+    Device,
+    Supplier,
+    Software,
+    Installation
+)
+
+# Every filter declared here is backed by an index of the filtered model, see the
+# `indexes` of the model Meta classes. Related objects are filtered by primary key
+# (NumberFilter) rather than ModelChoiceFilter, which would query the related table
+# to validate the value.
+
+
+class DeviceFilterSet(django_filters.FilterSet):
+    """
+    Filters for devices:
+    - status: Exact status, or several comma separated ones with status__in
+    - brand: Exact brand
+    - user, assigned_to: Owner and assignee ids
+    - department: Department of the assignee
+    - purchase_date_after, purchase_date_before: Purchase date range (inclusive)
+    """
+    status = django_filters.ChoiceFilter(choices=STATUS_DEVICE_CHOICES)
+    status__in = django_filters.BaseInFilter(field_name='status')
+    brand = django_filters.CharFilter()
+    user = django_filters.NumberFilter()
+    assigned_to = django_filters.NumberFilter()
+    department = django_filters.NumberFilter(field_name='assigned_to__department')
+    purchase_date = django_filters.DateFromToRangeFilter()
+
+    class Meta:
+        model = Device
+        fields = ['status', 'status__in', 'brand', 'user', 'assigned_to', 'department', 'purchase_date']
+
+
+class MaintenanceInterventionFilterSet(django_filters.FilterSet):
+    """
+    Filters for maintenance interventions:
+    - status: Exact status, or several comma separated ones with status__in
+    - open: Interventions not completed yet
+    - device, technician: Device and technician ids
+    - date_intervention_after, date_intervention_before: Intervention date range (inclusive)
+    """
+    status = django_filters.ChoiceFilter(choices=STATUS_MAINTENANCE_CHOICES)
+    status__in = django_filters.BaseInFilter(field_name='status')
+    open = django_filters.BooleanFilter(method='filter_open')
+    device = django_filters.NumberFilter()
+    technician = django_filters.NumberFilter()
+    date_intervention = django_filters.DateFromToRangeFilter()
+
+    class Meta:
+        model = MaintenanceIntervention
+        fields = ['status', 'status__in', 'open', 'device', 'technician', 'date_intervention']
+
+    def filter_open(self, queryset, name, value):
+        if value:
+            return queryset.filter(status__in=OPEN_MAINTENANCE_STATUSES)
+        return queryset.filter(status=COMPLETED)
+
+
+class SoftwareFilterSet(django_filters.FilterSet):
+    """
+    Filters for software:
+    - name: Exact name
+    - supplier: Supplier id
+    - expire_date_after, expire_date_before: License expiry range (inclusive)
+    """
+    name = django_filters.CharFilter()
+    supplier = django_filters.NumberFilter()
+    expire_date = django_filters.DateFromToRangeFilter()
+
+    class Meta:
+        model = Software
+        fields = ['name', 'supplier', 'expire_date']
+
+
+class InstallationFilterSet(django_filters.FilterSet):
+    """
+    Filters for the installations of a software:
+    - installed_at_after, installed_at_before: Installation time range (inclusive)
+    - device_status: Exact status of the device, read through its primary key
+    """
+    installed_at = django_filters.DateTimeFromToRangeFilter()
+    device_status = django_filters.ChoiceFilter(field_name='device__status', choices=STATUS_DEVICE_CHOICES)
+
+    class Meta:
+        model = Installation
+        fields = ['installed_at', 'device_status']
+
+
+class SupplierFilterSet(django_filters.FilterSet):
+    """
+    Filters for suppliers:
+    - name: Exact name
+    - telephone: Exact telephone
+    """
+    name = django_filters.CharFilter()
+    telephone = django_filters.CharFilter()
+
+    class Meta:
+        model = Supplier
+        fields = ['name', 'telephone']
+
+
+class UserFilterSet(django_filters.FilterSet):
+    """
+    Filters for users:
+    - department: Department id
+    """
+    department = django_filters.NumberFilter()
+
+    class Meta:
+        model = User
+        fields = ['department']
@@ -0,0 +1,211 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import traceback
+
+from django.db import connections
+
+# Queue items asking the writer to flush its handlers or to stop.
+FLUSH = 'flush'
+STOP = 'stop'
+
+
+class LogWriter:
+    """
+    Thread of the process emitting the log records through their handlers, so the
+    threads that log never wait on a stream, a file or the database.
+    - Records are handed over through a queue of `max_size` records. When the queue
+      is full, records are dropped (and counted) instead of blocking the caller.
+    - Handlers are flushed whenever the writer has been idle for `flush_interval`
+      seconds, and when it stops.
+    - Record messages are formatted by the writer: log the values with %-style
+      arguments, never with f-strings.
+    Started on the first record of each process, so forked workers (Celery prefork)
+    get their own thread.
+    """
+
+    def __init__(self, max_size=10000, flush_interval=1.0):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def put(self, handlers, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait((handlers, record))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def flush(self, timeout=None):
+        """
+        Wait until the queued records are emitted and the handlers flushed.
+        """
+        if self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put((FLUSH, done))
+        done.wait(timeout)
+
+    def stop(self):
+        """
+        Emit the queued records, flush the handlers and stop the thread.
+        """
+        if self._pid != os.getpid():
+            return
+        self._queue.put((STOP, None))
+        self._thread.join()
+        self._pid = None
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.max_size)
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name='log-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self, records):
+        handlers_seen = set()
+        while True:
+            try:
+                handlers, record = records.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush(handlers_seen)
+                continue
+            if handlers == FLUSH:
+                self._flush(handlers_seen)
+                record.set()
+                continue
+            if handlers == STOP:
+                self._flush(handlers_seen)
+                return
+            handlers_seen.update(handlers)
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def _flush(self, handlers):
+        for handler in handlers:
+            handler.flush()
+
+
+log_writer = LogWriter()
+
+
+class QueueHandler(logging.Handler):
+    """
+    Handler passing the records to the log writer, which emits them through
+    `handlers` on its own thread.
+    """
+
+    def __init__(self, handlers, writer=log_writer):
+        super().__init__()
+        self.handlers = tuple(handlers)
+        self.writer = writer
+
+    def emit(self, record):
+        self.writer.put(self.handlers, record)
+
+
+def install_log_writer(logger_names, max_size=10000, flush_interval=1.0):
+    """
+    Move the handlers of the given loggers ('' for the root logger) behind the log
+    writer of the process.
+    """
+    log_writer.max_size = max_size
+    log_writer.flush_interval = flush_interval
+    for name in logger_names:
+        logger = logging.getLogger(name or None)
+        if not logger.handlers or any(isinstance(handler, QueueHandler) for handler in logger.handlers):
+            continue
+        logger.handlers = [QueueHandler(logger.handlers)]
+    atexit.register(log_writer.stop)
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format a record as a JSON object on one line, including the fields of the audit
+    event it carries (see accounts.audit).
+    """
+
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec='milliseconds'
+            ),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'audit', None) or {})
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class AuditTableHandler(logging.Handler):
+    """
+    Store the audit events in the AuditEvent table, with one bulk_create per
+    `batch_size` events. Pending events are inserted when the handler is flushed,
+    which the log writer does when it is idle, so an event is stored within about
+    LOG_WRITER_FLUSH_INTERVAL seconds.
+    The database connection is given back after each batch.
+    """
+
+    def __init__(self, batch_size=100, using='default'):
+        super().__init__()
+        self.batch_size = batch_size
+        self.using = using
+        self.buffer = []
+
+    def emit(self, record):
+        event = getattr(record, 'audit', None)
+        if event is None:
+            return
+        from .models import AuditEvent
+
+        actor, target = event.get('actor') or {}, event.get('object') or {}
+        self.buffer.append(AuditEvent(
+            timestamp=datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc),
+            action=event['action'],
+            outcome=event['outcome'],
+            actor_id=actor.get('id'),
+            actor_username=actor.get('username', ''),
+            object_type=target.get('type', ''),
+            object_id='' if target.get('id') is None else str(target['id']),
+            object_repr=target.get('repr', ''),
+            latency_ms=event.get('latency_ms'),
+            details=event.get('details') or {},
+        ))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            events, self.buffer = self.buffer, []
+            if not events:
+                return
+            from .models import AuditEvent
+
+            connection = connections[self.using]
+            try:
+                AuditEvent.objects.using(self.using).bulk_create(events)
+            except Exception:
+                if logging.raiseExceptions:
+                    sys.stderr.write(f"--- Audit table: {len(events)} events lost ---\n")
+                    traceback.print_exc(file=sys.stderr)
+            finally:
+                if not connection.in_atomic_block:
+                    connection.close()
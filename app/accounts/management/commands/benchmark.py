@@ -0,0 +1,112 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from accounts.benchmarks import BENCHMARKS
+from accounts.models import Department, User, MaintenanceIntervention, Device, Supplier, Software
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_timings(results, path=()):
+    """
+    Yield (scenario path, timing summary) for every timing summary of the results.
+    """
+    for name, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        if 'p50_us' in value or 'p50_ms' in value:
+            yield '.'.join(path + (name,)), value
+        else:
+            yield from get_timings(value, path + (name,))
+
+
+def compare(results, baseline, threshold):
+    """
+    Return the scenarios of the results that regressed against the baseline: p95
+    latency more than `threshold` (a fraction) above the baseline, or more queries.
+    """
+    baseline = dict(get_timings(baseline))
+    regressions = {}
+    for scenario, timing in get_timings(results):
+        before = baseline.get(scenario)
+        if before is None:
+            continue
+        unit = 'p95_us' if 'p95_us' in timing else 'p95_ms'
+        ratio = timing[unit] / before[unit] if before.get(unit) else 1.0
+        more_queries = timing.get('queries', 0) > before.get('queries', timing.get('queries', 0))
+        if ratio > 1 + threshold or more_queries:
+            regressions[scenario] = {
+                unit: [before[unit], timing[unit]],
+                'ratio': round(ratio, 2),
+                'queries': [before.get('queries'), timing.get('queries')],
+            }
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Run the accounts micro benchmarks and print the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*',
+                            help=f"Benchmarks to run: {', '.join(sorted(BENCHMARKS))} (default: all).")
+        parser.add_argument('--iterations', type=int, default=1000,
+                            help='Iterations per scenario.')
+        parser.add_argument('--output',
+                            help='Also write the results, with the commit and the size of the data, to this file.')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='Results file (--output) of a previous run to compare with, failing on regressions.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='p95 latency increase over the baseline considered a regression (default: 0.2).')
+
+    def handle(self, *args, **options):
+        names = options['benchmarks'] or sorted(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)['results']
+
+        results = {
+            name: BENCHMARKS[name](iterations=options['iterations'])
+            for name in names
+        }
+        self.stdout.write(json.dumps(results, indent=2))
+
+        if options['output']:
+            document = {
+                'meta': {
+                    'commit': get_commit(),
+                    'date': timezone.now().isoformat(),
+                    'iterations': options['iterations'],
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'rows': {
+                        model._meta.model_name: model.objects.count()
+                        for model in (Department, User, MaintenanceIntervention, Device, Supplier, Software)
+                    },
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(document, output, indent=2)
+
+        if baseline is not None:
+            regressions = compare(results, baseline, options['threshold'])
+            if regressions:
+                self.stderr.write(json.dumps(regressions, indent=2))
+                raise CommandError(f"Regressions against {options['compare']}: {', '.join(sorted(regressions))}")
+            self.stderr.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
@@ -0,0 +1,56 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.exports import EXPORTS, EXPORT_FORMATS
+from accounts.filters import DeviceFilterSet, MaintenanceInterventionFilterSet, SoftwareFilterSet
+
+# Same filters as the list endpoints
+FILTERSETS = {
+    'devices': DeviceFilterSet,
+    'softwares': SoftwareFilterSet,
+    'maintenance-interventions': MaintenanceInterventionFilterSet,
+}
+
+
+class Command(BaseCommand):
+    help = 'Stream an inventory export (devices, softwares, maintenance interventions) to a file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=sorted(EXPORTS),
+                            help='Inventory resource to export.')
+        parser.add_argument('--format', dest='export_format', choices=sorted(EXPORT_FORMATS), default='csv',
+                            help='Output format (default: csv).')
+        parser.add_argument('--output', default='-',
+                            help='Output file path, "-" for stdout (default).')
+        parser.add_argument('--filter', dest='filters', action='append', default=[], metavar='NAME=VALUE',
+                            help='List endpoint filter, e.g. --filter status=ACTIVE. Can be repeated.')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows fetched per round trip (default: EXPORT_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        model, export_class = EXPORTS[options['resource']]
+        filterset = FILTERSETS[options['resource']](
+            self.parse_filters(options['filters']),
+            queryset=model.objects.order_by('pk')
+        )
+        if not filterset.is_valid():
+            raise CommandError(f"Invalid filters: {filterset.errors.as_text()}")
+        queryset = filterset.qs
+        export = export_class(chunk_size=options['chunk_size'])
+
+        if options['output'] == '-':
+            export.write(queryset, options['export_format'], sys.stdout)
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            export.write(queryset, options['export_format'], output)
+        self.stdout.write(self.style.SUCCESS(f"Exported {options['resource']} to {options['output']}"))
+
+    def parse_filters(self, filters):
+        data = {}
+        for item in filters:
+            name, separator, value = item.partition('=')
+            if not separator or not name:
+                raise CommandError(f"Invalid filter '{item}', expected NAME=VALUE.")
+            data[name] = value
+        return data
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.dataset import DEFAULT_SCALE, generate
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic inventory (departments, users, suppliers, software, devices, interventions '
+            'and installations) at the given scale, to reproduce production-sized workloads locally.')
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_SCALE.items():
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=int, default=default,
+                                help=f"Default: {default}.")
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random generator, the same seed and prefix give the same data (default: 0).')
+        parser.add_argument('--prefix', default='synthetic',
+                            help='Prefix of the generated usernames (default: synthetic).')
+        parser.add_argument('--password', default='synthetic-password',
+                            help='Password of the generated users (default: synthetic-password).')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Devices written per transaction (default: 5000).')
+        parser.add_argument('--method', choices=['auto', 'copy', 'bulk'], default='auto',
+                            help='COPY (PostgreSQL with psycopg 3) or bulk_create (default: auto).')
+
+    def handle(self, *args, **options):
+        use_copy = {'auto': None, 'copy': True, 'bulk': False}[options['method']]
+        try:
+            counts = generate(
+                scale={name: options[name] for name in DEFAULT_SCALE},
+                seed=options['seed'],
+                prefix=options['prefix'],
+                password=options['password'],
+                batch_size=options['batch_size'],
+                use_copy=use_copy,
+                log=lambda message: self.stderr.write(message),
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(json.dumps(counts, indent=2))
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.preflight import collect_static, get_pending_migrations, migrate, warm_up
+
+
+class Command(BaseCommand):
+    help = ('Prepare the container to serve requests: check the migrations (applying them with --migrate), '
+            'collect the static files when they changed and warm up the URLs, serializers and database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--migrate', action='store_true',
+                            help='Apply the pending migrations instead of failing.')
+        parser.add_argument('--no-static', action='store_false', dest='static',
+                            help='Do not collect the static files.')
+        parser.add_argument('--force-static', action='store_true',
+                            help='Collect the static files even when they did not change.')
+        parser.add_argument('--no-warm-up', action='store_false', dest='warm_up',
+                            help='Do not warm up the URLs, serializers and database.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        step = time.perf_counter()
+        if options['migrate']:
+            applied = migrate()
+            self.log(f"Migrations: {len(applied)} applied" if applied else 'Migrations: up to date', step)
+        else:
+            pending = get_pending_migrations()
+            if pending:
+                raise CommandError(
+                    f"Pending migrations: {', '.join(f'{app}.{name}' for app, name in pending)}. "
+                    f"Run with --migrate to apply them."
+                )
+            self.log('Migrations: up to date', step)
+
+        if options['static']:
+            step = time.perf_counter()
+            collected = collect_static(force=options['force_static'])
+            self.log('Static files: collected' if collected else 'Static files: unchanged', step)
+
+        if options['warm_up']:
+            timings = warm_up()
+            self.stdout.write('Warm up: ' + ', '.join(f"{name} {seconds * 1000:.0f} ms"
+                                                      for name, seconds in timings.items()))
+
+        self.stdout.write(self.style.SUCCESS(f"Preflight completed in {time.perf_counter() - started:.2f} s"))
+
+    def log(self, message, started):
+        self.stdout.write(f"{message} ({(time.perf_counter() - started) * 1000:.0f} ms)")
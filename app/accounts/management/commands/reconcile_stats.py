@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.stats import METRICS, check, rebuild
+
+
+class Command(BaseCommand):
+    help = ('Recompute the summary counters of the fleet dashboard, and the installed_count of the software, '
+            'from the source tables, or only check them with --check.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('metrics', nargs='*',
+                            help=f"Metrics to reconcile: {', '.join(METRICS)} (default: all).")
+        parser.add_argument('--check', action='store_true',
+                            help='Only report the differences, failing when there are any.')
+
+    def handle(self, *args, **options):
+        metrics = options['metrics'] or list(METRICS)
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise CommandError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+
+        if options['check']:
+            differences = check(metrics)
+        else:
+            differences = rebuild(metrics)
+        self.stdout.write(json.dumps(differences, indent=2, sort_keys=True))
+        if options['check'] and differences:
+            raise CommandError(f"Summary counters out of sync: {', '.join(sorted(differences))}")
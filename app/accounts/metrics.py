@@ -0,0 +1,311 @@
+import bisect
+import contextvars
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import cache_call
+from .database import get_connection_metrics
+from .logs import log_writer
+
+# Cache keys of the metrics published by the worker processes. Each process takes
+# the next slot number the first time it publishes.
+SLOTS_KEY = 'accounts:metrics:slots'
+WORKER_KEY = 'accounts:metrics:worker:{slot}'
+
+# Only the last MAX_WORKER_SLOTS slots are read: slots of restarted workers expire
+# after METRICS_WORKER_TIMEOUT seconds anyway.
+MAX_WORKER_SLOTS = 256
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Seconds
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUEST_DURATION = 'accounts_http_request_duration_seconds'
+REQUEST_DB_QUERIES = 'accounts_http_request_db_queries'
+REQUEST_DB_DURATION = 'accounts_http_request_db_duration_seconds'
+REQUEST_SERIALIZATION_DURATION = 'accounts_http_request_serialization_duration_seconds'
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    REQUEST_DURATION: ("Time spent serving the request.", LATENCY_BUCKETS),
+    REQUEST_DB_QUERIES: ("Database queries run by a sampled request.", QUERY_BUCKETS),
+    REQUEST_DB_DURATION: ("Time spent in database queries by a sampled request.", LATENCY_BUCKETS),
+    REQUEST_SERIALIZATION_DURATION: (
+        "Time spent building the response data with the serializers in a sampled request.", LATENCY_BUCKETS
+    ),
+}
+
+# name: (type, help, key of the pool metrics of accounts.database, scale)
+POOL_METRICS = {
+    'accounts_db_pool_size': ('gauge', "Connections opened by the pool.", 'size', 1),
+    'accounts_db_pool_max_size': ('gauge', "Maximum size of the pool.", 'max_size', 1),
+    'accounts_db_pool_in_use': ('gauge', "Pool connections in use.", 'in_use', 1),
+    'accounts_db_pool_waiting': ('gauge', "Requests waiting for a pool connection.", 'waiting', 1),
+    'accounts_db_pool_requests_total': ('counter', "Connections requested to the pool.", 'requests', 1),
+    'accounts_db_pool_wait_seconds_total': (
+        'counter', "Time spent waiting for a pool connection.", 'wait_ms_total', 0.001
+    ),
+    'accounts_db_pool_timeouts_total': ('counter', "Pool requests that timed out.", 'timeouts', 1),
+}
+LOG_RECORDS_DROPPED = 'accounts_log_records_dropped_total'
+
+# Metrics of the request being served, None when the request is not sampled.
+current_request = contextvars.ContextVar('accounts_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Database and serialization time of a sampled request.
+    """
+    __slots__ = ('queries', 'db_time', 'serialization_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.serializing = False
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper (installed on every connection, see `apps.py`) counting
+    the queries of the sampled requests and the time they take.
+    """
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    `connection_created` receiver adding `record_query` to the new connection.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def measure_serialization():
+    """
+    Add the time spent in the block to the serialization time of the sampled request.
+    Nested blocks (nested serializers) are counted once, by the outermost one.
+    """
+    metrics = current_request.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialization_time += time.perf_counter() - started
+        metrics.serializing = False
+
+
+def get_view_labels(request):
+    """
+    Return the (view, action) labels of a request: the viewset and its action for
+    the API, the view function and the method otherwise.
+    """
+    method = request.method.lower()
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', method
+    view = match.func
+    view_class = getattr(view, 'cls', None) or getattr(view, 'view_class', None)
+    if view_class is None:
+        return match.view_name or view.__name__, method
+    actions = getattr(view, 'actions', None) or {}
+    return view_class.__name__, actions.get(method, method)
+
+
+def format_server_timing(metrics, total):
+    return (
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries", '
+        f'serialize;dur={metrics.serialization_time * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+
+
+class MetricsRegistry:
+    """
+    Histograms of the requests served by this process.
+    Each worker process publishes a snapshot of its histograms (and of its database
+    pool and log writer counters) to the default cache at most every
+    METRICS_PUBLISH_INTERVAL seconds, `collect` merges the snapshots of all workers,
+    so /metrics answers the same whichever worker serves the scrape. The snapshot
+    of a worker expires METRICS_WORKER_TIMEOUT seconds after its last publication.
+    Every series carries the `worker` label: the series of an expired worker end
+    instead of the totals going backwards, which Prometheus would read as a reset.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._histograms = {}
+        self._slot = None
+        self._published_at = 0.0
+
+    def reset(self):
+        with self._lock:
+            self._pid = os.getpid()
+            self._histograms = {}
+            self._slot = None
+            self._published_at = 0.0
+
+    def observe(self, name, labels, value):
+        """
+        Add a value to the histogram `name` with the given labels, a tuple of
+        (label, value) pairs.
+        """
+        buckets = HISTOGRAMS[name][1]
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: do not count the requests of the parent process.
+                self._pid = os.getpid()
+                self._histograms = {}
+                self._slot = None
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def observe_request(self, request, status, total, metrics=None):
+        view, action = get_view_labels(request)
+        labels = (('view', view), ('action', action))
+        self.observe(REQUEST_DURATION, labels + (('method', request.method), ('status', str(status))), total)
+        if metrics is not None:
+            self.observe(REQUEST_DB_QUERIES, labels, metrics.queries)
+            self.observe(REQUEST_DB_DURATION, labels, metrics.db_time)
+            self.observe(REQUEST_SERIALIZATION_DURATION, labels, metrics.serialization_time)
+
+    def snapshot(self):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        with self._lock:
+            histograms = [
+                [name, [['worker', worker], *labels], list(counts), total, count]
+                for (name, labels), (counts, total, count) in self._histograms.items()
+            ]
+        samples = [[LOG_RECORDS_DROPPED, [['worker', worker]], log_writer.dropped]]
+        for alias, database in get_connection_metrics()['databases'].items():
+            if not database['pooled']:
+                continue
+            for name, (_, _, key, scale) in POOL_METRICS.items():
+                samples.append([name, [['worker', worker], ['database', alias]], database[key] * scale])
+        return {'histograms': histograms, 'samples': samples}
+
+    def _due(self, force):
+        now = time.monotonic()
+        if not force and now - self._published_at < settings.METRICS_PUBLISH_INTERVAL:
+            return False
+        self._published_at = now
+        return True
+
+    def publish(self, force=False):
+        if not self._due(force):
+            return
+        if self._slot is None:
+            cache.add(SLOTS_KEY, 0, None)
+            self._slot = cache.incr(SLOTS_KEY)
+        cache.set(WORKER_KEY.format(slot=self._slot), self.snapshot(), settings.METRICS_WORKER_TIMEOUT)
+
+    async def apublish(self, force=False):
+        if not self._due(force):
+            return
+        if self._slot is None:
+            await cache_call(cache, 'add', SLOTS_KEY, 0, None)
+            self._slot = await cache_call(cache, 'incr', SLOTS_KEY)
+        await cache_call(
+            cache, 'set', WORKER_KEY.format(slot=self._slot), self.snapshot(), settings.METRICS_WORKER_TIMEOUT
+        )
+
+    def collect(self):
+        """
+        Return the merged snapshot of the live workers. The snapshot of this process
+        is taken now, the others are read from the cache.
+        """
+        self.publish(force=True)
+        last_slot = cache.get(SLOTS_KEY) or 0
+        keys = [
+            WORKER_KEY.format(slot=slot)
+            for slot in range(max(1, last_slot - MAX_WORKER_SLOTS + 1), last_slot + 1)
+            if slot != self._slot
+        ]
+        snapshots = [self.snapshot()] + list(cache.get_many(keys).values())
+
+        histograms = {}
+        samples = []
+        for snapshot in snapshots:
+            for name, labels, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = [list(counts), total, count]
+                    continue
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+            samples.extend(snapshot['samples'])
+        return histograms, samples
+
+
+registry = MetricsRegistry()
+
+
+def escape_label(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(histograms, samples):
+    """
+    Render the metrics returned by `MetricsRegistry.collect` in the Prometheus text
+    exposition format (version 0.0.4).
+    """
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else format_value(float(bound))
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {format_value(float(total))}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+    types = {name: (kind, help_text) for name, (kind, help_text, _, _) in POOL_METRICS.items()}
+    types[LOG_RECORDS_DROPPED] = ('counter', "Log records dropped because the log queue was full.")
+    for name, (kind, help_text) in types.items():
+        values = [(labels, value) for metric, labels, value in samples if metric == name]
+        if not values:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for labels, value in values:
+            lines.append(f"{name}{format_labels([tuple(label) for label in labels])} {format_value(value)}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-17 05:54
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not lock the tables against writes,
+    # but can not run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='device',
+            index=models.Index(fields=['-purchase_date', '-id'], name='device_purchase_date_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='maintenanceintervention',
+            index=models.Index(fields=['-date_intervention', '-id'], name='intervention_date_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='software',
+            index=models.Index(fields=['expire_date', 'id'], name='software_expire_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:04
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not lock the tables against writes,
+    # but can not run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0003_updated_at'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='device',
+            index=models.Index(fields=['status', 'assigned_to'], name='device_status_assigned_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='device',
+            index=models.Index(fields=['assigned_to', '-purchase_date', '-id'], name='device_assigned_purchase_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='device',
+            index=models.Index(fields=['brand', '-purchase_date'], name='device_brand_purchase_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='maintenanceintervention',
+            index=models.Index(fields=['device', '-date_intervention'], name='intervention_device_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='maintenanceintervention',
+            index=models.Index(fields=['technician', '-date_intervention'], name='intervention_tech_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='maintenanceintervention',
+            index=models.Index(fields=['status', '-date_intervention'], name='intervention_status_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='maintenanceintervention',
+            index=models.Index(condition=models.Q(('status__in', ('PENDING', 'IN_PROGRESS'))), fields=['-date_intervention', '-id'], name='intervention_open_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='software',
+            index=models.Index(fields=['name', 'version'], name='software_name_version_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='supplier',
+            index=models.Index(fields=['name'], name='supplier_name_idx'),
+        ),
+    ]
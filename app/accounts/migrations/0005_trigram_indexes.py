@@ -0,0 +1,56 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:09
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not lock the tables against writes,
+    # but can not run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0004_filter_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='device',
+            index=GinIndex(OpClass(Upper('serial_number'), name='gin_trgm_ops'), name='device_serial_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='device',
+            index=GinIndex(OpClass(Upper('brand'), name='gin_trgm_ops'), name='device_brand_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='device',
+            index=GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='device_name_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='software',
+            index=GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='software_name_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='software',
+            index=GinIndex(OpClass(Upper('license_key'), name='gin_trgm_ops'), name='software_license_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='supplier',
+            index=GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='supplier_name_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=GinIndex(OpClass(Upper('first_name'), name='gin_trgm_ops'), name='user_first_name_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=GinIndex(OpClass(Upper('last_name'), name='gin_trgm_ops'), name='user_last_name_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='user_email_trgm_idx'),
+        ),
+    ]
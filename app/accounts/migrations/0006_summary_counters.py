@@ -0,0 +1,54 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:15
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Count the existing rows, later changes are counted incrementally.
+    Mirrors accounts.stats.compute, which can not be used with historical models.
+    """
+    SummaryCounter = apps.get_model('accounts', 'SummaryCounter')
+    Device = apps.get_model('accounts', 'Device')
+    MaintenanceIntervention = apps.get_model('accounts', 'MaintenanceIntervention')
+    Software = apps.get_model('accounts', 'Software')
+
+    counters = []
+    for status, department_id, count in Device.objects.order_by().values_list(
+            'status', 'assigned_to__department').annotate(count=Count('pk')):
+        counters.append(SummaryCounter(metric='devices', key=f"{status}:{department_id or ''}", value=count))
+    for status, count in MaintenanceIntervention.objects.order_by().values_list('status').annotate(count=Count('pk')):
+        counters.append(SummaryCounter(metric='interventions', key=status, value=count))
+    software = {
+        'installations': Software.installed_on.through.objects.count(),
+        'seats': Software.objects.aggregate(seats=Sum('max_installations'))['seats'] or 0,
+        'at_capacity': Software.objects.alias(installations=Count('installed_on')).filter(
+            installations__gte=F('max_installations')
+        ).count(),
+    }
+    counters += [SummaryCounter(metric='software', key=key, value=value) for key, value in software.items() if value]
+    SummaryCounter.objects.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=100)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('metric', 'key'), name='summary_counter_metric_key_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
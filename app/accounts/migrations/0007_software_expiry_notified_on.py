@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:18
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not lock the tables against writes,
+    # but can not run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0006_summary_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='software',
+            name='expiry_notified_on',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='software',
+            index=models.Index(condition=models.Q(('expiry_notified_on__isnull', True)), fields=['expire_date'], name='software_expiry_pending_idx'),
+        ),
+    ]
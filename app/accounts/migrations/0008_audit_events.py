@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_software_expiry_notified_on'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('action', models.CharField(max_length=100)),
+                ('outcome', models.CharField(max_length=20)),
+                ('actor_id', models.BigIntegerField(blank=True, null=True)),
+                ('actor_username', models.CharField(blank=True, max_length=150)),
+                ('object_type', models.CharField(blank=True, max_length=100)),
+                ('object_id', models.CharField(blank=True, max_length=64)),
+                ('object_repr', models.CharField(blank=True, max_length=200)),
+                ('latency_ms', models.FloatField(blank=True, null=True)),
+                ('details', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['timestamp'], name='audit_event_timestamp_idx'), models.Index(fields=['object_type', 'object_id'], name='audit_event_object_idx'), models.Index(fields=['actor_id', 'timestamp'], name='audit_event_actor_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+# Covering index of the installations of a device: the software visibility rule
+# (SoftwareQuerySet.visible_to) reads the software ids of a user's devices from it
+# with an index-only scan. The table is created by the ManyToManyField, so the
+# index is not declared on a model.
+INDEX_NAME = 'software_installed_on_device_software_idx'
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not lock the table against writes,
+    # but can not run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0008_audit_events'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} '
+                f'ON accounts_software_installed_on (device_id, software_id)',
+            reverse_sql=f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_installations_device_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='software',
+            name='installed_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE accounts_software
+                SET installed_count = installations.count
+                FROM (
+                    SELECT software_id, COUNT(*) AS count
+                    FROM accounts_software_installed_on
+                    GROUP BY software_id
+                ) AS installations
+                WHERE accounts_software.id = installations.software_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,62 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+# Index created by 0009 on the table of the automatic through model, now declared on
+# Installation under a name short enough for Django.
+OLD_INDEX_NAME = 'software_installed_on_device_software_idx'
+INDEX_NAME = 'installation_device_sw_idx'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_software_installed_count'),
+    ]
+
+    operations = [
+        # The automatic through model of Software.installed_on becomes Installation,
+        # on the same table: only the state changes.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Installation',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False,
+                                                   verbose_name='ID')),
+                        ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                     related_name='installations', to='accounts.device')),
+                        ('software', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                                       related_name='installations', to='accounts.software')),
+                    ],
+                    options={
+                        'db_table': 'accounts_software_installed_on',
+                        'unique_together': {('software', 'device')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='software',
+                    name='installed_on',
+                    field=models.ManyToManyField(blank=True, related_name='softwares', through='accounts.Installation',
+                                                 to='accounts.device'),
+                ),
+                migrations.AddIndex(
+                    model_name='installation',
+                    index=models.Index(fields=['device', 'software'], name=INDEX_NAME),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql=f'ALTER INDEX IF EXISTS {OLD_INDEX_NAME} RENAME TO {INDEX_NAME}',
+                    reverse_sql=f'ALTER INDEX IF EXISTS {INDEX_NAME} RENAME TO {OLD_INDEX_NAME}',
+                ),
+            ],
+        ),
+        # The existing rows get the time of the migration: the default is a constant
+        # for the ALTER TABLE, so PostgreSQL does not rewrite the table.
+        migrations.AddField(
+            model_name='installation',
+            name='installed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
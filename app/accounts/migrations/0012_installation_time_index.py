@@ -0,0 +1,19 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not lock the table against writes,
+    # but can not run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0011_installation'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='installation',
+            index=models.Index(fields=['software', '-installed_at', '-id'], name='installation_sw_time_idx'),
+        ),
+    ]
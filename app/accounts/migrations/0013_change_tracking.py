@@ -0,0 +1,87 @@
+from django.db import migrations, models
+
+# Tables served by the delta sync (accounts.sync) and the label of their model.
+SYNCED_TABLES = {
+    'accounts_department': 'accounts.department',
+    'accounts_maintenanceintervention': 'accounts.maintenanceintervention',
+    'accounts_device': 'accounts.device',
+    'accounts_supplier': 'accounts.supplier',
+    'accounts_software': 'accounts.software',
+}
+
+# Every write stamps the row with the id of its transaction, and every deletion leaves
+# a tombstone, whatever issued it: save, queryset updates, upserts, COPY or cascades.
+FUNCTIONS_SQL = """
+    CREATE FUNCTION accounts_record_change() RETURNS trigger AS $$
+    BEGIN
+        NEW.change_xid := pg_current_xact_id()::text::bigint;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION accounts_record_deletion() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO accounts_tombstone (model, object_id, change_xid, deleted_at)
+        VALUES (TG_ARGV[0], OLD.id, pg_current_xact_id()::text::bigint, now());
+        RETURN OLD;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+TRIGGERS_SQL = """
+    CREATE TRIGGER {table}_change BEFORE INSERT OR UPDATE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION accounts_record_change();
+    CREATE TRIGGER {table}_deletion AFTER DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION accounts_record_deletion('{label}');
+"""
+
+DROP_TRIGGERS_SQL = """
+    DROP TRIGGER IF EXISTS {table}_change ON {table};
+    DROP TRIGGER IF EXISTS {table}_deletion ON {table};
+"""
+
+DROP_FUNCTIONS_SQL = """
+    DROP FUNCTION IF EXISTS accounts_record_change();
+    DROP FUNCTION IF EXISTS accounts_record_deletion();
+"""
+
+
+def change_xid_field():
+    return models.BigIntegerField(default=0, editable=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_installation_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('change_xid', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['change_xid', 'id'], name='tombstone_change_idx')],
+            },
+        ),
+        # The rows written before get 0, they are only served by full syncs.
+        migrations.AddField(model_name='department', name='change_xid', field=change_xid_field()),
+        migrations.AddField(model_name='maintenanceintervention', name='change_xid', field=change_xid_field()),
+        migrations.AddField(model_name='device', name='change_xid', field=change_xid_field()),
+        migrations.AddField(model_name='supplier', name='change_xid', field=change_xid_field()),
+        migrations.AddField(model_name='software', name='change_xid', field=change_xid_field()),
+        migrations.RunSQL(
+            sql=FUNCTIONS_SQL + ''.join(
+                TRIGGERS_SQL.format(table=table, label=label) for table, label in SYNCED_TABLES.items()
+            ),
+            reverse_sql=''.join(
+                DROP_TRIGGERS_SQL.format(table=table) for table in SYNCED_TABLES
+            ) + DROP_FUNCTIONS_SQL,
+        ),
+    ]
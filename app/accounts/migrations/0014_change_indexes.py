@@ -0,0 +1,35 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY does not lock the table against writes,
+    # but can not run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('accounts', '0013_change_tracking'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='department',
+            index=models.Index(fields=['change_xid', 'id'], name='department_change_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='maintenanceintervention',
+            index=models.Index(fields=['change_xid', 'id'], name='intervention_change_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='device',
+            index=models.Index(fields=['change_xid', 'id'], name='device_change_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='supplier',
+            index=models.Index(fields=['change_xid', 'id'], name='supplier_change_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='software',
+            index=models.Index(fields=['change_xid', 'id'], name='software_change_idx'),
+        ),
+    ]
@@ -0,0 +1,605 @@
+import hashlib
+import logging
+import time
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from . import bulk
+from .audit import REJECTED, SUCCESS, audit, describe
+from .cache import aget_generations, get_generations, response_cache
+from .serializers import get_expanded_fields, get_requested_fields
+
+
+class QueryPlanMixin:
+    """
+    Mixin for viewsets that declare a query plan per action.
+    - query_plans: Mapping of action name to QueryPlan. Actions without an entry
+      load the queryset unchanged.
+    The plan is restricted to the fields requested with `?fields=` and `?expand=`.
+    """
+    query_plans = {}
+
+    def get_query_plan(self, queryset=None):
+        """
+        Return the query plan declared for the current action, if any.
+        """
+        plan = self.query_plans.get(self.action)
+        if plan is None or self.request is None:
+            return plan
+        fields = get_requested_fields(self.request)
+        if fields is not None:
+            # The ordering and the pagination cursor read the ordering columns of every row.
+            fields |= {field.lstrip('-') for field in self.get_list_ordering(queryset)}
+        return plan.restrict(fields, get_expanded_fields(self.request))
+
+    def get_list_ordering(self, queryset=None):
+        """
+        Return the ordering applied to the rows: the one requested with `?ordering=`
+        when valid, the `ordering` of the viewset otherwise.
+        """
+        for backend in self.filter_backends:
+            if hasattr(backend, 'get_ordering'):
+                return backend().get_ordering(self.request, queryset, self) or ()
+        return getattr(self, 'ordering', None) or ()
+
+    def apply_query_plan(self, queryset):
+        """
+        Load the queryset according to the query plan of the current action.
+        """
+        plan = self.get_query_plan(queryset)
+        if plan is None:
+            return queryset
+        return plan.apply(queryset)
+
+    def get_queryset(self):
+        return self.apply_query_plan(super().get_queryset())
+
+
+class AuditMixin:
+    """
+    Mixin recording an audit event (accounts.audit) for every write of the viewset.
+    Events are named "<basename>.<action>" and carry the time spent in the view.
+    create, update and destroy are audited by default; other actions call `audit`.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        self.started_at = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def audit(self, action, target=None, outcome=SUCCESS, level=logging.INFO, **details):
+        started_at = getattr(self, 'started_at', None)
+        latency_ms = (time.perf_counter() - started_at) * 1000 if started_at is not None else None
+        audit(f"{self.basename}.{action}", self.request.user, target, outcome, latency_ms, level, **details)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.audit('create', serializer.instance)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.audit('update', serializer.instance)
+
+    def perform_destroy(self, instance):
+        target = describe(instance)
+        super().perform_destroy(instance)
+        self.audit('delete', target)
+
+
+class BulkActionMixin:
+    """
+    Mixin for viewsets with actions writing many objects in one request. The body
+    of the request is {"items": [...]}, with at most BULK_MAX_ITEMS items.
+    """
+
+    def perform_bulk(self, serializer_class, id_field, operation):
+        """
+        Validate each item with `serializer_class` and pass the valid ones, as
+        validated data, to `operation`, which returns their results in order.
+        Invalid items are rejected with their validation errors, the others keep
+        going. Returns the summary of the results (accounts.bulk.summarize).
+        """
+        items = self.request.data.get('items') if isinstance(self.request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            raise ValidationError({'items': 'A non empty list of items is required.'})
+        if len(items) > settings.BULK_MAX_ITEMS:
+            raise ValidationError({'items': f"At most {settings.BULK_MAX_ITEMS} items are accepted per request."})
+
+        serializer = serializer_class()
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, serializer.run_validation(item)))
+            except ValidationError as e:
+                item_id = item.get(id_field) if isinstance(item, dict) else None
+                results[index] = bulk.result(item_id, bulk.REJECTED, e.detail)
+        if valid:
+            for (index, _), item_result in zip(valid, operation([data for _, data in valid])):
+                results[index] = item_result
+        return bulk.summarize(results)
+
+    def audit_bulk(self, action, summary, target=None):
+        """
+        Audit a bulk action with its counts and the ids of the created and updated
+        objects; a request with every item rejected is audited as rejected.
+        """
+        details = {
+            outcome: [item['id'] for item in summary['results'] if item['result'] == outcome]
+            if outcome in (bulk.CREATED, bulk.UPDATED) else count
+            for outcome, count in summary.items() if outcome != 'results'
+        }
+        rejected = summary[bulk.REJECTED] == len(summary['results'])
+        self.audit(action, target, outcome=REJECTED if rejected else SUCCESS,
+                   level=logging.WARNING if rejected else logging.INFO, **details)
+
+
+class BulkWriteMixin(BulkActionMixin):
+    """
+    Mixin accepting a JSON array of objects on the list endpoint, written in one
+    transaction with one upsert (accounts.serializers.BulkListSerializer).
+    - POST creates the objects, or updates the existing ones with the same natural key
+    - PATCH (`bulk_partial_update`, routed by accounts.urls.BulkRouter) partially
+      updates the objects identified by their `id`
+    - bulk_serializer_class: Serializer of an item, with BulkListSerializer as its
+      list serializer
+    Only the objects of `get_queryset` are updated, like the single object endpoints:
+    an item matching another object is rejected.
+    At most BULK_MAX_ITEMS objects are accepted per request. The response holds the
+    result of each object: created, updated or rejected (with the error).
+    """
+    bulk_serializer_class = None
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        return self.perform_bulk_write('bulk_create')
+
+    def bulk_partial_update(self, request, *args, **kwargs):
+        return self.perform_bulk_write('bulk_update', partial=True)
+
+    def perform_bulk_write(self, action, partial=False):
+        serializer = self.bulk_serializer_class(
+            data=self.request.data, many=True, partial=partial, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        summary = bulk.summarize(serializer.save(queryset=self.get_queryset()), bulk.WRITE_OUTCOMES)
+        self.audit_bulk(action, summary)
+        return Response(summary, status=status.HTTP_200_OK)
+
+
+class ExportMixin:
+    """
+    Mixin for viewsets that stream their filtered queryset as CSV or NDJSON.
+    - export_class: InventoryExport subclass describing the exported columns
+    """
+    export_class = None
+
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<export_format>csv|ndjson)')
+    def export(self, request, export_format=None):
+        """
+        Stream every row visible to the user, filtered like the list endpoint.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        asynchronous = isinstance(request._request, ASGIRequest)
+        return self.export_class().streaming_response(queryset, export_format, asynchronous)
+
+
+class ConditionalRequestMixin:
+    """
+    Mixin for viewsets of models with an `updated_at` column, adding HTTP validators.
+    - list: weak ETag built from max(updated_at) and count(*) of the filtered
+      queryset, plus the request path (filters, cursor, fields). Last-Modified is
+      max(updated_at).
+    - retrieve: strong ETag built from the primary key and updated_at of the object,
+      plus the request path and the renderer.
+    Responses embedding related objects (`?expand=`) get no validators, the changes of
+    those objects not altering them.
+    Both answer `304 Not Modified` without serializing anything when the client's
+    If-None-Match / If-Modified-Since validators match. update, partial_update and
+    destroy honour If-Match / If-Unmodified-Since and answer `412 Precondition Failed`
+    when the object changed in the meantime.
+    """
+    precondition_headers = ('HTTP_IF_MATCH', 'HTTP_IF_UNMODIFIED_SINCE')
+
+    def has_validators(self):
+        return not get_expanded_fields(self.request)
+
+    def get_list_validators(self, queryset):
+        """
+        Return the (etag, last_modified timestamp) of a filtered queryset.
+        """
+        return self.make_list_validators(queryset.prefetch_related(None).aggregate(
+            last_modified=Max('updated_at'),
+            count=Count('pk')
+        ))
+
+    async def aget_list_validators(self, queryset):
+        return self.make_list_validators(await queryset.prefetch_related(None).aaggregate(
+            last_modified=Max('updated_at'),
+            count=Count('pk')
+        ))
+
+    def get_representation_fingerprint(self):
+        """
+        Return what, besides the data, selects the representation: the path with its
+        query string (filters, cursor, fields) and the renderer.
+        """
+        accepted_renderer = getattr(self.request, 'accepted_renderer', None)
+        return f"{self.request.get_full_path()}:{getattr(accepted_renderer, 'format', '')}"
+
+    def make_list_validators(self, aggregates):
+        last_modified = aggregates['last_modified']
+        fingerprint = ':'.join([
+            self.get_representation_fingerprint(),
+            last_modified.isoformat() if last_modified else '',
+            str(aggregates['count']),
+        ])
+        etag = 'W/' + quote_etag(hashlib.md5(fingerprint.encode(), usedforsecurity=False).hexdigest())
+        return etag, int(last_modified.timestamp()) if last_modified else None
+
+    def get_object_validators(self):
+        """
+        Return the (etag, last_modified timestamp) of the requested object, or
+        (None, None) when the object is not visible.
+        """
+        return self.make_object_validators(self.get_updated_at_queryset().first())
+
+    async def aget_object_validators(self):
+        return self.make_object_validators(await self.get_updated_at_queryset().afirst())
+
+    def get_updated_at_queryset(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, DjangoValidationError):
+            # Malformed lookup value, like get_object_or_404.
+            raise Http404
+        return queryset.values_list('updated_at', flat=True)
+
+    def make_object_validators(self, updated_at):
+        if updated_at is None:
+            return None, None
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        fingerprint = ':'.join([
+            self.queryset.model._meta.label,
+            str(self.kwargs[lookup_url_kwarg]),
+            updated_at.isoformat(),
+            self.get_representation_fingerprint(),
+        ])
+        etag = quote_etag(hashlib.md5(fingerprint.encode(), usedforsecurity=False).hexdigest())
+        return etag, int(updated_at.timestamp())
+
+    def set_validators(self, response, etag, last_modified):
+        if etag is not None and response.status_code < 300:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ['Accept', 'Authorization', 'Cookie'])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified, response = None, None, None
+        if self.has_validators():
+            etag, last_modified = self.get_list_validators(self.filter_queryset(self.get_queryset()))
+            response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, last_modified, response = None, None, None
+        if self.has_validators():
+            etag, last_modified = self.get_object_validators()
+        if etag is not None:
+            response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    async def alist(self, request, *args, **kwargs):
+        etag, last_modified, response = None, None, None
+        if self.has_validators():
+            etag, last_modified = await self.aget_list_validators(self.filter_queryset(self.get_queryset()))
+            response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await super().alist(request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        etag, last_modified, response = None, None, None
+        if self.has_validators():
+            etag, last_modified = await self.aget_object_validators()
+        if etag is not None:
+            response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await super().aretrieve(request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    def check_preconditions(self, request):
+        """
+        Return a `412 Precondition Failed` response when the write preconditions
+        sent by the client do not match the current object, None otherwise.
+        """
+        if not any(header in request.META for header in self.precondition_headers):
+            return None
+        etag, last_modified = self.get_object_validators()
+        if etag is None:
+            return None
+        return get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+
+    def update(self, request, *args, **kwargs):
+        response = self.check_preconditions(request)
+        if response is not None:
+            return response
+        response = super().update(request, *args, **kwargs)
+        return self.set_validators(response, *self.get_object_validators())
+
+    def destroy(self, request, *args, **kwargs):
+        response = self.check_preconditions(request)
+        if response is not None:
+            return response
+        return super().destroy(request, *args, **kwargs)
+
+
+class CachedResponseMixin:
+    """
+    Mixin caching the serialized data of list and retrieve responses.
+    - cache_dependencies: Models whose changes can alter the response. The cache key
+      contains their generation counters, which are bumped on every write, so a
+      cached response is never served once one of them changed. The models of the
+      relations embedded with `?expand=` are added to them.
+    The key also contains the absolute URL (filters, cursor, fields), the accepted
+    renderer and the visibility scope of the user (see `get_cache_scope`).
+    """
+    cache_dependencies = ()
+
+    def get_cache_scope(self):
+        """
+        Return the part of the key describing which rows the user can see.
+        Staff users see the same rows, regular users only their own ones.
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            return 'anonymous'
+        if user.is_staff:
+            return 'staff'
+        return f"user:{user.pk}"
+
+    def get_response_cache_key(self, generations=None):
+        accepted_renderer = getattr(self.request, 'accepted_renderer', None)
+        if generations is None:
+            generations = get_generations(self.get_cache_dependencies())
+        return response_cache.make_key(
+            self.basename,
+            self.action,
+            self.request.build_absolute_uri(),
+            getattr(accepted_renderer, 'format', ''),
+            self.get_cache_scope(),
+            *generations
+        )
+
+    def get_cache_dependencies(self):
+        dependencies = list(self.cache_dependencies or (self.queryset.model,))
+        meta = getattr(self.get_serializer_class(), 'Meta', None)
+        expandable_fields = getattr(meta, 'expandable_fields', {})
+        for name in sorted(get_expanded_fields(self.request)):
+            if name in expandable_fields:
+                model = expandable_fields[name][0].Meta.model
+                if model not in dependencies:
+                    dependencies.append(model)
+        return tuple(dependencies)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return handler(request, *args, **kwargs)
+
+        key = self.get_response_cache_key()
+        data = response_cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.set(key, response.data)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    async def aget_cached_response(self, handler, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return await handler(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(await aget_generations(self.get_cache_dependencies()))
+        data = await response_cache.aget(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = await handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            await response_cache.aset(key, response.data)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.aget_cached_response(super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.aget_cached_response(super().aretrieve, request, *args, **kwargs)
+
+
+# Permissions that only look at the request and the user, checked on the event loop.
+IO_FREE_PERMISSIONS = (
+    permissions.AllowAny,
+    permissions.IsAuthenticated,
+    permissions.IsAdminUser,
+    permissions.IsAuthenticatedOrReadOnly,
+)
+
+
+async def acheck_permission(permission, method, *args):
+    """
+    Call `method` (has_permission or has_object_permission) of a permission from
+    async code: through its async version (`ahas_permission`) when it declares one,
+    directly when it performs no I/O, in a thread otherwise.
+    """
+    async_method = getattr(permission, f"a{method}", None)
+    if async_method is not None:
+        return await async_method(*args)
+    if isinstance(permission, IO_FREE_PERMISSIONS):
+        return getattr(permission, method)(*args)
+    return await sync_to_async(getattr(permission, method))(*args)
+
+
+class AsyncReadMixin:
+    """
+    Mixin serving the read actions of a viewset natively on the event loop.
+    - async_actions: Actions served asynchronously, through `a<action>` handlers
+    GET and HEAD requests routed to these actions go through `adispatch`, which
+    awaits authentication, permissions and queries (async ORM), so an ASGI worker
+    keeps serving other requests while they wait on the database or the cache.
+    Authenticators and permissions are awaited through their `aauthenticate` and
+    `ahas_permission` methods when they declare them, and run in a thread otherwise.
+    Other methods and actions are served by the regular view, as are all requests
+    when ASYNC_READ_ENABLED is off.
+    """
+    async_actions = ('list', 'retrieve')
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if actions.get('get') not in cls.async_actions:
+            return view
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if not settings.ASYNC_READ_ENABLED or request.method not in ('GET', 'HEAD'):
+                return await sync_view(request, *args, **kwargs)
+            self = cls(**initkwargs)
+            self.action_map = {'head': actions['get'], **actions}
+            self.request = request
+            return await self.adispatch(request, *args, **kwargs)
+
+        # Keep the attributes of the regular view (cls, initkwargs, actions and
+        # csrf_exempt), read by the router, the schema generator and the middlewares.
+        return update_wrapper(async_view, view)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        Async version of `dispatch` for the async actions.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            response = await getattr(self, f"a{self.action}")(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        """
+        Async version of `initial`.
+        """
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await self.aperform_authentication(request)
+        await self.acheck_permissions(request)
+        if self.get_throttles():
+            await sync_to_async(self.check_throttles)(request)
+
+    async def aperform_authentication(self, request):
+        """
+        Authenticate the request with the first authenticator that accepts it, like
+        `Request._authenticate`.
+        """
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, 'aauthenticate'):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except Exception:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    async def acheck_permissions(self, request):
+        for permission in self.get_permissions():
+            if not await acheck_permission(permission, 'has_permission', request, self):
+                self.permission_denied(
+                    request,
+                    message=getattr(permission, 'message', None),
+                    code=getattr(permission, 'code', None)
+                )
+
+    async def acheck_object_permissions(self, request, obj):
+        for permission in self.get_permissions():
+            if not await acheck_permission(permission, 'has_object_permission', request, self, obj):
+                self.permission_denied(
+                    request,
+                    message=getattr(permission, 'message', None),
+                    code=getattr(permission, 'code', None)
+                )
+
+    async def aget_object(self):
+        """
+        Async version of `get_object`.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        await self.acheck_object_permissions(self.request, obj)
+        return obj
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        rows = [row async for row in queryset.aiterator()]
+        return Response(self.get_serializer(rows, many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        return Response(self.get_serializer(instance).data)
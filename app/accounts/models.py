@@ -1,10 +1,49 @@
 import uuid
 
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
+from django.utils import timezone
+from django.utils.functional import cached_property
 from .constants import (STATUS_DEVICE_CHOICES, ACTIVE,
                         GENDER_CHOICES, NONE,
-                        STATUS_MAINTENANCE_CHOICES, PENDING)
+                        STATUS_MAINTENANCE_CHOICES, PENDING,
+                        OPEN_MAINTENANCE_STATUSES)
+
+
+class LoadedValuesMixin:
+    """
+    Remembers the values of `tracked_fields` as they were loaded from the database,
+    so the changes of an update can be computed without reading the old row again.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def remember_loaded_values(self):
+        self._loaded_values = {
+            field: self.__dict__[field] for field in self.tracked_fields if field in self.__dict__
+        }
+
+    def get_loaded_values(self):
+        """
+        Return the stored values of the tracked fields, reading the ones that were
+        deferred or never loaded (instances built by hand) from the database.
+        Must be called before the instance is saved.
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        missing = [field for field in self.tracked_fields if field not in loaded]
+        if missing and self.pk is not None:
+            row = type(self)._base_manager.filter(pk=self.pk).values(*missing).first()
+            loaded = {**loaded, **(row or {})}
+        self._loaded_values = loaded
+        return loaded
 
 
 class Department(models.Model):
@@ -12,14 +51,24 @@ class Department(models.Model):
     Model for storing information about a department.
     Fields:
     - name: Department's name
+    - updated_at: Date and time of the last change
+    - change_xid: Transaction of the last change, set by a database trigger (accounts.sync)
     """
     name = models.CharField(max_length=50, unique=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    change_xid = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Delta sync (accounts.sync)
+            models.Index(fields=['change_xid', 'id'], name='department_change_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class User(AbstractUser):
+class User(LoadedValuesMixin, AbstractUser):
     """
     Custom user model that extends the default Django user model.
     Fields:
@@ -50,11 +99,70 @@ class User(AbstractUser):
         blank=True
     )
 
+    tracked_fields = ('department_id',)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Trigram search (accounts.search), on UPPER(field) like the ILIKE lookups
+            GinIndex(OpClass(Upper('first_name'), name='gin_trgm_ops'), name='user_first_name_trgm_idx'),
+            GinIndex(OpClass(Upper('last_name'), name='gin_trgm_ops'), name='user_last_name_trgm_idx'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='user_email_trgm_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.email}"
 
 
-class MaintenanceIntervention(models.Model):
+class MaintenanceInterventionQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Staff users see every intervention, regular users the ones they are the technician of
+        (intervention_tech_date_idx).
+        """
+        if user.is_staff:
+            return self.all()
+        return self.filter(technician=user)
+
+
+class DeviceQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Staff users see every device, regular users the devices assigned to them
+        (device_assigned_purchase_idx).
+        """
+        if user.is_staff:
+            return self.all()
+        return self.filter(assigned_to=user)
+
+
+class SoftwareQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Staff users see every software, regular users the software installed on their devices.
+        Expressed as an EXISTS subquery on the installations of the user's devices, a
+        semi-join answered from the (device_id, software_id) index of the installations
+        table, instead of a join over every installation followed by a DISTINCT.
+        """
+        if user.is_staff:
+            return self.all()
+        installations = self.model.installed_on.through.objects.filter(
+            software_id=models.OuterRef('pk'), device__assigned_to=user
+        )
+        return self.filter(models.Exists(installations))
+
+
+class InstallationQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Staff users see every installation, regular users the installations on the
+        devices assigned to them.
+        """
+        if user.is_staff:
+            return self.all()
+        return self.filter(device__assigned_to=user)
+
+
+class MaintenanceIntervention(LoadedValuesMixin, models.Model):
     """
     Model for storing information about a maintenance intervention.
     Fields:
@@ -63,6 +171,8 @@ class MaintenanceIntervention(models.Model):
     - date_intervention: Date of the maintenance intervention
     - technician: User who performed the maintenance intervention
     - status: Status of the maintenance intervention (Pending, In Progress, Completed)
+    - updated_at: Date and time of the last change
+    - change_xid: Transaction of the last change, set by a database trigger (accounts.sync)
     """
     device = models.ForeignKey(
         'Device',
@@ -83,12 +193,34 @@ class MaintenanceIntervention(models.Model):
         choices=STATUS_MAINTENANCE_CHOICES,
         default=PENDING
     )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    change_xid = models.BigIntegerField(default=0, editable=False)
+
+    objects = MaintenanceInterventionQuerySet.as_manager()
+    tracked_fields = ('status',)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination key of the interventions list
+            models.Index(fields=['-date_intervention', '-id'], name='intervention_date_id_idx'),
+            # Filters of MaintenanceInterventionFilterSet
+            models.Index(fields=['device', '-date_intervention'], name='intervention_device_date_idx'),
+            models.Index(fields=['technician', '-date_intervention'], name='intervention_tech_date_idx'),
+            models.Index(fields=['status', '-date_intervention'], name='intervention_status_date_idx'),
+            models.Index(
+                fields=['-date_intervention', '-id'],
+                condition=models.Q(status__in=OPEN_MAINTENANCE_STATUSES),
+                name='intervention_open_date_idx'
+            ),
+            # Delta sync (accounts.sync)
+            models.Index(fields=['change_xid', 'id'], name='intervention_change_idx'),
+        ]
 
     def __str__(self):
         return f"{self.device} - {self.date_intervention}"
 
 
-class Device(models.Model):
+class Device(LoadedValuesMixin, models.Model):
     """
     Model for storing information about a user's device.
     Fields:
@@ -99,6 +231,9 @@ class Device(models.Model):
     - status: Status of the device (Active, On Maintenance, Inactive)
     - purchase_date: Date of purchase of the device
     - assigned_to: User to whom the device is assigned
+    - updated_at: Date and time of the last change, including changes of its
+      interventions and installed software
+    - change_xid: Transaction of the last change, set by a database trigger (accounts.sync)
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='devices')
     device_id = models.UUIDField(
@@ -122,10 +257,48 @@ class Device(models.Model):
         null=True,
         blank=True
     )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    change_xid = models.BigIntegerField(default=0, editable=False)
+
+    objects = DeviceQuerySet.as_manager()
+    tracked_fields = ('status', 'assigned_to_id')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination key of the devices list
+            models.Index(fields=['-purchase_date', '-id'], name='device_purchase_date_id_idx'),
+            # Filters of DeviceFilterSet
+            models.Index(fields=['status', 'assigned_to'], name='device_status_assigned_idx'),
+            models.Index(fields=['assigned_to', '-purchase_date', '-id'], name='device_assigned_purchase_idx'),
+            models.Index(fields=['brand', '-purchase_date'], name='device_brand_purchase_idx'),
+            # Trigram search (accounts.search), on UPPER(field) like the ILIKE lookups
+            GinIndex(OpClass(Upper('serial_number'), name='gin_trgm_ops'), name='device_serial_trgm_idx'),
+            GinIndex(OpClass(Upper('brand'), name='gin_trgm_ops'), name='device_brand_trgm_idx'),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='device_name_trgm_idx'),
+            # Delta sync (accounts.sync)
+            models.Index(fields=['change_xid', 'id'], name='device_change_idx'),
+        ]
 
     def __str__(self):
         return f"{self.brand} - {self.serial_number} - {self.status}"
 
+    @cached_property
+    def latest_maintenance_interventions(self):
+        """
+        Latest EMBEDDED_ITEMS interventions of the device, embedded in its payload.
+        Prefetched for whole pages by the query plans (accounts.query_plans).
+        """
+        return list(
+            self.maintenance_interventions.order_by('-date_intervention', '-id')[:settings.EMBEDDED_ITEMS]
+        )
+
+    @cached_property
+    def maintenance_interventions_count(self):
+        """
+        Number of interventions of the device, annotated by the query plans.
+        """
+        return self.maintenance_interventions.count()
+
 
 class Supplier(models.Model):
     """
@@ -133,15 +306,29 @@ class Supplier(models.Model):
     Fields:
     - name: Name of the supplier
     - telephone: Unique phone number for the supplier
+    - updated_at: Date and time of the last change
+    - change_xid: Transaction of the last change, set by a database trigger (accounts.sync)
     """
     name = models.CharField(max_length=50)
     telephone = models.CharField(max_length=20, unique=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    change_xid = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Filters of SupplierFilterSet
+            models.Index(fields=['name'], name='supplier_name_idx'),
+            # Trigram search (accounts.search), on UPPER(field) like the ILIKE lookups
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='supplier_name_trgm_idx'),
+            # Delta sync (accounts.sync)
+            models.Index(fields=['change_xid', 'id'], name='supplier_change_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Software(models.Model):
+class Software(LoadedValuesMixin, models.Model):
     """
     Model for storing information about a software.
     Fields:
@@ -150,8 +337,15 @@ class Software(models.Model):
     - supplier: Supplier of the software
     - license_key: License key for the software
     - expire_date: Expiration date of the software
-    - installed_on: List of devices on which the software is installed
+    - installed_on: List of devices on which the software is installed (Installation)
     - max_installations: Maximum number of installations allowed for the software
+    - installed_count: Rows of the installations table of the software, maintained
+      with conditional UPDATEs (accounts.stats.installations_changed) and never
+      written by `save`
+    - expiry_notified_on: Date the upcoming expiry was sent in the department digests,
+      reset when the expiry date changes
+    - updated_at: Date and time of the last change, including changes of its installations
+    - change_xid: Transaction of the last change, set by a database trigger (accounts.sync)
     """
     name = models.CharField(max_length=50)
     version = models.CharField(max_length=50)
@@ -164,10 +358,177 @@ class Software(models.Model):
     expire_date = models.DateField()
     installed_on = models.ManyToManyField(
         Device,
+        through='Installation',
         related_name='softwares',
         blank=True
     )
     max_installations = models.PositiveIntegerField()
+    installed_count = models.PositiveIntegerField(default=0, editable=False)
+    expiry_notified_on = models.DateField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    change_xid = models.BigIntegerField(default=0, editable=False)
+
+    objects = SoftwareQuerySet.as_manager()
+    tracked_fields = ('max_installations', 'expire_date')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination key of the software list
+            models.Index(fields=['expire_date', 'id'], name='software_expire_date_id_idx'),
+            # Expiry scan (accounts.tasks): only the licenses not notified yet
+            models.Index(
+                fields=['expire_date'],
+                condition=models.Q(expiry_notified_on__isnull=True),
+                name='software_expiry_pending_idx'
+            ),
+            # Filters of SoftwareFilterSet
+            models.Index(fields=['name', 'version'], name='software_name_version_idx'),
+            # Trigram search (accounts.search), on UPPER(field) like the ILIKE lookups
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='software_name_trgm_idx'),
+            GinIndex(OpClass(Upper('license_key'), name='gin_trgm_ops'), name='software_license_trgm_idx'),
+            # Delta sync (accounts.sync)
+            models.Index(fields=['change_xid', 'id'], name='software_change_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.version}"
+
+    @cached_property
+    def latest_installations(self):
+        """
+        Latest EMBEDDED_ITEMS installations of the software, with their device.
+        Prefetched for whole pages by the query plans (accounts.query_plans).
+        """
+        return list(
+            self.installations.select_related('device').order_by('-installed_at', '-id')[:settings.EMBEDDED_ITEMS]
+        )
+
+    @property
+    def latest_installed_on(self):
+        """
+        Devices of the latest installations, embedded in the payload of the software.
+        """
+        return [installation.device for installation in self.latest_installations]
+
+    def save(self, *args, **kwargs):
+        # The installations change installed_count with UPDATEs relative to the stored
+        # value, writing back the value loaded with the instance would undo them.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'installed_count'
+            ]
+        super().save(*args, **kwargs)
+
+
+class Installation(models.Model):
+    """
+    Model for storing the installations of the software (through model of
+    Software.installed_on).
+    Fields:
+    - software: Installed software
+    - device: Device the software is installed on
+    - installed_at: Date and time of the installation; the installations made before
+      it was recorded have the time of the migration that added it
+    """
+    software = models.ForeignKey(Software, on_delete=models.CASCADE, related_name='installations')
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='installations')
+    installed_at = models.DateTimeField(default=timezone.now)
+
+    objects = InstallationQuerySet.as_manager()
+
+    class Meta:
+        # The table of the former automatic through model.
+        db_table = 'accounts_software_installed_on'
+        unique_together = [('software', 'device')]
+        indexes = [
+            # Software visibility rule (SoftwareQuerySet.visible_to), index-only scan
+            models.Index(fields=['device', 'software'], name='installation_device_sw_idx'),
+            # Keyset pagination key of the installations of a software
+            models.Index(fields=['software', '-installed_at', '-id'], name='installation_sw_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.software} - {self.device}"
+
+
+class Tombstone(models.Model):
+    """
+    Deleted row of a model served by the delta sync (accounts.sync), inserted by a
+    database trigger, so cascades and queryset deletes are recorded as well.
+    Tombstones older than SYNC_TOMBSTONE_DAYS are pruned (accounts.tasks).
+    Fields:
+    - model: Label of the model of the deleted row, e.g. "accounts.device"
+    - object_id: Primary key of the deleted row
+    - change_xid: Transaction that deleted the row
+    - deleted_at: Date and time of the deletion
+    """
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    change_xid = models.BigIntegerField()
+    deleted_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            # Delta sync (accounts.sync)
+            models.Index(fields=['change_xid', 'id'], name='tombstone_change_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+
+class SummaryCounter(models.Model):
+    """
+    Incrementally maintained counter read by the fleet dashboard (accounts.stats).
+    Fields:
+    - metric: Group of counters (devices, interventions, software)
+    - key: Counted bucket within the metric, e.g. "<status>:<department id>"
+    - value: Current count
+    """
+    metric = models.CharField(max_length=20)
+    key = models.CharField(max_length=100)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'key'], name='summary_counter_metric_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} {self.key}: {self.value}"
+
+
+class AuditEvent(models.Model):
+    """
+    Audit event of a write made through the API (accounts.audit), stored when the
+    audit table is enabled (AUDIT_TABLE_ENABLED). Rows are inserted in batches by the
+    log writer thread, see accounts.logs.AuditTableHandler.
+    Fields:
+    - action: "<resource>.<action>", e.g. "device.assign"
+    - outcome: success, rejected or error
+    - actor_id, actor_username: User who made the request (kept after the user is deleted)
+    - object_type, object_id, object_repr: Model label, primary key and description of the object
+    - latency_ms: Time spent in the view until the event was recorded
+    - details: Other fields of the event
+    """
+    timestamp = models.DateTimeField()
+    action = models.CharField(max_length=100)
+    outcome = models.CharField(max_length=20)
+    actor_id = models.BigIntegerField(null=True, blank=True)
+    actor_username = models.CharField(max_length=150, blank=True)
+    object_type = models.CharField(max_length=100, blank=True)
+    object_id = models.CharField(max_length=64, blank=True)
+    object_repr = models.CharField(max_length=200, blank=True)
+    latency_ms = models.FloatField(null=True, blank=True)
+    details = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='audit_event_timestamp_idx'),
+            models.Index(fields=['object_type', 'object_id'], name='audit_event_object_idx'),
+            models.Index(fields=['actor_id', 'timestamp'], name='audit_event_actor_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.timestamp} {self.action} {self.outcome}: {self.object_repr}"
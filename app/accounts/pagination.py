@@ -0,0 +1,178 @@
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor, _reverse_ordering
+
+from .search import SEARCH_RANK
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over a composite, unique ordering key.
+    - The ordering is taken from the `ordering` attribute of the view and is always
+      completed with the primary key, so every row has a unique position.
+    - The cursor stores the values of every ordering field of the last row, and the
+      next page is fetched with a keyset (row value) comparison instead of an OFFSET,
+      so deep pages cost the same as the first one.
+    - Clients can choose the page size with `?page_size=` up to `max_page_size`.
+    - Search results (querysets annotated with the search rank) are ordered by
+      relevance instead.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Return the ordering of the view completed with the primary key as tie-breaker.
+        """
+        if SEARCH_RANK in queryset.query.annotations:
+            return (f"-{SEARCH_RANK}", 'id')
+        if getattr(view, 'ordering', None):
+            self.ordering = view.ordering
+        ordering = super().get_ordering(request, queryset, view)
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async version of `paginate_queryset`, fetching the page with `aiterator`.
+        """
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([row async for row in queryset.aiterator(chunk_size=self.page_size + 1)])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Return the queryset of the requested page, or None when pagination is off.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            self.reverse, self.current_position = False, None
+        else:
+            self.reverse, self.current_position = self.cursor.reverse, self.cursor.position
+
+        ordering = _reverse_ordering(self.ordering) if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.current_position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(queryset, ordering, self.current_position))
+
+        # Fetch an extra row to know whether a following page exists.
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        """
+        Store the page out of the rows fetched by the page queryset and return it.
+        """
+        self.page = results[:self.page_size]
+        has_following_page = len(results) > len(self.page)
+
+        if self.reverse:
+            # The rows were fetched in reverse order, restore the requested one.
+            self.page = list(reversed(self.page))
+            self.has_next = self.current_position is not None
+            self.has_previous = has_following_page
+        else:
+            self.has_next = has_following_page
+            self.has_previous = self.current_position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_keyset_filter(self, queryset, ordering, position):
+        """
+        Build the filter selecting the rows that follow `position` in `ordering`.
+        (a, b) > (x, y) is expanded to `a > x OR (a = x AND b > y)`, plus a redundant
+        `a >= x` so the database can use a range scan on the leading index column.
+        The values of the cursor are converted by the ordered fields, a tampered
+        cursor is answered with a 404 like an undecodable one.
+        """
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError(position)
+            values = [
+                self.to_python(queryset, field.lstrip('-'), value) for field, value in zip(ordering, values)
+            ]
+        except (ValueError, TypeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        keyset = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            attr = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            keyset |= equal & Q(**{f"{attr}__{lookup}": value})
+            equal &= Q(**{attr: value})
+
+        leading = ordering[0]
+        lookup = 'lte' if leading.startswith('-') else 'gte'
+        return Q(**{f"{leading.lstrip('-')}__{lookup}": values[0]}) & keyset
+
+    def to_python(self, queryset, attr, value):
+        """
+        Convert a value of the cursor with the field (or annotation) it orders on.
+        """
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            raise TypeError(value)
+        annotation = queryset.query.annotations.get(attr)
+        if annotation is not None:
+            return annotation.output_field.to_python(value)
+        model = queryset.model
+        field = None
+        try:
+            for name in attr.split('__'):
+                field = model._meta.get_field('id' if name == 'pk' else name)
+                model = field.related_model or model
+        except FieldDoesNotExist:
+            return value
+        if field.is_relation:
+            field = field.target_field
+        return field.to_python(value)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            attr = field.lstrip('-')
+            value = instance[attr] if isinstance(instance, dict) else getattr(instance, attr)
+            values.append(str(value))
+        return json.dumps(values)
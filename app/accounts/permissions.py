@@ -1,6 +1,65 @@
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework import permissions
 from allauth.account.models import EmailAddress
 
+from .cache import cache_call
+
+EMAIL_VERIFIED_CACHE_KEY = 'accounts:email-verified:{user_id}'
+
+
+def is_email_verified(user):
+    """
+    Return whether the user has a verified email address.
+    The flag is memoized on the user object for the current request and shared
+    between processes through the cache for EMAIL_VERIFIED_CACHE_TIMEOUT seconds,
+    when the cache is shared by the workers (SHARED_CACHE_ENABLED): otherwise a
+    change of the email would only be seen by the worker that handled it.
+    """
+    if hasattr(user, '_email_verified'):
+        return user._email_verified
+
+    if not settings.SHARED_CACHE_ENABLED:
+        user._email_verified = EmailAddress.objects.filter(user=user, verified=True).exists()
+        return user._email_verified
+
+    key = EMAIL_VERIFIED_CACHE_KEY.format(user_id=user.pk)
+    verified = cache.get(key)
+    if verified is None:
+        verified = EmailAddress.objects.filter(user=user, verified=True).exists()
+        cache.set(key, verified, settings.EMAIL_VERIFIED_CACHE_TIMEOUT)
+
+    user._email_verified = verified
+    return verified
+
+
+async def ais_email_verified(user):
+    """
+    Async version of `is_email_verified`.
+    """
+    if hasattr(user, '_email_verified'):
+        return user._email_verified
+
+    if not settings.SHARED_CACHE_ENABLED:
+        user._email_verified = await EmailAddress.objects.filter(user=user, verified=True).aexists()
+        return user._email_verified
+
+    key = EMAIL_VERIFIED_CACHE_KEY.format(user_id=user.pk)
+    verified = await cache_call(cache, 'get', key)
+    if verified is None:
+        verified = await EmailAddress.objects.filter(user=user, verified=True).aexists()
+        await cache_call(cache, 'set', key, verified, settings.EMAIL_VERIFIED_CACHE_TIMEOUT)
+
+    user._email_verified = verified
+    return verified
+
+
+def invalidate_email_verified(user_id):
+    """
+    Drop the cached email verified flag of a user.
+    """
+    cache.delete(EMAIL_VERIFIED_CACHE_KEY.format(user_id=user_id))
+
 
 class IsActiveAndVerified(permissions.BasePermission):
     """
@@ -16,7 +75,13 @@ class IsActiveAndVerified(permissions.BasePermission):
             return False
 
         # Check if the email is verified
-        if not EmailAddress.objects.filter(user=user, verified=True).exists():
+        if not is_email_verified(user):
             return False
 
         return True
+
+    async def ahas_permission(self, request, view):
+        user = request.user
+        if not user.is_authenticated or not user.is_active:
+            return False
+        return await ais_email_verified(user)
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import time
+import zlib
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.db import DatabaseError, connections
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.urls import get_resolver
+
+# File of STATIC_ROOT holding the hash of the static files it was collected from.
+STATIC_HASH_FILE = '.static-hash'
+
+# Key of the PostgreSQL advisory lock held while migrating, so containers starting
+# together do not apply the same migrations.
+MIGRATE_LOCK_KEY = zlib.crc32(b'accounts.preflight.migrate')
+
+
+def get_pending_migrations(using='default'):
+    """
+    Return the sorted (app label, name) of the migrations not applied yet. The
+    migration files are read from disk, the applied ones with a single query (all of
+    them are pending when the migrations table does not exist).
+    """
+    connection = connections[using]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT app, name FROM {connection.ops.quote_name(MigrationRecorder.Migration._meta.db_table)}"
+            )
+            applied = set(cursor.fetchall())
+    except DatabaseError:
+        applied = set()
+
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    pending = []
+    for key, migration in loader.disk_migrations.items():
+        if key in applied:
+            continue
+        # Squashed migrations are applied when the migrations they replace are.
+        if migration.replaces and all(tuple(replaced) in applied for replaced in migration.replaces):
+            continue
+        # Migrations replaced by a squashed migration are applied through it.
+        if key not in loader.graph.nodes:
+            continue
+        pending.append(key)
+    return sorted(pending)
+
+
+def migrate(using='default'):
+    """
+    Apply the pending migrations, holding an advisory lock on PostgreSQL so only one
+    of the containers starting together migrates. Returns the migrations that were
+    pending, an empty list when there was nothing to do.
+    """
+    pending = get_pending_migrations(using)
+    if not pending:
+        return []
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        call_command('migrate', database=using, interactive=False, verbosity=0)
+        return pending
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(%s)', [MIGRATE_LOCK_KEY])
+        try:
+            # Another container may have migrated while we waited for the lock.
+            pending = get_pending_migrations(using)
+            if pending:
+                call_command('migrate', database=using, interactive=False, verbosity=0)
+        finally:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [MIGRATE_LOCK_KEY])
+    return pending
+
+
+def get_static_hash():
+    """
+    Return a hash of the static files found by the static files finders: their
+    paths, sizes and modification times.
+    """
+    digest = hashlib.sha256()
+    for finder in finders.get_finders():
+        for path, storage in finder.list([]):
+            stat = os.stat(storage.path(path))
+            digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def collect_static(force=False):
+    """
+    Run collectstatic unless STATIC_ROOT was already collected from the same static
+    files. Returns whether the files were collected.
+    """
+    hash_file = os.path.join(settings.STATIC_ROOT, STATIC_HASH_FILE)
+    static_hash = get_static_hash()
+    if not force:
+        try:
+            with open(hash_file, encoding='utf-8') as current:
+                if current.read().strip() == static_hash:
+                    return False
+        except FileNotFoundError:
+            pass
+    call_command('collectstatic', interactive=False, verbosity=0)
+    with open(hash_file, 'w', encoding='utf-8') as current:
+        current.write(static_hash)
+    return True
+
+
+def warm_up():
+    """
+    Do the work the first requests of a process would otherwise pay for: populate
+    the URL resolvers, build the fields of the API serializers and open the
+    database connections (filling the pools up to DB_POOL_MIN_SIZE). Returns the
+    seconds spent on each step.
+    Called by each Gunicorn worker before it accepts requests (gunicorn.conf.py).
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    resolver = get_resolver()
+    resolver.reverse_dict  # Populates the resolver and its includes.
+    timings['urls'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    from .urls import router
+
+    for _, viewset, _ in router.registry:
+        viewset.serializer_class().fields
+    timings['serializers'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for alias in connections:
+        connection = connections[alias]
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            pool.open(wait=True, timeout=settings.DB_POOL_TIMEOUT)
+        connection.ensure_connection()
+        if not connection.in_atomic_block:
+            # Back to the pool: the requests run on other threads.
+            connection.close()
+    timings['database'] = time.perf_counter() - started
+    return timings
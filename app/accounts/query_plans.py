@@ -0,0 +1,209 @@
+from django.conf import settings
+from django.db.models import Count, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import (
+    MaintenanceIntervention,
+    Software,
+    Installation
+)
+
+
+class QueryPlan:
+    """
+    Describes how a queryset has to be loaded for a given viewset action.
+    Fields:
+    - select_related: Forward relations joined in the main query
+    - prefetch_related: Relations (or Prefetch objects) loaded with one extra query each
+    - only: Columns loaded for the main model (all columns when empty)
+    - expand: Mapping of serializer field name to the relation (select_related lookup
+      or Prefetch object) loaded when the field is expanded with `?expand=`
+    - annotate: Mapping of serializer field name to the expression annotated for it
+    Lookups and columns belong to the serializer field named by their first path segment
+    (or by the `field` of a LatestPrefetch).
+    """
+
+    def __init__(self, select_related=(), prefetch_related=(), only=(), expand=None, annotate=None):
+        self.select_related = tuple(select_related)
+        self.prefetch_related = tuple(prefetch_related)
+        self.only = tuple(only)
+        self.expand = expand or {}
+        self.annotate = annotate or {}
+
+    def apply(self, queryset):
+        """
+        Return the queryset loaded according to this plan.
+        """
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only:
+            queryset = queryset.only(*self.only)
+        if self.annotate:
+            queryset = queryset.annotate(**self.annotate)
+        return queryset
+
+    def restrict(self, fields=None, expand=()):
+        """
+        Return the plan loading only what the given serializer fields need.
+        - fields: Names of the serialized fields, None for all of them
+        - expand: Names of the fields serialized as nested objects
+        """
+        def is_serialized(lookup):
+            return fields is None or field_name(lookup) in fields
+
+        expanded = {
+            name: lookup for name, lookup in self.expand.items()
+            if name in expand and is_serialized(name)
+        }
+        select_related = [
+            lookup for lookup in self.select_related
+            if is_serialized(lookup) and field_name(lookup) not in expanded
+        ]
+        prefetch_related = [
+            lookup for lookup in self.prefetch_related
+            if is_serialized(lookup) and field_name(lookup) not in expanded
+        ]
+        for lookup in expanded.values():
+            if isinstance(lookup, Prefetch):
+                prefetch_related.append(lookup)
+            else:
+                select_related.append(lookup)
+        only = [
+            column for column in self.only
+            if column == 'id' or is_serialized(column)
+        ]
+        annotate = {
+            name: expression for name, expression in self.annotate.items()
+            if is_serialized(name)
+        }
+        return QueryPlan(select_related, prefetch_related, only, self.expand, annotate)
+
+
+class LatestPrefetch(Prefetch):
+    """
+    Prefetch of the latest EMBEDDED_ITEMS related objects of every instance (bounded
+    embed), in the order of `queryset`. Django fetches a sliced prefetch with one
+    window function query, and only into a `to_attr`.
+    - field: Serializer field the embedded objects belong to
+    """
+
+    def __init__(self, field, lookup, queryset, to_attr):
+        super().__init__(lookup, queryset=queryset, to_attr=to_attr)
+        self.field = field
+
+    def get_current_querysets(self, level):
+        querysets = super().get_current_querysets(level)
+        if querysets is None:
+            return None
+        return [queryset[:settings.EMBEDDED_ITEMS] for queryset in querysets]
+
+
+def count_related(queryset, field):
+    """
+    Return the number of rows of `queryset` whose `field` references the outer row,
+    as a correlated subquery to annotate (one index scan per row, no GROUP BY on the
+    outer query).
+    """
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+        count=Count('*')
+    ).values('count')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def field_name(lookup):
+    """
+    Return the name of the field a lookup, column or Prefetch object starts from.
+    """
+    if isinstance(lookup, LatestPrefetch):
+        return lookup.field
+    if isinstance(lookup, Prefetch):
+        lookup = lookup.prefetch_to
+    return lookup.split('__')[0]
+
+
+# Columns serialized by each serializer, used to restrict the SELECT lists.
+DEVICE_COLUMNS = (
+    'id', 'device_id', 'user', 'brand', 'name', 'serial_number', 'status',
+    'purchase_date', 'assigned_to'
+)
+MAINTENANCE_INTERVENTION_COLUMNS = (
+    'id', 'device', 'description', 'date_intervention', 'status', 'technician'
+)
+SOFTWARE_COLUMNS = (
+    'id', 'name', 'version', 'supplier', 'license_key', 'expire_date', 'max_installations', 'installed_count'
+)
+SOFTWARE_SUMMARY_COLUMNS = ('id', 'name', 'version', 'expire_date')
+DEVICE_SUMMARY_COLUMNS = ('id', 'device_id', 'brand', 'name', 'serial_number', 'status')
+INSTALLATION_COLUMNS = (
+    'id', 'installed_at', 'device', *(f"device__{column}" for column in DEVICE_SUMMARY_COLUMNS)
+)
+USER_COLUMNS = (
+    'id', 'username', 'password', 'email', 'first_name', 'last_name',
+    'gender', 'telephone', 'department__id', 'department__name'
+)
+
+
+USER_READ_PLAN = QueryPlan(
+    select_related=('department',),
+    only=USER_COLUMNS,
+)
+
+MAINTENANCE_INTERVENTION_READ_PLAN = QueryPlan(
+    only=MAINTENANCE_INTERVENTION_COLUMNS,
+)
+
+DEVICE_READ_PLAN = QueryPlan(
+    prefetch_related=(
+        LatestPrefetch(
+            'maintenance_interventions',
+            'maintenance_interventions',
+            queryset=MaintenanceIntervention.objects.only(*MAINTENANCE_INTERVENTION_COLUMNS).order_by(
+                '-date_intervention', '-id'
+            ),
+            to_attr='latest_maintenance_interventions'
+        ),
+        Prefetch('softwares', queryset=Software.objects.only('id')),
+    ),
+    only=DEVICE_COLUMNS,
+    expand={
+        'user': 'user',
+        'assigned_to': 'assigned_to',
+        'softwares': Prefetch('softwares', queryset=Software.objects.only(*SOFTWARE_SUMMARY_COLUMNS)),
+    },
+    annotate={
+        'maintenance_interventions_count': count_related(MaintenanceIntervention.objects.all(), 'device'),
+    },
+)
+
+SOFTWARE_READ_PLAN = QueryPlan(
+    prefetch_related=(
+        LatestPrefetch(
+            'installed_on',
+            'installations',
+            queryset=Installation.objects.select_related('device').only(
+                'software', 'installed_at', 'device__id'
+            ).order_by('-installed_at', '-id'),
+            to_attr='latest_installations'
+        ),
+    ),
+    only=SOFTWARE_COLUMNS,
+    expand={
+        'supplier': 'supplier',
+        'installed_on': LatestPrefetch(
+            'installed_on',
+            'installations',
+            queryset=Installation.objects.select_related('device').only('software', *INSTALLATION_COLUMNS).order_by(
+                '-installed_at', '-id'
+            ),
+            to_attr='latest_installations'
+        ),
+    },
+)
+
+INSTALLATION_READ_PLAN = QueryPlan(
+    select_related=('device',),
+    only=INSTALLATION_COLUMNS,
+)
+
@@ -0,0 +1,87 @@
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast, Greatest, Upper
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+# Name of the annotation holding the relevance of a search result. KeysetPagination
+# orders by it whenever it is present.
+SEARCH_RANK = 'search_rank'
+
+# Trigram indexes can only narrow down words of at least three characters, a term
+# made of shorter words only would scan the whole index.
+MIN_SEARCH_LENGTH = 3
+MAX_SEARCH_LENGTH = 100
+MAX_SEARCH_WORDS = 5
+
+
+def clean_search_term(term, param='search'):
+    """
+    Return the words of the search term, raising ValidationError when the term can
+    not be looked up through the trigram indexes.
+    """
+    words = term.split()
+    if not any(len(word) >= MIN_SEARCH_LENGTH for word in words):
+        raise ValidationError({param: f"Enter at least one word of {MIN_SEARCH_LENGTH} characters."})
+    if len(term) > MAX_SEARCH_LENGTH or len(words) > MAX_SEARCH_WORDS:
+        raise ValidationError({
+            param: f"Enter at most {MAX_SEARCH_WORDS} words and {MAX_SEARCH_LENGTH} characters."
+        })
+    return words
+
+
+def search_queryset(queryset, fields, words):
+    """
+    Return the rows of the queryset matching every word on any of the fields, ranked
+    by relevance.
+    A word matches a field when the field contains it (ILIKE) or contains a similar
+    word (pg_trgm `%>` operator, which tolerates typos). Both conditions are applied
+    to UPPER(field), so they are answered by the `gin_trgm_ops` index declared on that
+    expression. The rank is the mean, over the words, of their best word similarity
+    with the fields, cast to double precision so the pagination cursor can compare
+    it exactly.
+    """
+    match = Q()
+    similarities = []
+    for word in words:
+        word_match = Q()
+        for field in fields:
+            word_match |= Q(**{f"{field}__icontains": word})
+            if len(word) >= MIN_SEARCH_LENGTH:
+                word_match |= Q(TrigramWordSimilar(Upper(field), word))
+        match &= word_match
+        field_similarities = [TrigramWordSimilarity(word, field) for field in fields]
+        similarities.append(
+            Greatest(*field_similarities) if len(field_similarities) > 1 else field_similarities[0]
+        )
+    rank = sum(similarities[1:], similarities[0]) / len(similarities)
+    return queryset.filter(match).annotate(
+        **{SEARCH_RANK: Cast(rank, FloatField())}
+    ).order_by(f"-{SEARCH_RANK}", 'id')
+
+
+class TrigramSearchFilter(BaseFilterBackend):
+    """
+    Filter backend adding `?search=` to the viewsets declaring `search_fields`.
+    Results are ranked by relevance, see `search_queryset`.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = getattr(view, 'search_fields', None)
+        term = request.query_params.get(self.search_param, '').strip()
+        if not search_fields or not term:
+            return queryset
+        return search_queryset(queryset, search_fields, clean_search_term(term, self.search_param))
+
+    def get_schema_operation_parameters(self, view):
+        if not getattr(view, 'search_fields', None):
+            return []
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': f"Ranked search on {', '.join(view.search_fields)}.",
+            'schema': {'type': 'string', 'minLength': MIN_SEARCH_LENGTH},
+        }]
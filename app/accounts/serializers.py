@@ -1,23 +1,223 @@
+from collections import defaultdict
+from collections.abc import Mapping
+
 from dj_rest_auth.registration.serializers import RegisterSerializer
-from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import permissions, serializers
+from rest_framework.fields import empty
+from rest_framework.relations import MANY_RELATION_KWARGS
 
-from .constants import GENDER_CHOICES, NONE
+from . import bulk
+from .constants import GENDER_CHOICES, NONE, STATUS_DEVICE_CHOICES
+from .metrics import measure_serialization
 from .models import (
     Department,
     User,
     MaintenanceIntervention,
     Device,
     Supplier,
-    Software
+    Software,
+    Installation
 )
 
 
+def parse_field_list(request, param):
+    """
+    Return the set of names of a comma separated query parameter, None if missing.
+    """
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def get_requested_fields(request):
+    """
+    Return the fields requested with `?fields=`, None when every field is requested.
+    Sparse fieldsets only apply to read requests.
+    """
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return None
+    return parse_field_list(request, 'fields')
+
+
+def get_expanded_fields(request):
+    """
+    Return the relations requested as nested objects with `?expand=`.
+    """
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return set()
+    return parse_field_list(request, 'expand') or set()
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin for sparse fieldsets and opt-in expansion on read requests.
+    - `?fields=id,name` serializes only the listed fields
+    - `?expand=supplier` serializes the listed relations as nested objects instead of
+      primary keys. Expandable relations are declared in `Meta.expandable_fields` as
+      a mapping of field name to (serializer class, serializer kwargs).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+
+        expand = get_expanded_fields(request)
+        for name, (serializer_class, options) in getattr(self.Meta, 'expandable_fields', {}).items():
+            if name in expand and name in self.fields:
+                self.fields[name] = serializer_class(read_only=True, **options)
+
+        fields = get_requested_fields(request)
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class TimedSerializerMixin:
+    """
+    Serializer mixin counting the time spent in `to_representation` in the
+    serialization time of the sampled requests (accounts.metrics).
+    """
+
+    def to_representation(self, instance):
+        with measure_serialization():
+            return super().to_representation(instance)
+
+
+def get_identity_map(context, queryset):
+    """
+    Return the objects of `queryset` already read in this request, {pk: object, or
+    None when it does not exist}. The map is shared by the querysets of the same
+    model with the same filters, and kept on the request (or on the serializer
+    context, without a request).
+    """
+    request = context.get('request')
+    if request is not None:
+        maps = request.__dict__.setdefault('_related_objects', {})
+    else:
+        maps = context.setdefault('_related_objects', {})
+    return maps.setdefault((queryset.model._meta.label, str(queryset.query.where)), {})
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """
+    ManyRelatedField resolving all the ids of the list with one query.
+    - read_source: Attribute of the instance serialized instead of the relation, e.g.
+      its latest related objects only (bounded embed), the input still sets the relation
+    """
+
+    def __init__(self, read_source=None, **kwargs):
+        self.read_source = read_source
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        if self.read_source is None or instance.pk is None:
+            return super().get_attribute(instance)
+        return getattr(instance, self.read_source)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) and hasattr(data, '__iter__'):
+            self.child_relation.resolve(data)
+        return super().to_internal_value(data)
+
+
+class BatchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField reading its objects through the identity map of the
+    request (`get_identity_map`): ids already resolved in the request cost no
+    query, the others are read with one IN query, for a whole list with `many=True`.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'read_source': kwargs.pop('read_source', None)}
+        list_kwargs['child_relation'] = cls(*args, **kwargs)
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def to_pk(self, data):
+        """
+        Return the primary key of an input value, None when it is not a valid one.
+        """
+        if isinstance(data, bool):
+            return None
+        model = (self.queryset if self.queryset is not None else self.get_queryset()).model
+        try:
+            if self.pk_field is not None:
+                data = self.pk_field.to_internal_value(data)
+            return model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError, serializers.ValidationError):
+            return None
+
+    def resolve(self, values, queryset=None):
+        """
+        Read the objects of the given input values missing from the identity map,
+        with one IN query, and return the map.
+        """
+        queryset = self.get_queryset() if queryset is None else queryset
+        objects = get_identity_map(self.context, queryset)
+        missing = {pk for pk in map(self.to_pk, values) if pk is not None and pk not in objects}
+        if missing:
+            objects.update(dict.fromkeys(missing))
+            objects.update((obj.pk, obj) for obj in queryset.filter(pk__in=missing))
+        return objects
+
+    def to_internal_value(self, data):
+        pk = self.to_pk(data)
+        if pk is None:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = self.resolve([pk]).get(pk)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
+class BatchedRelationsMixin:
+    """
+    Serializer mixin resolving the ids of all the related fields of the input before
+    validating it, with one IN query per model and filter (`resolve_relations`).
+    BulkListSerializer resolves those of all its items at once.
+    """
+    serializer_related_field = BatchedPrimaryKeyRelatedField
+
+    def to_internal_value(self, data):
+        if isinstance(data, Mapping):
+            self.resolve_relations([data])
+        return super().to_internal_value(data)
+
+    def resolve_relations(self, items):
+        values = defaultdict(list)
+        relations = {}
+        for field in self._writable_fields:
+            relation = getattr(field, 'child_relation', field)
+            if not isinstance(relation, BatchedPrimaryKeyRelatedField):
+                continue
+            queryset = relation.get_queryset()
+            key = (queryset.model._meta.label, str(queryset.query.where))
+            relations.setdefault(key, (relation, queryset))
+            for item in items:
+                value = field.get_value(item) if isinstance(item, Mapping) else empty
+                if value is empty or value is None:
+                    continue
+                if relation is field:
+                    values[key].append(value)
+                elif not isinstance(value, str) and hasattr(value, '__iter__'):
+                    values[key].extend(value)
+        for key, (relation, queryset) in relations.items():
+            if values[key]:
+                relation.resolve(values[key], queryset)
+
+
 class CustomRegisterSerializer(RegisterSerializer):
     first_name = serializers.CharField(max_length=30, required=False)
     last_name = serializers.CharField(max_length=150, required=False)
     gender = serializers.ChoiceField(choices=GENDER_CHOICES, required=False, default=NONE)
     telephone = serializers.CharField(max_length=20, required=False)
-    department = serializers.PrimaryKeyRelatedField(
+    department = BatchedPrimaryKeyRelatedField(
         queryset=Department.objects.all(),
         required=False,
         allow_null=True
@@ -48,15 +248,15 @@ class CustomRegisterSerializer(RegisterSerializer):
         return user
 
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Department
         fields = ['id', 'name']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, BatchedRelationsMixin, serializers.ModelSerializer):
     department = DepartmentSerializer(read_only=True)
-    department_id = serializers.PrimaryKeyRelatedField(
+    department_id = BatchedPrimaryKeyRelatedField(
         queryset=Department.objects.all(),
         source='department',
         write_only=True
@@ -70,9 +270,27 @@ class UserSerializer(serializers.ModelSerializer):
         ]
 
 
-class MaintenanceInterventionSerializer(serializers.ModelSerializer):
-    device = serializers.PrimaryKeyRelatedField(queryset=Device.objects.all())
-    technician = serializers.PrimaryKeyRelatedField(
+class UserSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'email', 'first_name', 'last_name']
+
+
+class DeviceSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Device
+        fields = ['id', 'device_id', 'brand', 'name', 'serial_number', 'status']
+
+
+class SoftwareSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Software
+        fields = ['id', 'name', 'version', 'expire_date']
+
+
+class MaintenanceInterventionSerializer(TimedSerializerMixin, BatchedRelationsMixin, serializers.ModelSerializer):
+    device = BatchedPrimaryKeyRelatedField(queryset=Device.objects.all())
+    technician = BatchedPrimaryKeyRelatedField(
         queryset=User.objects.filter(is_staff=True), allow_null=True, required=False
     )
 
@@ -81,42 +299,214 @@ class MaintenanceInterventionSerializer(serializers.ModelSerializer):
         fields = ['id', 'device', 'description', 'date_intervention', 'status', 'technician']
 
 
-class DeviceSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
-    assigned_to = serializers.PrimaryKeyRelatedField(
+class DeviceSerializer(TimedSerializerMixin, DynamicFieldsMixin, BatchedRelationsMixin, serializers.ModelSerializer):
+    user = BatchedPrimaryKeyRelatedField(queryset=User.objects.all())
+    assigned_to = BatchedPrimaryKeyRelatedField(
         queryset=User.objects.all(),
         allow_null=True,
         required=False
     )
-    maintenance_interventions = MaintenanceInterventionSerializer(many=True, read_only=True)
-    softwares = serializers.PrimaryKeyRelatedField(many=True, queryset=Software.objects.all(), required=False)
+    maintenance_interventions = MaintenanceInterventionSerializer(
+        source='latest_maintenance_interventions', many=True, read_only=True
+    )
+    maintenance_interventions_count = serializers.IntegerField(read_only=True)
+    softwares = BatchedPrimaryKeyRelatedField(many=True, queryset=Software.objects.all(), required=False)
     device_id = serializers.UUIDField(read_only=True)
 
     class Meta:
         model = Device
         fields = [
             'id', 'device_id', 'user', 'brand', 'name', 'serial_number', 'status',
-            'purchase_date', 'assigned_to', 'maintenance_interventions', 'softwares'
+            'purchase_date', 'assigned_to', 'maintenance_interventions', 'maintenance_interventions_count',
+            'softwares'
         ]
+        expandable_fields = {
+            'user': (UserSummarySerializer, {}),
+            'assigned_to': (UserSummarySerializer, {}),
+            'softwares': (SoftwareSummarySerializer, {'many': True}),
+        }
 
 
-class SupplierSerializer(serializers.ModelSerializer):
+class SupplierSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Supplier
         fields = ['id', 'name', 'telephone']
 
 
-class SoftwareSerializer(serializers.ModelSerializer):
-    supplier = serializers.PrimaryKeyRelatedField(queryset=Supplier.objects.all())
-    installed_on = serializers.PrimaryKeyRelatedField(
+class SoftwareSerializer(TimedSerializerMixin, DynamicFieldsMixin, BatchedRelationsMixin, serializers.ModelSerializer):
+    supplier = BatchedPrimaryKeyRelatedField(queryset=Supplier.objects.all())
+    installed_on = BatchedPrimaryKeyRelatedField(
         many=True,
         queryset=Device.objects.all(),
-        required=False
+        required=False,
+        read_source='latest_installed_on'
     )
 
     class Meta:
         model = Software
         fields = [
             'id', 'name', 'version', 'supplier', 'license_key',
-            'expire_date', 'installed_on', 'max_installations'
+            'expire_date', 'installed_on', 'max_installations', 'installed_count'
+        ]
+        read_only_fields = ['installed_count']
+        expandable_fields = {
+            'supplier': (SupplierSerializer, {}),
+            'installed_on': (DeviceSummarySerializer, {'many': True, 'source': 'latest_installed_on'}),
+        }
+
+
+class SoftwareInstallationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Installation of a software, listed by /softwares/{id}/installations/.
+    """
+    device = DeviceSummarySerializer(read_only=True)
+
+    class Meta:
+        model = Installation
+        fields = ['id', 'device', 'installed_at']
+
+
+class UserSearchSerializer(UserSummarySerializer):
+    rank = serializers.FloatField(source='search_rank', read_only=True)
+
+    class Meta(UserSummarySerializer.Meta):
+        fields = UserSummarySerializer.Meta.fields + ['rank']
+
+
+class DeviceSearchSerializer(DeviceSummarySerializer):
+    rank = serializers.FloatField(source='search_rank', read_only=True)
+
+    class Meta(DeviceSummarySerializer.Meta):
+        fields = DeviceSummarySerializer.Meta.fields + ['rank']
+
+
+class SoftwareSearchSerializer(SoftwareSummarySerializer):
+    rank = serializers.FloatField(source='search_rank', read_only=True)
+
+    class Meta(SoftwareSummarySerializer.Meta):
+        fields = SoftwareSummarySerializer.Meta.fields + ['rank']
+
+
+class SupplierSearchSerializer(SupplierSerializer):
+    rank = serializers.FloatField(source='search_rank', read_only=True)
+
+    class Meta(SupplierSerializer.Meta):
+        fields = SupplierSerializer.Meta.fields + ['rank']
+
+
+class DeviceAssignmentSerializer(serializers.Serializer):
+    """
+    Item of a bulk device assignment.
+    """
+    device_id = serializers.IntegerField()
+    user_id = serializers.IntegerField()
+
+
+class DeviceTransitionSerializer(serializers.Serializer):
+    """
+    Item of a bulk device status change.
+    """
+    device_id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=STATUS_DEVICE_CHOICES)
+
+
+class InstallationSerializer(serializers.Serializer):
+    """
+    Item of a bulk software installation or removal.
+    """
+    device_id = serializers.IntegerField()
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    List serializer of the bulk writes of the list endpoints (a JSON array posted or
+    patched to them, see accounts.mixins.BulkWriteMixin).
+    Each item is validated on its own: the invalid ones are rejected with their
+    errors instead of failing the whole list. The related ids of all the items are
+    resolved first, with one query per model (BatchedRelationsMixin). `save` writes the others with one
+    upsert (accounts.bulk.upsert), keyed on `Meta.natural_key` of the child, or on
+    their `id` for partial updates, and returns the result of each item in order.
+    Only the rows of `queryset` (the rows visible to the user) are updated.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list) or not data:
+            raise serializers.ValidationError({'non_field_errors': ['A non empty list of objects is required.']})
+        if len(data) > settings.BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                {'non_field_errors': [f"At most {settings.BULK_MAX_ITEMS} objects are accepted per request."]}
+            )
+        if isinstance(self.child, BatchedRelationsMixin):
+            self.child.resolve_relations(data)
+        self.results = [None] * len(data)
+        self.valid = []
+        validated = []
+        for index, item in enumerate(data):
+            try:
+                if self.partial and not (isinstance(item, dict) and 'id' in item):
+                    raise serializers.ValidationError({'id': ['This field is required.']})
+                validated.append(self.child.run_validation(item))
+                self.valid.append(index)
+            except serializers.ValidationError as e:
+                item_id = item.get('id') if self.partial and isinstance(item, dict) else None
+                self.results[index] = bulk.result(item_id, bulk.REJECTED, e.detail)
+        return validated
+
+    def save(self, queryset=None, **kwargs):
+        if self.validated_data:
+            written = bulk.upsert(self.child.Meta.model, self.validated_data, self.child.Meta.natural_key,
+                                  partial=self.partial, queryset=queryset)
+            for index, item_result in zip(self.valid, written):
+                self.results[index] = item_result
+        return self.results
+
+
+class DeviceBulkSerializer(DeviceSerializer):
+    """
+    Item of a bulk write of devices, identified by device_id (generated when
+    missing). The installed software are not written, see the bulk installations.
+    """
+    id = serializers.IntegerField(required=False)
+    device_id = serializers.UUIDField(required=False)
+    maintenance_interventions = None
+    maintenance_interventions_count = None
+    softwares = None
+
+    class Meta(DeviceSerializer.Meta):
+        fields = [
+            'id', 'device_id', 'user', 'brand', 'name', 'serial_number', 'status',
+            'purchase_date', 'assigned_to'
+        ]
+        list_serializer_class = BulkListSerializer
+        natural_key = ('device_id',)
+
+
+class SupplierBulkSerializer(SupplierSerializer):
+    """
+    Item of a bulk write of suppliers, identified by their telephone.
+    """
+    id = serializers.IntegerField(required=False)
+
+    class Meta(SupplierSerializer.Meta):
+        list_serializer_class = BulkListSerializer
+        natural_key = ('telephone',)
+        # A known telephone updates its supplier instead of failing validation.
+        extra_kwargs = {'telephone': {'validators': []}}
+
+
+class SoftwareBulkSerializer(SoftwareSerializer):
+    """
+    Item of a bulk write of software, identified by name and version. Those do not
+    have to be unique: an item matching several software is rejected, and they are
+    updated by id instead. The installations are not written, see the bulk
+    installations.
+    """
+    id = serializers.IntegerField(required=False)
+    installed_on = None
+
+    class Meta(SoftwareSerializer.Meta):
+        fields = [
+            'id', 'name', 'version', 'supplier', 'license_key', 'expire_date', 'max_installations'
         ]
+        list_serializer_class = BulkListSerializer
+        natural_key = ('name', 'version')
@@ -0,0 +1,235 @@
+from allauth.account.models import EmailAddress
+from allauth.account.signals import email_confirmed
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user_tokens
+from . import stats
+from .cache import bump_generation_on_commit
+from .models import (
+    Department,
+    User,
+    MaintenanceIntervention,
+    Device,
+    Supplier,
+    Software
+)
+from .permissions import invalidate_email_verified
+
+
+@receiver(post_save, sender=EmailAddress)
+@receiver(post_delete, sender=EmailAddress)
+def email_address_changed(sender, instance, **kwargs):
+    """
+    Invalidate the cached email verified flag when an email address changes.
+    """
+    invalidate_email_verified(instance.user_id)
+
+
+@receiver(email_confirmed)
+def email_address_confirmed(sender, request, email_address, **kwargs):
+    """
+    Invalidate the cached email verified flag as soon as an email is confirmed.
+    """
+    invalidate_email_verified(email_address.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """
+    Invalidate the cached token on logout or token revocation.
+    """
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    """
+    Invalidate the cached tokens of a user when the user changes (deactivation,
+    password change, permissions). Saving only the last login date, as done on
+    every login, keeps the cached tokens.
+    """
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate_user_tokens(instance.pk)
+
+
+def touch(queryset):
+    """
+    Bump `updated_at` of the rows of a queryset, without loading them.
+    """
+    queryset.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=MaintenanceIntervention)
+@receiver(post_delete, sender=MaintenanceIntervention)
+def intervention_changed(sender, instance, **kwargs):
+    """
+    Devices embed their interventions, so a changed intervention changes its device.
+    """
+    touch(Device.objects.filter(pk=instance.device_id))
+
+
+@receiver(pre_delete, sender=Device)
+def device_deleted(sender, instance, **kwargs):
+    """
+    Software lists the devices it is installed on, and the cascade on the
+    installations table does not send m2m_changed.
+    """
+    touch(Software.objects.filter(installed_on=instance))
+
+
+@receiver(m2m_changed, sender=Software.installed_on.through)
+def installations_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Both sides of the installations embed each other, bump them on every change.
+    """
+    if action in ('post_add', 'post_remove'):
+        touch(instance.__class__.objects.filter(pk=instance.pk))
+        touch(model.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        touch(instance.__class__.objects.filter(pk=instance.pk))
+        if reverse:
+            touch(Software.objects.filter(installed_on=instance))
+        else:
+            touch(Device.objects.filter(softwares=instance))
+
+
+def generation_changed(sender, **kwargs):
+    """
+    Invalidate the cached responses depending on the changed model.
+    """
+    bump_generation_on_commit(sender)
+
+
+def installations_generation_changed(sender, **kwargs):
+    bump_generation_on_commit(Device)
+    bump_generation_on_commit(Software)
+
+
+for model in (Department, User, MaintenanceIntervention, Device, Supplier, Software):
+    post_save.connect(generation_changed, sender=model, dispatch_uid=f"generation-save-{model._meta.label_lower}")
+    post_delete.connect(generation_changed, sender=model, dispatch_uid=f"generation-delete-{model._meta.label_lower}")
+m2m_changed.connect(
+    installations_generation_changed,
+    sender=Software.installed_on.through,
+    dispatch_uid='generation-installations'
+)
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=MaintenanceIntervention)
+@receiver(pre_save, sender=Device)
+@receiver(pre_save, sender=Software)
+def tracked_model_saving(sender, instance, raw=False, **kwargs):
+    """
+    Make sure the values before the save are known to the summary counters.
+    """
+    if not raw and not instance._state.adding:
+        instance.get_loaded_values()
+
+
+@receiver(pre_save, sender=Software, dispatch_uid='software-expiry-renewed')
+def software_renewing(sender, instance, raw=False, **kwargs):
+    """
+    A renewed license (new expiry date) is listed again in the expiry digests.
+    """
+    if raw or instance._state.adding:
+        return
+    if instance.get_loaded_values().get('expire_date') != instance.expire_date:
+        instance.expiry_notified_on = None
+
+
+@receiver(post_save, sender=Device, dispatch_uid='stats-device-save')
+def device_counted(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    stats.device_saved(instance, created, instance.get_loaded_values() if not created else {})
+    instance.remember_loaded_values()
+
+
+@receiver(post_delete, sender=Device, dispatch_uid='stats-device-delete')
+def device_uncounted(sender, instance, **kwargs):
+    stats.device_deleted(instance)
+
+
+@receiver(post_save, sender=MaintenanceIntervention, dispatch_uid='stats-intervention-save')
+def intervention_counted(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    stats.intervention_saved(instance, created, instance.get_loaded_values() if not created else {})
+    instance.remember_loaded_values()
+
+
+@receiver(post_delete, sender=MaintenanceIntervention, dispatch_uid='stats-intervention-delete')
+def intervention_uncounted(sender, instance, **kwargs):
+    stats.intervention_deleted(instance)
+
+
+@receiver(post_save, sender=Software, dispatch_uid='stats-software-save')
+def software_counted(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    stats.software_saved(instance, created, instance.get_loaded_values() if not created else {})
+    instance.remember_loaded_values()
+
+
+@receiver(pre_delete, sender=Software, dispatch_uid='stats-software-delete')
+def software_uncounted(sender, instance, **kwargs):
+    stats.software_deleted(instance)
+
+
+@receiver(pre_delete, sender=Device, dispatch_uid='stats-device-installations-delete')
+def device_installations_uncounted(sender, instance, **kwargs):
+    """
+    The cascade on the installations table does not send m2m_changed.
+    """
+    software_ids = Software.installed_on.through.objects.filter(device=instance).values_list('software_id', flat=True)
+    stats.installations_changed({software_id: -1 for software_id in software_ids})
+
+
+@receiver(m2m_changed, sender=Software.installed_on.through, dispatch_uid='stats-installations')
+def installations_counted(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Added rows are counted once inserted (pk_set then only holds the new ones);
+    removed rows are counted before the deletion, when they can still be read.
+    """
+    through = Software.installed_on.through.objects
+    if action == 'post_add':
+        if reverse:
+            stats.installations_changed({software_id: 1 for software_id in pk_set})
+        else:
+            stats.installations_changed({instance.pk: len(pk_set)})
+    elif action in ('pre_remove', 'pre_clear'):
+        if reverse:
+            rows = through.filter(device_id=instance.pk)
+            if action == 'pre_remove':
+                rows = rows.filter(software_id__in=pk_set)
+            stats.installations_changed({software_id: -1 for software_id in rows.values_list('software_id', flat=True)})
+        else:
+            rows = through.filter(software_id=instance.pk)
+            if action == 'pre_remove':
+                rows = rows.filter(device_id__in=pk_set)
+            stats.installations_changed({instance.pk: -rows.count()})
+
+
+@receiver(post_save, sender=User, dispatch_uid='stats-user-save')
+def user_department_counted(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    old_department_id = instance.get_loaded_values().get('department_id')
+    if old_department_id != instance.department_id:
+        stats.user_department_changed(instance, old_department_id)
+    instance.remember_loaded_values()
+
+
+@receiver(pre_delete, sender=User, dispatch_uid='stats-user-delete')
+def user_uncounted(sender, instance, **kwargs):
+    stats.user_deleted(instance)
+
+
+@receiver(pre_delete, sender=Department, dispatch_uid='stats-department-delete')
+def department_uncounted(sender, instance, **kwargs):
+    stats.department_deleted(instance)
@@ -0,0 +1,425 @@
+from collections import Counter
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .constants import OPEN_MAINTENANCE_STATUSES
+from .models import (
+    Department,
+    User,
+    MaintenanceIntervention,
+    Device,
+    Software,
+    SummaryCounter
+)
+
+# Metrics of the summary counters and the meaning of their keys:
+# - devices: "<status>:<department id of the assignee>" (empty id when unassigned
+#   or when the assignee has no department)
+# - interventions: "<status>"
+# - software: "installations" (rows of the installations table), "seats" (sum of
+#   max_installations) and "at_capacity" (software with no installation left).
+#   `check` and `rebuild` also cover the installed_count of every software, as
+#   "installed_count:<software id>" differences.
+DEVICES = 'devices'
+INTERVENTIONS = 'interventions'
+SOFTWARE = 'software'
+METRICS = (DEVICES, INTERVENTIONS, SOFTWARE)
+
+INSTALLATIONS = 'installations'
+SEATS = 'seats'
+AT_CAPACITY = 'at_capacity'
+INSTALLED_COUNT = 'installed_count'
+
+
+def device_key(status, department_id):
+    return f"{status}:{department_id or ''}"
+
+
+def apply_deltas(deltas):
+    """
+    Add the deltas, a mapping of (metric, key) to an integer, to the counters.
+    Runs in the transaction of the write that caused them, so the counters commit
+    or roll back together with the data. Counters are updated in key order, so
+    concurrent writers always lock the rows in the same order.
+    """
+    for (metric, key), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        counter = SummaryCounter.objects.filter(metric=metric, key=key)
+        if counter.update(value=F('value') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                SummaryCounter.objects.create(metric=metric, key=key, value=delta)
+        except IntegrityError:
+            # Created by a concurrent transaction in the meantime.
+            counter.update(value=F('value') + delta)
+
+
+def get_departments(user_ids):
+    """
+    Return the department id of each of the given users.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    return dict(User.objects.filter(pk__in=user_ids).values_list('pk', 'department_id'))
+
+
+def device_saved(device, created, loaded):
+    """
+    Move a created or updated device to its current status and department.
+    - loaded: Values of the tracked fields before the save
+    """
+    old_status, old_assigned_to_id = loaded.get('status'), loaded.get('assigned_to_id')
+    if not created and (old_status, old_assigned_to_id) == (device.status, device.assigned_to_id):
+        return
+    departments = get_departments([device.assigned_to_id, old_assigned_to_id])
+    deltas = Counter()
+    deltas[(DEVICES, device_key(device.status, departments.get(device.assigned_to_id)))] += 1
+    if not created:
+        deltas[(DEVICES, device_key(old_status, departments.get(old_assigned_to_id)))] -= 1
+    apply_deltas(deltas)
+
+
+def devices_saved(created, updated):
+    """
+    Bulk version of `device_saved`, for devices written without signals.
+    - updated: Updated devices, with the values they were loaded with
+    """
+    loaded = [device.get_loaded_values() for device in updated]
+    departments = get_departments([device.assigned_to_id for device in created + updated] +
+                                  [values.get('assigned_to_id') for values in loaded])
+    deltas = Counter()
+    for device in created + updated:
+        deltas[(DEVICES, device_key(device.status, departments.get(device.assigned_to_id)))] += 1
+    for values in loaded:
+        deltas[(DEVICES, device_key(values.get('status'), departments.get(values.get('assigned_to_id'))))] -= 1
+    apply_deltas(deltas)
+
+
+def device_deleted(device):
+    department_id = get_departments([device.assigned_to_id]).get(device.assigned_to_id)
+    apply_deltas({(DEVICES, device_key(device.status, department_id)): -1})
+
+
+def user_department_changed(user, old_department_id):
+    """
+    The devices assigned to a user follow the user to the new department.
+    """
+    deltas = Counter()
+    devices = Device.objects.filter(assigned_to=user).order_by()
+    for status, count in devices.values_list('status').annotate(count=Count('pk')):
+        deltas[(DEVICES, device_key(status, old_department_id))] -= count
+        deltas[(DEVICES, device_key(status, user.department_id))] += count
+    apply_deltas(deltas)
+
+
+def user_deleted(user):
+    """
+    The devices assigned to a deleted user are unassigned (SET_NULL, no signals).
+    Devices also owned by the user are deleted by the cascade, which counts them.
+    """
+    deltas = Counter()
+    devices = Device.objects.filter(assigned_to=user).exclude(user=user).order_by()
+    for status, department_id, count in devices.values_list(
+            'status', 'assigned_to__department').annotate(count=Count('pk')):
+        deltas[(DEVICES, device_key(status, department_id))] -= count
+        deltas[(DEVICES, device_key(status, None))] += count
+    apply_deltas(deltas)
+
+
+def department_deleted(department):
+    """
+    The users of a deleted department are left without one (SET_NULL, no signals),
+    so the counters of the department move to the empty department.
+    """
+    deltas = Counter()
+    suffix = f":{department.pk}"
+    for key, value in SummaryCounter.objects.filter(metric=DEVICES, key__endswith=suffix).values_list('key', 'value'):
+        status = key[:-len(suffix)]
+        deltas[(DEVICES, key)] -= value
+        deltas[(DEVICES, device_key(status, None))] += value
+    apply_deltas(deltas)
+
+
+def intervention_saved(intervention, created, loaded):
+    old_status = loaded.get('status')
+    if not created and old_status == intervention.status:
+        return
+    deltas = Counter({(INTERVENTIONS, intervention.status): 1})
+    if not created:
+        deltas[(INTERVENTIONS, old_status)] -= 1
+    apply_deltas(deltas)
+
+
+def intervention_deleted(intervention):
+    apply_deltas({(INTERVENTIONS, intervention.status): -1})
+
+
+def installations_changed(deltas, counted=False):
+    """
+    Count a change of the installations of some software: add it to their
+    installed_count, with one UPDATE per distinct delta, and to the counters.
+    - deltas: Mapping of software id to the number of installations added (or
+      removed, when negative)
+    - counted: Whether installed_count already includes the change (seats claimed
+      with a conditional UPDATE, see accounts.bulk.install_software)
+    """
+    deltas = {software_id: delta for software_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    if not counted:
+        by_delta = {}
+        for software_id, delta in deltas.items():
+            by_delta.setdefault(delta, []).append(software_id)
+        for delta, software_ids in sorted(by_delta.items()):
+            Software.objects.filter(pk__in=software_ids).update(installed_count=F('installed_count') + delta)
+    at_capacity = 0
+    rows = Software.objects.filter(pk__in=deltas).values_list('pk', 'max_installations', 'installed_count')
+    for software_id, max_installations, after in rows:
+        before = after - deltas[software_id]
+        at_capacity += (after >= max_installations) - (before >= max_installations)
+    apply_deltas({
+        (SOFTWARE, INSTALLATIONS): sum(deltas.values()),
+        (SOFTWARE, AT_CAPACITY): at_capacity,
+    })
+
+
+def get_installed_count(software):
+    """
+    Read the installed_count of a software from its row: the value of the instance
+    was loaded before the installations changed since.
+    """
+    return Software.objects.filter(pk=software.pk).values_list('installed_count', flat=True).first() or 0
+
+
+def count_installations():
+    """
+    Return the number of rows of the installations table of each software, as
+    a subquery for Software querysets.
+    """
+    installations = Software.installed_on.through.objects.filter(
+        software_id=OuterRef('pk')
+    ).order_by().values('software_id').annotate(count=Count('*')).values('count')
+    return Coalesce(Subquery(installations), Value(0))
+
+
+def get_installed_count_differences(lock=False):
+    """
+    Return {"installed_count:<software id>": (installed_count, installations)} for
+    the software whose installed_count differs from its installations.
+    - lock: Lock the rows of the software first. Every write of the installations
+      also updates installed_count, so it either committed or waits for the lock,
+      and the installations counted afterwards are final.
+    """
+    softwares = Software.objects.order_by('pk')
+    if lock:
+        list(softwares.select_for_update().values_list('pk', flat=True))
+    rows = softwares.annotate(installation_count=count_installations()).exclude(
+        installed_count=F('installation_count')
+    ).values_list('pk', 'installed_count', 'installation_count')
+    return {f"{INSTALLED_COUNT}:{pk}": (stored, actual) for pk, stored, actual in rows}
+
+
+def software_saved(software, created, loaded):
+    if created:
+        apply_deltas({
+            (SOFTWARE, SEATS): software.max_installations,
+            (SOFTWARE, AT_CAPACITY): int(software.max_installations == 0),
+        })
+        return
+    old_max = loaded.get('max_installations')
+    if old_max == software.max_installations:
+        return
+    installations = get_installed_count(software)
+    apply_deltas({
+        (SOFTWARE, SEATS): software.max_installations - old_max,
+        (SOFTWARE, AT_CAPACITY): (installations >= software.max_installations) - (installations >= old_max),
+    })
+
+
+def softwares_saved(created, updated):
+    """
+    Bulk version of `software_saved`, for software written without signals. The
+    updated software must have been loaded with their row locked, so their
+    installed_count is current.
+    """
+    deltas = Counter()
+    for software in created:
+        deltas[(SOFTWARE, SEATS)] += software.max_installations
+        deltas[(SOFTWARE, AT_CAPACITY)] += software.max_installations == 0
+    for software in updated:
+        old_max = software.get_loaded_values().get('max_installations')
+        installations = software.installed_count
+        deltas[(SOFTWARE, SEATS)] += software.max_installations - old_max
+        deltas[(SOFTWARE, AT_CAPACITY)] += (
+            (installations >= software.max_installations) - (installations >= old_max)
+        )
+    apply_deltas(deltas)
+
+
+def software_deleted(software):
+    """
+    Called before the deletion, while the installations of the software still exist.
+    """
+    installations = get_installed_count(software)
+    apply_deltas({
+        (SOFTWARE, INSTALLATIONS): -installations,
+        (SOFTWARE, SEATS): -software.max_installations,
+        (SOFTWARE, AT_CAPACITY): -int(installations >= software.max_installations),
+    })
+
+
+def compute(metric):
+    """
+    Compute the counters of a metric from the source tables, with GROUP BY queries.
+    """
+    if metric == DEVICES:
+        rows = Device.objects.order_by().values_list('status', 'assigned_to__department').annotate(count=Count('pk'))
+        return {device_key(status, department_id): count for status, department_id, count in rows}
+    if metric == INTERVENTIONS:
+        rows = MaintenanceIntervention.objects.order_by().values_list('status').annotate(count=Count('pk'))
+        return dict(rows)
+    if metric == SOFTWARE:
+        softwares = Software.objects.order_by()
+        return {
+            INSTALLATIONS: Software.installed_on.through.objects.count(),
+            SEATS: softwares.aggregate(seats=Sum('max_installations'))['seats'] or 0,
+            AT_CAPACITY: softwares.alias(installation_count=Count('installed_on')).filter(
+                installation_count__gte=F('max_installations')
+            ).count(),
+        }
+    raise ValueError(f"Unknown metric: {metric}")
+
+
+def get_stored(metric):
+    return dict(SummaryCounter.objects.filter(metric=metric).values_list('key', 'value'))
+
+
+def diff(stored, actual):
+    """
+    Return {key: (stored, actual)} for the counters that differ; zero and missing
+    counters are equivalent.
+    """
+    return {
+        key: (stored.get(key, 0), actual.get(key, 0))
+        for key in set(stored) | set(actual)
+        if stored.get(key, 0) != actual.get(key, 0)
+    }
+
+
+def check(metrics=METRICS):
+    """
+    Compare the stored counters with the source tables.
+    Returns {metric: {key: (stored, actual)}} for the metrics with differences.
+    """
+    differences = {}
+    snapshot = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic():
+        if snapshot:
+            # One snapshot for the counters and the source tables.
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        for metric in metrics:
+            metric_differences = diff(get_stored(metric), compute(metric))
+            if metric == SOFTWARE:
+                metric_differences.update(get_installed_count_differences())
+            if metric_differences:
+                differences[metric] = metric_differences
+    return differences
+
+
+def rebuild(metrics=METRICS):
+    """
+    Recompute the counters of the metrics from the source tables and store them.
+    The counters table is locked against concurrent increments while it is rebuilt:
+    writes that did not commit yet are neither in the recomputed counts nor lost,
+    as their increments wait for the rebuild to commit.
+    Returns the differences that were repaired, like `check`.
+    """
+    repaired = {}
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {SummaryCounter._meta.db_table} IN SHARE ROW EXCLUSIVE MODE')
+        for metric in metrics:
+            if metric == SOFTWARE:
+                # Before computing at_capacity, which reads the installations like installed_count.
+                installed_count = get_installed_count_differences(lock=True)
+                if installed_count:
+                    Software.objects.filter(
+                        pk__in=[int(key.split(':')[1]) for key in installed_count]
+                    ).update(installed_count=count_installations())
+            actual = compute(metric)
+            metric_differences = diff(get_stored(metric), actual)
+            if metric == SOFTWARE:
+                metric_differences.update(installed_count)
+            if metric_differences:
+                repaired[metric] = metric_differences
+            SummaryCounter.objects.filter(metric=metric).delete()
+            SummaryCounter.objects.bulk_create(
+                SummaryCounter(metric=metric, key=key, value=value) for key, value in actual.items() if value
+            )
+    return repaired
+
+
+def get_dashboard():
+    """
+    Return the fleet dashboard, read from the summary counters only: the
+    SummaryCounter rows, and the installed_count of each license for the used/max
+    breakdown of `software.licenses`.
+    The fleet wide software counters ("installations", "at_capacity") are single
+    rows that every install and uninstall updates in its transaction: the totals are
+    exact and commit with the data, at the price of serializing concurrent
+    installations (of any license) on those rows until their commit. The counters of
+    a license live on its own row (installed_count), already locked by the seat claim,
+    so they add no contention. Should the global rows become a bottleneck, they can
+    be split into several rows summed here.
+    """
+    counters = {metric: {} for metric in METRICS}
+    for metric, key, value in SummaryCounter.objects.exclude(value=0).values_list('metric', 'key', 'value'):
+        counters.setdefault(metric, {})[key] = value
+
+    by_status = Counter()
+    by_department = {}
+    for key, count in counters[DEVICES].items():
+        status, department_id = key.rsplit(':', 1)
+        department_id = int(department_id) if department_id else None
+        by_status[status] += count
+        department = by_department.setdefault(department_id, {'total': 0, 'by_status': {}})
+        department['total'] += count
+        department['by_status'][status] = count
+    names = dict(Department.objects.filter(pk__in=[pk for pk in by_department if pk]).values_list('pk', 'name'))
+
+    interventions = counters[INTERVENTIONS]
+    software = counters[SOFTWARE]
+    return {
+        'devices': {
+            'total': sum(by_status.values()),
+            'by_status': dict(by_status),
+            'by_department': [
+                {'department': department_id, 'name': names.get(department_id), **department}
+                for department_id, department in sorted(by_department.items(), key=lambda item: item[0] or 0)
+            ],
+        },
+        'interventions': {
+            'open': sum(interventions.get(status, 0) for status in OPEN_MAINTENANCE_STATUSES),
+            'by_status': interventions,
+        },
+        'software': {
+            'installations': software.get(INSTALLATIONS, 0),
+            'seats': software.get(SEATS, 0),
+            'available_seats': software.get(SEATS, 0) - software.get(INSTALLATIONS, 0),
+            'at_capacity': software.get(AT_CAPACITY, 0),
+            'licenses': [
+                {'id': pk, 'name': name, 'version': version, 'used': used, 'max': maximum,
+                 'available': maximum - used}
+                for pk, name, version, used, maximum in Software.objects.order_by('name', 'version', 'pk').values_list(
+                    'pk', 'name', 'version', 'installed_count', 'max_installations'
+                )
+            ],
+        },
+    }
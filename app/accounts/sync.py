@@ -0,0 +1,232 @@
+import base64
+import binascii
+import json
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import (
+    Department,
+    MaintenanceIntervention,
+    Device,
+    Supplier,
+    Software,
+    Installation,
+    Tombstone
+)
+from .query_plans import DEVICE_READ_PLAN, MAINTENANCE_INTERVENTION_READ_PLAN, QueryPlan, SOFTWARE_READ_PLAN
+from .serializers import (
+    DepartmentSerializer,
+    MaintenanceInterventionSerializer,
+    DeviceSerializer,
+    SupplierSerializer,
+    SoftwareSerializer
+)
+
+# Delta sync of the inventory for offline clients (/api/v1/accounts/sync/).
+# Every write of a synced table stamps its rows with the id of the writing transaction
+# (change_xid) and every deletion leaves a Tombstone, through the triggers of migration
+# 0013, so a sync only reads the rows and tombstones at or above its cursor through
+# their (change_xid, id) indexes: its cost depends on what changed, not on the fleet.
+# Transaction ids are assigned when the transactions start, not when they commit, so
+# the next cursor is the xmin of a snapshot taken before reading: the transactions
+# below it have all ended, the others are read again by the next sync. A row can be
+# served twice, never missed.
+
+# Pseudo resource of the deletions, read after the changed rows
+TOMBSTONES = 'tombstones'
+
+
+class CursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'The cursor is older than the kept deletions, a full sync is required.'
+    default_code = 'cursor_expired'
+
+
+class SyncResource:
+    """
+    Model served by the delta sync.
+    - visible: Returns the rows visible to a user (the queryset of the list endpoint)
+    - related: Returns the rows of the model to check again when a user can see a
+      row without it changing, as a Q object for the changes since a transaction id,
+      or None
+    """
+
+    def __init__(self, model, serializer_class, plan=None, visible=None, related=None):
+        self.model = model
+        self.serializer_class = serializer_class
+        self.plan = plan or QueryPlan()
+        self.visible = visible or (lambda user: model.objects.all())
+        self.related = related or (lambda user, since: None)
+
+    @property
+    def label(self):
+        return self.model._meta.label_lower
+
+
+def softwares_on_changed_devices(user, since):
+    """
+    Regular users see the software installed on their devices: the software of a
+    device assigned to them, or taken away from them, becomes visible or invisible
+    without changing.
+    """
+    if user.is_staff:
+        return None
+    return Q(pk__in=Installation.objects.filter(device__change_xid__gte=since).values('software_id'))
+
+
+RESOURCES = {
+    'departments': SyncResource(Department, DepartmentSerializer),
+    'maintenance-interventions': SyncResource(
+        MaintenanceIntervention, MaintenanceInterventionSerializer, MAINTENANCE_INTERVENTION_READ_PLAN,
+        visible=MaintenanceIntervention.objects.visible_to
+    ),
+    'devices': SyncResource(Device, DeviceSerializer, DEVICE_READ_PLAN, visible=Device.objects.visible_to),
+    'suppliers': SyncResource(Supplier, SupplierSerializer),
+    'softwares': SyncResource(
+        Software, SoftwareSerializer, SOFTWARE_READ_PLAN,
+        visible=Software.objects.visible_to, related=softwares_on_changed_devices
+    ),
+}
+
+
+def encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(value, names):
+    """
+    Return the state stored in a cursor, raising a ValidationError when it is not valid
+    for the requested resources.
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(value.encode()))
+        # `since` is None while paging through a full sync.
+        valid = (
+            isinstance(state, dict)
+            and (
+                state.get('since') is None and state.get('resource') is not None
+                or isinstance(state.get('since'), int) and isinstance(state.get('time'), (int, float))
+            )
+            and state.get('resource') in (None, TOMBSTONES, *names)
+        )
+        if valid and state.get('resource') is not None:
+            until, until_time, after = state.get('until'), state.get('until_time'), state.get('after')
+            valid = (
+                isinstance(until, int) and isinstance(until_time, (int, float))
+                and isinstance(after, list) and len(after) == 2 and all(isinstance(key, int) for key in after)
+            )
+    except (binascii.Error, ValueError, UnicodeError):
+        valid = False
+    if not valid:
+        raise ValidationError({'changed_since': 'Invalid cursor.'})
+    return state
+
+
+def get_snapshot_xmin():
+    """
+    Return the id of the oldest transaction still running: every transaction below it
+    has ended, and what it wrote is visible to the following queries.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+        return cursor.fetchone()[0]
+
+
+def after_position(after):
+    """
+    Return the rows after a (change_xid, id) position of the sync order.
+    """
+    change_xid, pk = after
+    return Q(change_xid__gt=change_xid) | Q(change_xid=change_xid, id__gt=pk)
+
+
+def read_changes(resource, user, since, after, limit):
+    """
+    Return the positions, the serialized visible rows and the ids of the other rows
+    of the next `limit` rows of a resource changed since the transaction id `since`
+    (every visible row on a full sync, `since` None).
+    """
+    visible = resource.visible(user)
+    if since is None:
+        candidates = visible
+    else:
+        condition = Q(change_xid__gte=since)
+        related = resource.related(user, since)
+        if related is not None:
+            condition |= related
+        candidates = resource.model.objects.filter(condition)
+    if after is not None:
+        candidates = candidates.filter(after_position(after))
+    positions = list(candidates.order_by('change_xid', 'id').values_list('change_xid', 'id')[:limit])
+    if not positions:
+        return positions, [], []
+    ids = [pk for _, pk in positions]
+    rows = list(resource.plan.apply(visible.filter(pk__in=ids)).order_by('change_xid', 'id'))
+    # Changed rows the user can not see (anymore) are removed from the client.
+    removed = sorted(set(ids) - {row.pk for row in rows})
+    return positions, resource.serializer_class(rows, many=True).data, removed
+
+
+def read_tombstones(names, since, after, limit):
+    """
+    Return the positions and the deleted ids, by resource, of the next `limit`
+    tombstones of the given resources since the transaction id `since`.
+    """
+    labels = {RESOURCES[name].label: name for name in names}
+    tombstones = Tombstone.objects.filter(model__in=labels, change_xid__gte=since)
+    if after is not None:
+        tombstones = tombstones.filter(after_position(after))
+    rows = list(tombstones.order_by('change_xid', 'id').values_list('change_xid', 'id', 'model', 'object_id')[:limit])
+    deleted = {}
+    for _, _, label, object_id in rows:
+        deleted.setdefault(labels[label], []).append(object_id)
+    return [(change_xid, pk) for change_xid, pk, _, _ in rows], deleted
+
+
+def get_changes(user, names, changed_since=None, limit=None):
+    """
+    Return the next page of the changes of the given resources visible to the user:
+    - changes: Changed rows by resource (every visible row on a full sync, without
+      `changed_since`)
+    - deleted: Ids of the rows deleted, or no longer visible to the user, by resource
+    - cursor: Cursor of the next request
+    - has_more: Whether the changes are not over yet, the next page being read with
+      the cursor. Otherwise the cursor is kept for the next sync.
+    """
+    limit = limit or settings.SYNC_PAGE_SIZE
+    if changed_since is None:
+        state = {'since': None, 'time': None}
+    else:
+        state = decode_cursor(changed_since, names)
+        if state['since'] is not None and state['time'] < time.time() - settings.SYNC_TOMBSTONE_DAYS * 86400:
+            raise CursorExpired()
+    if state.get('resource') is None:
+        # First page: changes committed from now on are left to the next sync.
+        state.update(until=get_snapshot_xmin(), until_time=time.time(), resource=None, after=None)
+
+    since = state['since']
+    steps = list(names) + ([TOMBSTONES] if since is not None else [])
+    start = steps.index(state['resource']) if state['resource'] in steps else 0
+    changes = {name: [] for name in names}
+    deleted = {name: [] for name in names}
+    remaining = limit
+    for step in steps[start:]:
+        after = state['after'] if step == state['resource'] else None
+        if step == TOMBSTONES:
+            positions, step_deleted = read_tombstones(names, since, after, remaining)
+            for name, ids in step_deleted.items():
+                deleted[name].extend(ids)
+        else:
+            positions, changes[step], deleted[step] = read_changes(RESOURCES[step], user, since, after, remaining)
+        remaining -= len(positions)
+        if remaining == 0:
+            cursor = {**state, 'resource': step, 'after': list(positions[-1])}
+            return {'changes': changes, 'deleted': deleted, 'cursor': encode_cursor(cursor), 'has_more': True}
+
+    cursor = {'since': state['until'], 'time': state['until_time']}
+    return {'changes': changes, 'deleted': deleted, 'cursor': encode_cursor(cursor), 'has_more': False}
@@ -0,0 +1,174 @@
+import datetime
+import logging
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import get_connection, EmailMessage
+from django.db import connection
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import stats
+from .models import Department, User, Software, Tombstone
+
+logger = logging.getLogger(__name__)
+
+# Key of the PostgreSQL advisory lock held by the license expiry scan.
+SCAN_LOCK_KEY = zlib.crc32(b'accounts.tasks.scan_license_expiry')
+
+
+def get_digest_recipients(department_ids):
+    """
+    Return the email addresses receiving the digest of each department: its active
+    staff users. The digests of the departments without any, and of the licenses not
+    used by any department (key None), go to the active superusers.
+    """
+    recipients = defaultdict(list)
+    staff = User.objects.filter(is_active=True, is_staff=True, department__in=[pk for pk in department_ids if pk])
+    for department_id, email in staff.exclude(email='').values_list('department_id', 'email'):
+        recipients[department_id].append(email)
+    orphans = [pk for pk in department_ids if not recipients.get(pk)]
+    if orphans:
+        superusers = list(
+            User.objects.filter(is_active=True, is_superuser=True).exclude(email='').values_list('email', flat=True)
+        )
+        for department_id in orphans:
+            recipients[department_id] = superusers
+    return recipients
+
+
+@contextmanager
+def scan_lock():
+    """
+    Hold an advisory lock on PostgreSQL while a scan runs, yielding whether it was
+    taken: a scan started while another one runs (a retry, a manual run) sends
+    nothing, instead of sending the same digests.
+    """
+    if connection.vendor != 'postgresql':
+        yield True
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [SCAN_LOCK_KEY])
+        locked = cursor.fetchone()[0]
+        try:
+            yield locked
+        finally:
+            if locked:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [SCAN_LOCK_KEY])
+
+
+@shared_task(autoretry_for=(OSError,), retry_backoff=True, max_retries=5)
+def scan_license_expiry(days=None):
+    """
+    Send each department the digest of the licenses installed on its devices that
+    expire within `days` days (LICENSE_EXPIRY_DAYS by default), and mark as notified
+    the licenses whose digests were all sent. Only licenses not notified yet are read,
+    through the partial index `software_expiry_pending_idx`, so the daily scan does
+    not depend on the size of the catalogue.
+    The digests are sent outside any transaction, so installs of the licenses never
+    wait for the mail server; concurrent scans are kept apart by `scan_lock`. When a
+    digest can not be sent, the licenses of the digests sent before are still marked
+    and the task is retried: a license also listed in the failed digest is sent again
+    to every department, rather than missed by one. Licenses without any recipient
+    (no staff user nor superuser) are left for the next scan.
+    """
+    days = settings.LICENSE_EXPIRY_DAYS if days is None else days
+    today = timezone.localdate()
+    until = today + datetime.timedelta(days=days)
+
+    with scan_lock() as locked:
+        if not locked:
+            logger.info("License expiry scan skipped: another scan is running")
+            return {'licenses': 0, 'digests': 0}
+
+        softwares = Software.objects.filter(
+            expiry_notified_on__isnull=True, expire_date__lte=until
+        ).select_related('supplier').in_bulk()
+        if not softwares:
+            return {'licenses': 0, 'digests': 0}
+
+        # Devices using each license, by department of the assignee.
+        items = defaultdict(list)
+        installations = Software.installed_on.through.objects.filter(
+            software_id__in=softwares
+        ).order_by().values_list('software_id', 'device__assigned_to__department').annotate(devices=Count('device'))
+        used = set()
+        for software_id, department_id, devices in installations:
+            items[department_id].append({'software': softwares[software_id], 'devices': devices})
+            used.add(software_id)
+        for software_id in softwares.keys() - used:
+            items[None].append({'software': softwares[software_id], 'devices': 0})
+
+        departments = Department.objects.in_bulk([pk for pk in items if pk])
+        recipients = get_digest_recipients(list(items))
+        # Digests listing each license, and the ones left to send.
+        digests = defaultdict(set)
+        for department_id, department_items in items.items():
+            if recipients.get(department_id):
+                for item in department_items:
+                    digests[item['software'].pk].add(department_id)
+        unsent = {department_id for department_id in items if recipients.get(department_id)}
+
+        error = None
+        sent = 0
+        try:
+            with get_connection() as mail_connection:
+                for department_id, department_items in items.items():
+                    if department_id not in unsent:
+                        continue
+                    context = {
+                        'department': departments.get(department_id),
+                        'until': until,
+                        'items': sorted(
+                            department_items, key=lambda item: (item['software'].expire_date, item['software'].pk)
+                        ),
+                    }
+                    mail_connection.send_messages([EmailMessage(
+                        subject=render_to_string('accounts/email/license_expiry_subject.txt', context).strip(),
+                        body=render_to_string('accounts/email/license_expiry_message.txt', context),
+                        to=recipients[department_id],
+                    )])
+                    unsent.discard(department_id)
+                    sent += 1
+        except OSError as exc:
+            error = exc
+
+        notified = [pk for pk, department_ids in digests.items() if not department_ids & unsent]
+        # A license renewed meanwhile (expiry_notified_on reset, later expiry) is left pending.
+        Software.objects.filter(
+            pk__in=notified, expiry_notified_on__isnull=True, expire_date__lte=until
+        ).update(expiry_notified_on=today)
+
+    if error is not None:
+        logger.warning("License expiry scan: %s licenses notified before a failed digest", len(notified))
+        raise error
+    logger.info("License expiry scan: %s licenses, %s digests sent", len(notified), sent)
+    return {'licenses': len(notified), 'digests': sent}
+
+
+@shared_task
+def recompute_derived_data():
+    """
+    Recompute the data derived from the inventory (the summary counters of the
+    fleet dashboard), repairing any drift left by writes that bypass the signals.
+    """
+    repaired = stats.rebuild()
+    if repaired:
+        logger.warning("Derived data repaired: %s", repaired)
+    return repaired
+
+
+@shared_task
+def prune_tombstones(days=None):
+    """
+    Delete the tombstones of the delta sync (accounts.sync) older than `days` days
+    (SYNC_TOMBSTONE_DAYS by default): the sync cursors older than that have expired.
+    """
+    days = settings.SYNC_TOMBSTONE_DAYS if days is None else days
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=timezone.now() - datetime.timedelta(days=days)).delete()
+    logger.info("Tombstones pruned: %s", deleted)
+    return deleted
@@ -0,0 +1,2220 @@
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+
+from allauth.account.models import EmailAddress
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Count, F, QuerySet
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient, APITestCase
+
+from core.celery import app as celery_app
+
+from . import bulk, stats, sync, tasks
+from .audit import audit_logger
+from .authentication import TOKEN_CACHE_KEY, token_cache
+from .management.commands.benchmark import compare as compare_benchmarks
+from .logs import AuditTableHandler, JSONFormatter, LogWriter, QueueHandler
+from .metrics import (
+    REQUEST_DB_QUERIES,
+    REQUEST_DURATION,
+    REQUEST_SERIALIZATION_DURATION,
+    WORKER_KEY,
+    MetricsRegistry,
+    registry as metrics_registry
+)
+from .constants import ACTIVE, ON_MAINTENANCE, INACTIVE, PENDING, IN_PROGRESS, COMPLETED
+from .cache import response_cache
+from .models import (
+    Department,
+    User,
+    MaintenanceIntervention,
+    Device,
+    Supplier,
+    Software,
+    Installation,
+    Tombstone,
+    SummaryCounter,
+    AuditEvent
+)
+from .pagination import KeysetPagination
+from .permissions import EMAIL_VERIFIED_CACHE_KEY
+from .preflight import collect_static, get_pending_migrations, warm_up
+from .search import search_queryset
+from .serializers import DeviceSerializer
+from .views import (
+    UserViewSet,
+    MaintenanceInterventionViewSet,
+    DeviceViewSet,
+    SupplierViewSet,
+    SoftwareViewSet
+)
+
+
+def create_verified_user(username, **kwargs):
+    """
+    Create a user with a verified primary email address.
+    """
+    user = User.objects.create_user(
+        username=username,
+        email=f"{username}@example.com",
+        password='password',
+        **kwargs
+    )
+    EmailAddress.objects.create(user=user, email=user.email, verified=True, primary=True)
+    return user
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class AccountsAPITestCase(APITestCase):
+    """
+    Base test case with an admin, a regular user and helpers to seed inventory data.
+    The response cache is disabled, as the test transactions never commit.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='IT')
+        cls.admin = create_verified_user('admin', is_staff=True, department=cls.department)
+        cls.member = create_verified_user('member', department=cls.department)
+        cls.supplier = Supplier.objects.create(name='Acme', telephone='0000000000')
+
+    def setUp(self):
+        cache.clear()
+
+    def seed(self, count):
+        """
+        Create `count` devices assigned to the regular user, each one with an
+        intervention and a software installation.
+        """
+        for index in range(count):
+            department = Department.objects.create(name=f"Department {Department.objects.count()}")
+            User.objects.create_user(
+                username=f"user-{User.objects.count()}",
+                email=f"user-{User.objects.count()}@example.com",
+                department=department
+            )
+            Supplier.objects.create(name='Supplier', telephone=f"1{Supplier.objects.count():09d}")
+            device = Device.objects.create(
+                user=self.admin,
+                assigned_to=self.member,
+                brand='Brand',
+                name=f"Device {index}",
+                serial_number=f"SN-{Device.objects.count()}",
+                purchase_date=datetime.date(2024, 1, 1)
+            )
+            MaintenanceIntervention.objects.create(
+                device=device,
+                description='Check',
+                date_intervention=datetime.date(2024, 2, 1),
+                technician=self.member
+            )
+            software = Software.objects.create(
+                name='Software',
+                version='1.0',
+                supplier=self.supplier,
+                license_key='KEY',
+                expire_date=datetime.date(2030, 1, 1),
+                max_installations=10
+            )
+            software.installed_on.add(device)
+
+    def count_queries(self, url):
+        # Warm up the per-user caches so only the queries of the endpoint are counted.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+class QueryCountTests(AccountsAPITestCase):
+    """
+    The number of queries of the read endpoints must not grow with the number of rows.
+    """
+    list_urls = [
+        'department-list',
+        'user-list',
+        'maintenanceintervention-list',
+        'device-list',
+        'supplier-list',
+        'software-list',
+    ]
+
+    def assertConstantQueries(self, user, url_name):
+        self.client.force_authenticate(user)
+        self.seed(2)
+        url = reverse(url_name)
+        expected = self.count_queries(url)
+        self.seed(5)
+        self.assertEqual(
+            self.count_queries(url), expected,
+            f"{url_name} runs a number of queries that grows with the number of rows"
+        )
+
+    def test_admin_list_endpoints(self):
+        for url_name in self.list_urls:
+            with self.subTest(url_name=url_name):
+                self.assertConstantQueries(self.admin, url_name)
+
+    def test_member_list_endpoints(self):
+        for url_name in self.list_urls:
+            with self.subTest(url_name=url_name):
+                self.assertConstantQueries(self.member, url_name)
+
+    def test_device_retrieve(self):
+        self.client.force_authenticate(self.admin)
+        self.seed(1)
+        device = Device.objects.get()
+        url = reverse('device-detail', args=[device.pk])
+        expected = self.count_queries(url)
+        for _ in range(5):
+            MaintenanceIntervention.objects.create(
+                device=device,
+                description='Check',
+                date_intervention=datetime.date(2024, 3, 1)
+            )
+            Software.objects.create(
+                name='Software',
+                version='2.0',
+                supplier=self.supplier,
+                license_key='KEY',
+                expire_date=datetime.date(2030, 1, 1),
+                max_installations=10
+            ).installed_on.add(device)
+        self.assertEqual(self.count_queries(url), expected)
+
+    def test_software_retrieve(self):
+        self.client.force_authenticate(self.admin)
+        self.seed(1)
+        software = Software.objects.get()
+        url = reverse('software-detail', args=[software.pk])
+        expected = self.count_queries(url)
+        self.seed(5)
+        software.installed_on.add(*Device.objects.all())
+        self.assertEqual(self.count_queries(url), expected)
+
+
+class KeysetPaginationTests(AccountsAPITestCase):
+    """
+    Cursor pagination walks every row exactly once without OFFSET scans.
+    """
+
+    def walk(self, url, backwards=False):
+        """
+        Follow the `next` links (or the `previous` links when walking backwards)
+        and return the ids of every visited row, in visit order.
+        """
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['previous' if backwards else 'next']
+        return ids
+
+    def test_devices_are_paginated_on_purchase_date_and_id(self):
+        self.client.force_authenticate(self.admin)
+        self.seed(7)
+        Device.objects.filter(id__in=Device.objects.order_by('id')[:3]).update(
+            purchase_date=datetime.date(2023, 1, 1)
+        )
+        expected = list(Device.objects.order_by('-purchase_date', '-id').values_list('id', flat=True))
+
+        with CaptureQueriesContext(connection) as context:
+            ids = self.walk(reverse('device-list') + '?page_size=2')
+        self.assertEqual(ids, expected)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in context.captured_queries))
+
+    def test_previous_links_walk_back_to_the_first_page(self):
+        self.client.force_authenticate(self.admin)
+        self.seed(5)
+        url = reverse('software-list') + '?page_size=2'
+        last_page_url = None
+        while url:
+            last_page_url = url
+            url = self.client.get(url).data['next']
+        last_page = self.client.get(last_page_url).data
+        ids = self.walk(last_page['previous'], backwards=True)
+        expected = list(Software.objects.order_by('expire_date', 'id').values_list('id', flat=True))
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sorted(ids), expected[:-len(last_page['results'])])
+
+    def test_page_size_is_capped(self):
+        self.client.force_authenticate(self.admin)
+        self.seed(3)
+        with mock.patch.object(KeysetPagination, 'max_page_size', 2):
+            response = self.client.get(reverse('device-list') + '?page_size=100')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_current_admin_is_listed_first(self):
+        self.seed(4)
+        other_admin = create_verified_user('other-admin', is_staff=True)
+        self.client.force_authenticate(other_admin)
+        ids = self.walk(reverse('user-list') + '?page_size=2')
+        self.assertEqual(ids[0], other_admin.id)
+        self.assertEqual(sorted(ids), sorted(User.objects.values_list('id', flat=True)))
+        self.assertEqual(ids[1:], sorted(ids[1:]))
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('device-list') + '?cursor=bogus')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor(self):
+        self.client.force_authenticate(self.admin)
+        paginator = KeysetPagination()
+        for position in (['abc', 'x'], ['2024-99-99', '1'], ['2024-01-01', 1], ['2024-01-01']):
+            with self.subTest(position=position):
+                cursor = Cursor(offset=0, reverse=False, position=json.dumps(position))
+                paginator.base_url = 'http://testserver' + reverse('device-list')
+                response = self.client.get(paginator.encode_cursor(cursor))
+                self.assertEqual(response.status_code, 404)
+        cursor = Cursor(offset=0, reverse=False, position=json.dumps(['2024-01-01', '1']))
+        self.assertEqual(self.client.get(paginator.encode_cursor(cursor)).status_code, 200)
+
+
+class IsActiveAndVerifiedTests(AccountsAPITestCase):
+    """
+    The email verified check is cached and invalidated when the email changes.
+    """
+
+    def get_devices(self, user):
+        # Authenticate a fresh instance, as a real authentication backend would.
+        self.client.force_authenticate(User.objects.get(pk=user.pk))
+        return self.client.get(reverse('device-list'))
+
+    @override_settings(SHARED_CACHE_ENABLED=True)
+    def test_verified_flag_is_cached(self):
+        self.assertEqual(self.get_devices(self.member).status_code, 200)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.get_devices(self.member).status_code, 200)
+        self.assertFalse(any(
+            EmailAddress._meta.db_table in query['sql'] for query in context.captured_queries
+        ))
+
+    @override_settings(SHARED_CACHE_ENABLED=False)
+    def test_verified_flag_needs_a_shared_cache(self):
+        # A worker-local cache would keep the flag after an email change in another worker.
+        self.assertEqual(self.get_devices(self.member).status_code, 200)
+        self.assertIsNone(cache.get(EMAIL_VERIFIED_CACHE_KEY.format(user_id=self.member.pk)))
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.get_devices(self.member).status_code, 200)
+        self.assertTrue(any(
+            EmailAddress._meta.db_table in query['sql'] for query in context.captured_queries
+        ))
+
+    def test_newly_verified_user_gets_in_immediately(self):
+        user = User.objects.create_user(username='new', email='new@example.com')
+        email = EmailAddress.objects.create(user=user, email=user.email, verified=False, primary=True)
+        self.assertEqual(self.get_devices(user).status_code, 403)
+        email.verified = True
+        email.save()
+        self.assertEqual(self.get_devices(user).status_code, 200)
+
+    def test_removed_email_revokes_access(self):
+        self.assertEqual(self.get_devices(self.member).status_code, 200)
+        EmailAddress.objects.filter(user=self.member).get().delete()
+        self.assertEqual(self.get_devices(self.member).status_code, 403)
+
+
+class CachedTokenAuthenticationTests(AccountsAPITestCase):
+    """
+    Token authentication is served from the token cache and invalidated on logout,
+    deactivation and password change.
+    """
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear_local()
+        self.token = Token.objects.create(user=self.member)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_cached_token_skips_the_database(self):
+        self.assertEqual(self.client.get(reverse('device-list')).status_code, 200)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(reverse('device-list')).status_code, 200)
+        self.assertFalse(any(
+            Token._meta.db_table in query['sql'] for query in context.captured_queries
+        ))
+
+    def test_logout_invalidates_token(self):
+        self.assertEqual(self.client.get(reverse('device-list')).status_code, 200)
+        self.assertEqual(self.client.post(reverse('rest_logout')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('device-list')).status_code, 401)
+
+    def test_deactivation_invalidates_token(self):
+        self.assertEqual(self.client.get(reverse('device-list')).status_code, 200)
+        self.client.force_authenticate(self.admin)
+        self.client.delete(reverse('user-detail', args=[self.member.pk]))
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('device-list')).status_code, 401)
+
+    def test_shared_tier_needs_a_shared_cache(self):
+        key = TOKEN_CACHE_KEY.format(key=self.token.key)
+        with override_settings(SHARED_CACHE_ENABLED=False):
+            self.assertEqual(self.client.get(reverse('device-list')).status_code, 200)
+        # A worker-local default cache would keep serving tokens revoked in another worker.
+        self.assertIsNone(cache.get(key))
+        token_cache.clear_local()
+        with override_settings(SHARED_CACHE_ENABLED=True):
+            self.assertEqual(self.client.get(reverse('device-list')).status_code, 200)
+        self.assertEqual(cache.get(key).pk, self.member.pk)
+        cache.delete(key)
+
+    def test_password_change_invalidates_token(self):
+        self.assertEqual(self.client.get(reverse('device-list')).status_code, 200)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        self.member.set_password('new-password')
+        self.member.save()
+        self.assertIsNone(token_cache.get(self.token.key))
+
+
+class ExportTests(AccountsAPITestCase):
+    """
+    Inventory exports stream every visible row, with joined columns.
+    """
+
+    def test_device_csv_export(self):
+        self.client.force_authenticate(self.admin)
+        self.seed(3)
+        response = self.client.get(reverse('device-export', kwargs={'export_format': 'csv'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['assigned_to'], 'member')
+        self.assertEqual(rows[0]['department'], 'IT')
+        self.assertEqual(rows[0]['softwares'], 'Software 1.0')
+
+    def test_software_ndjson_export_is_filtered_by_visibility(self):
+        self.seed(2)
+        Device.objects.filter(id=Device.objects.order_by('id').first().id).update(assigned_to=self.admin)
+        self.client.force_authenticate(self.member)
+        response = self.client.get(reverse('software-export', kwargs={'export_format': 'ndjson'}))
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['installations'], 1)
+        self.assertEqual(rows[0]['supplier'], 'Acme')
+
+    def test_asgi_export_streams_from_an_async_iterator(self):
+        self.seed(3)
+        token = Token.objects.create(user=self.admin)
+
+        async def export():
+            response = await AsyncClient().get(
+                reverse('device-export', kwargs={'export_format': 'ndjson'}),
+                headers={'Authorization': f"Token {token.key}"}
+            )
+            chunks = [chunk async for chunk in response.streaming_content]
+            return response, chunks
+
+        # The rows are read through aiterator, never through the sync server-side cursor.
+        with mock.patch.object(QuerySet, 'iterator', side_effect=AssertionError('sync iteration')), \
+                override_settings(EXPORT_CHUNK_SIZE=1):
+            response, chunks = async_to_sync(export)()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([row['assigned_to'] for row in rows], ['member'] * 3)
+
+    def test_export_command(self):
+        self.seed(2)
+        output = io.StringIO()
+        with mock.patch('sys.stdout', output):
+            call_command('export_inventory', 'maintenance-interventions', '--format', 'ndjson',
+                         '--filter', 'status=PENDING', '--chunk-size', '1')
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['technician'], 'member')
+
+
+class SparseFieldsetTests(AccountsAPITestCase):
+    """
+    `?fields=` trims the output and the queries, `?expand=` embeds related objects.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.seed(3)
+
+    def test_fields_trim_output_and_queries(self):
+        url = reverse('device-list')
+        full_queries = self.count_queries(url)
+        trimmed_queries = self.count_queries(url + '?fields=id,name,serial_number,status')
+        response = self.client.get(url + '?fields=id,name,serial_number,status')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'serial_number', 'status'})
+        self.assertLess(trimmed_queries, full_queries)
+
+    def test_expand_embeds_related_objects(self):
+        response = self.client.get(reverse('device-list') + '?expand=softwares,assigned_to')
+        device = response.data['results'][0]
+        self.assertEqual(device['assigned_to']['username'], 'member')
+        self.assertEqual(device['softwares'][0]['name'], 'Software')
+
+        response = self.client.get(reverse('software-list') + '?fields=id,supplier,installed_on&expand=supplier,installed_on')
+        software = response.data['results'][0]
+        self.assertEqual(set(software), {'id', 'supplier', 'installed_on'})
+        self.assertEqual(software['supplier']['name'], 'Acme')
+        self.assertIn('serial_number', software['installed_on'][0])
+
+    def test_expand_keeps_queries_constant(self):
+        url = reverse('device-list') + '?expand=user,assigned_to,softwares'
+        expected = self.count_queries(url)
+        self.seed(4)
+        self.assertEqual(self.count_queries(url), expected)
+
+        url = reverse('software-list') + '?expand=supplier,installed_on'
+        expected = self.count_queries(url)
+        self.seed(4)
+        self.assertEqual(self.count_queries(url), expected)
+
+    def test_fields_are_ignored_on_writes(self):
+        response = self.client.post(reverse('supplier-list') + '?fields=id', {'name': 'New', 'telephone': '123'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['name'], 'New')
+
+
+class ConditionalRequestTests(AccountsAPITestCase):
+    """
+    Unchanged resources answer 304 without serializing, writes honour If-Match.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.seed(2)
+
+    def test_unchanged_list_is_not_modified(self):
+        url = reverse('device-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+        with mock.patch.object(DeviceSerializer, 'to_representation') as to_representation:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        to_representation.assert_not_called()
+
+        MaintenanceIntervention.objects.create(
+            device=Device.objects.first(),
+            description='Repair',
+            date_intervention=datetime.date(2024, 5, 1)
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etag_changes_on_delete_and_filters(self):
+        url = reverse('supplier-list')
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url + '?page_size=1')['ETag'], etag)
+        Supplier.objects.exclude(pk=self.supplier.pk).first().delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_unchanged_detail_is_not_modified(self):
+        software = Software.objects.first()
+        url = reverse('software-detail', args=[software.pk])
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+        software.installed_on.add(Device.objects.last())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_detail_etag_depends_on_the_representation(self):
+        url = reverse('device-detail', args=[Device.objects.first().pk])
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url + '?fields=id')['ETag'], etag)
+        self.assertEqual(self.client.get(url + '?fields=id', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertNotEqual(self.client.get(url + '?format=api')['ETag'], etag)
+        # Embedded objects change without the device: no validators.
+        self.assertNotIn('ETag', self.client.get(url + '?expand=assigned_to'))
+        self.assertNotIn('ETag', self.client.get(reverse('device-list') + '?expand=assigned_to'))
+
+    def test_write_preconditions(self):
+        url = reverse('department-detail', args=[self.department.pk])
+        etag = self.client.get(url)['ETag']
+        response = self.client.patch(url, {'name': 'IT Support'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # The department changed since the first read: the stale write is rejected.
+        response = self.client.patch(url, {'name': 'Helpdesk'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        response = self.client.delete(url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(Department.objects.get(pk=self.department.pk).name, 'IT Support')
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(AccountsAPITestCase):
+    """
+    Read responses are cached per visibility scope and invalidated by writes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        caches['local'].clear()
+        response_cache.reset_stats()
+        self.seed(2)
+
+    def get(self, url, user):
+        self.client.force_authenticate(user)
+        return self.client.get(url)
+
+    def test_hit_skips_the_database(self):
+        url = reverse('device-list')
+        self.assertEqual(self.get(url, self.admin)['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as context:
+            response = self.get(url, self.admin)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        # Only the conditional request validator runs, nothing is serialized.
+        self.assertFalse(any(
+            MaintenanceIntervention._meta.db_table in query['sql'] for query in context.captured_queries
+        ))
+        self.assertEqual(response_cache.stats()['local_hits'], 1)
+        self.assertEqual(response_cache.stats()['misses'], 1)
+
+    def test_shared_tier_fills_local_tier(self):
+        url = reverse('supplier-list')
+        self.get(url, self.admin)
+        caches['local'].clear()
+        self.assertEqual(self.get(url, self.admin)['X-Cache'], 'HIT')
+        self.assertEqual(response_cache.stats()['shared_hits'], 1)
+
+    def test_visibility_scopes_are_not_shared(self):
+        url = reverse('device-list')
+        Device.objects.filter(pk=Device.objects.first().pk).update(assigned_to=self.admin)
+        self.assertEqual(len(self.get(url, self.admin).data['results']), 2)
+        response = self.get(url, self.member)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_writes_invalidate_dependent_responses(self):
+        url = reverse('device-list')
+        self.get(url, self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            MaintenanceIntervention.objects.create(
+                device=Device.objects.first(),
+                description='Repair',
+                date_intervention=datetime.date(2024, 5, 1)
+            )
+        response = self.get(url, self.admin)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(
+            sum(len(device['maintenance_interventions']) for device in response.data['results']), 3
+        )
+
+        software_url = reverse('software-list')
+        self.get(software_url, self.member)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.admin)
+            self.client.patch(
+                reverse('device-detail', args=[Device.objects.first().pk]),
+                {'assigned_to': self.admin.pk}
+            )
+        self.assertEqual(self.get(software_url, self.member)['X-Cache'], 'MISS')
+
+    def test_writes_invalidate_expanded_relations(self):
+        url = reverse('device-list') + '?expand=assigned_to'
+        self.get(url, self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.member.first_name = 'Renamed'
+            self.member.save()
+        response = self.get(url, self.admin)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['assigned_to']['first_name'], 'Renamed')
+
+        url = reverse('software-list') + '?expand=supplier'
+        self.get(url, self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.supplier.name = 'Renamed'
+            self.supplier.save()
+        response = self.get(url, self.admin)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['supplier']['name'], 'Renamed')
+
+
+class AsyncReadTests(AccountsAPITestCase):
+    """
+    List and retrieve of devices, software and interventions are served by the async
+    handlers, with the same responses as the sync views.
+    """
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear_local()
+        self.seed(3)
+
+    def get_both(self, url, **extra):
+        with override_settings(ASYNC_READ_ENABLED=False):
+            expected = self.client.get(url, **extra)
+        with mock.patch.object(KeysetPagination, 'paginate_queryset', side_effect=AssertionError), \
+                mock.patch.object(DeviceViewSet, 'get_object', side_effect=AssertionError):
+            response = self.client.get(url, **extra)
+        return expected, response
+
+    def test_same_responses_as_sync_views(self):
+        device = Device.objects.first()
+        urls = [
+            reverse('device-list'),
+            reverse('device-list') + '?page_size=2&fields=id,name',
+            reverse('device-list') + '?expand=softwares&status=' + ACTIVE,
+            reverse('device-detail', args=[device.pk]),
+            reverse('software-list'),
+            reverse('software-list') + '?fields=id&ordering=name&page_size=1',
+            reverse('software-detail', args=[Software.objects.first().pk]),
+            reverse('maintenanceintervention-list'),
+            reverse('maintenanceintervention-detail', args=[MaintenanceIntervention.objects.first().pk]),
+        ]
+        for user in (self.admin, self.member):
+            self.client.force_authenticate(user)
+            for url in urls:
+                with self.subTest(user=user.username, url=url):
+                    expected, response = self.get_both(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json(), expected.json())
+                    self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+        # Following the cursor of the async response.
+        self.client.force_authenticate(self.admin)
+        next_url = self.client.get(reverse('device-list') + '?page_size=2').json()['next']
+        expected, response = self.get_both(next_url)
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_errors_and_conditional_requests(self):
+        other = create_verified_user('other')
+        device = Device.objects.first()
+        url = reverse('device-detail', args=[device.pk])
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('device-detail', args=['x'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('device-list') + '?status=WRONG').status_code, 400)
+
+        self.client.force_authenticate(self.member)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.head(url).status_code, 200)
+
+    def test_token_and_session_authentication(self):
+        token = Token.objects.create(user=self.member)
+        url = reverse('device-list')
+        response = self.client.get(url, HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertEqual(len(response.json()['results']), 3)
+        # Served from the token cache.
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(Token._meta.db_table in query['sql'] for query in context.captured_queries))
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Token wrong').status_code, 401)
+
+        User.objects.create_user(username='unverified', password='password')
+        self.client.login(username='unverified', password='password')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.login(username='member', password='password')
+        self.assertEqual(len(self.client.get(url).json()['results']), 3)
+
+    def test_writes_use_the_sync_view(self):
+        self.client.force_authenticate(self.admin)
+        device = Device.objects.first()
+        response = self.client.patch(reverse('device-detail', args=[device.pk]), {'name': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('device-detail', args=[device.pk])).json()['name'], 'Renamed')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Trigram search requires PostgreSQL')
+class SearchTests(AccountsAPITestCase):
+    """
+    `?search=` on the list endpoints and the global `/search/` endpoint.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        models = [('Lenovo', 'ThinkPad X1'), ('Dell', 'Latitude 5420'), ('Lenovo', 'IdeaPad')]
+        cls.devices = [
+            Device.objects.create(
+                user=cls.admin,
+                assigned_to=cls.member if index == 0 else cls.admin,
+                brand=brand,
+                name=name,
+                serial_number=f"SN-ALPHA-{index:04d}",
+                purchase_date=datetime.date(2024, 1, 1)
+            )
+            for index, (brand, name) in enumerate(models)
+        ]
+
+    def search(self, url_name, term, user=None, **params):
+        self.client.force_authenticate(user or self.admin)
+        return self.client.get(reverse(url_name), {'search': term, **params})
+
+    def test_results_are_ranked(self):
+        response = self.search('device-list', 'alpha-0001')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(results[0]['id'], self.devices[1].id)
+        self.assertEqual(len(results), 3)
+
+    def test_similar_words_match(self):
+        response = self.search('device-list', 'thinkpads')
+        self.assertEqual([device['id'] for device in response.json()['results']], [self.devices[0].id])
+
+    def test_search_respects_visibility(self):
+        response = self.search('device-list', 'lenovo', user=self.member)
+        self.assertEqual([device['id'] for device in response.json()['results']], [self.devices[0].id])
+
+    def test_ranked_results_are_paginated(self):
+        url, seen = f"{reverse('device-list')}?search=alpha&page_size=1", []
+        self.client.force_authenticate(self.admin)
+        while url:
+            data = self.client.get(url).json()
+            seen += [device['id'] for device in data['results']]
+            url = data['next']
+        self.assertCountEqual(seen, [device.id for device in self.devices])
+
+    def test_short_terms_are_rejected(self):
+        self.assertEqual(self.search('device-list', 'sn').status_code, 400)
+
+    def test_global_search(self):
+        self.client.force_authenticate(self.member)
+        response = self.client.get(reverse('search'), {'q': 'lenovo'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(set(results), {'devices', 'softwares', 'suppliers', 'users'})
+        self.assertEqual([device['id'] for device in results['devices']], [self.devices[0].id])
+
+        response = self.client.get(reverse('search'), {'q': 'acme', 'types': 'suppliers'})
+        self.assertEqual(list(response.json()['results']), ['suppliers'])
+        self.assertEqual(response.json()['results']['suppliers'][0]['id'], self.supplier.id)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'acme', 'types': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'ac'}).status_code, 400)
+
+
+class StatsTests(AccountsAPITestCase):
+    """
+    The summary counters of the fleet dashboard follow every write path.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def assertCountersInSync(self):
+        self.assertEqual(stats.check(), {})
+
+    def get_stats(self):
+        response = self.client.get(reverse('stats'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def create_device(self, **data):
+        response = self.client.post(reverse('device-list'), {
+            'user': self.admin.id, 'brand': 'Brand', 'name': 'Device', 'serial_number': 'SN',
+            'purchase_date': '2024-01-01', **data
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def test_device_and_intervention_writes(self):
+        device_id = self.create_device(assigned_to=self.member.id)
+        self.create_device(status=INACTIVE)
+        self.assertCountersInSync()
+        devices = self.get_stats()['devices']
+        self.assertEqual(devices['total'], 2)
+        self.assertEqual(devices['by_status'], {ACTIVE: 1, INACTIVE: 1})
+        self.assertIn({'department': self.department.id, 'name': 'IT', 'total': 1, 'by_status': {ACTIVE: 1}},
+                      devices['by_department'])
+
+        self.client.patch(reverse('device-detail', args=[device_id]), {'status': ON_MAINTENANCE}, format='json')
+        self.client.post(reverse('device-assign', args=[device_id]), {'user_id': self.admin.id}, format='json')
+        response = self.client.post(reverse('maintenanceintervention-list'), {
+            'device': device_id, 'description': 'Check', 'date_intervention': '2024-02-01'
+        }, format='json')
+        self.client.patch(reverse('maintenanceintervention-detail', args=[response.json()['id']]),
+                          {'status': IN_PROGRESS}, format='json')
+        self.assertCountersInSync()
+        self.assertEqual(self.get_stats()['interventions'], {'open': 1, 'by_status': {IN_PROGRESS: 1}})
+
+        # The interventions and installations of the device are deleted by the cascade.
+        self.client.delete(reverse('device-detail', args=[device_id]))
+        self.assertCountersInSync()
+        self.assertEqual(self.get_stats()['interventions']['open'], 0)
+
+    def test_installations(self):
+        device_ids = [self.create_device() for _ in range(3)]
+        software = Software.objects.create(
+            name='Software', version='1.0', supplier=self.supplier, license_key='KEY',
+            expire_date=datetime.date(2030, 1, 1), max_installations=2
+        )
+        for device_id in device_ids:
+            self.client.post(reverse('software-install', args=[software.id]), {'device_id': device_id}, format='json')
+        self.assertCountersInSync()
+        self.assertEqual(self.get_stats()['software'], {
+            'installations': 2, 'seats': 2, 'available_seats': 0, 'at_capacity': 1,
+            'licenses': [
+                {'id': software.id, 'name': 'Software', 'version': '1.0', 'used': 2, 'max': 2, 'available': 0}
+            ],
+        })
+
+        self.client.patch(reverse('software-detail', args=[software.id]),
+                          {'installed_on': [device_ids[2]], 'max_installations': 5}, format='json')
+        self.assertCountersInSync()
+        Device.objects.get(pk=device_ids[0]).softwares.set([software])
+        Device.objects.get(pk=device_ids[2]).softwares.clear()
+        self.assertCountersInSync()
+        self.supplier.delete()
+        self.assertCountersInSync()
+        self.assertEqual(self.get_stats()['software']['seats'], 0)
+
+    def test_user_and_department_changes(self):
+        self.create_device(assigned_to=self.member.id)
+        self.member.department = Department.objects.create(name='Sales')
+        self.member.save()
+        self.assertCountersInSync()
+        self.member.department.delete()
+        self.assertCountersInSync()
+        self.member.delete()
+        self.assertCountersInSync()
+
+    def test_reconcile_command(self):
+        self.create_device()
+        SummaryCounter.objects.filter(metric=stats.DEVICES).update(value=7)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_stats', '--check', stdout=io.StringIO())
+        output = io.StringIO()
+        call_command('reconcile_stats', 'devices', stdout=output)
+        self.assertEqual(json.loads(output.getvalue()), {'devices': {f"{ACTIVE}:": [7, 1]}})
+        self.assertCountersInSync()
+
+    def test_dashboard_reads_only_the_counters(self):
+        self.seed(3)
+        # Counters, department names and the installed_count of the licenses.
+        self.assertEqual(self.count_queries(reverse('stats')), 3)
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get(reverse('stats')).status_code, 403)
+
+
+class BulkDeviceTests(AccountsAPITestCase):
+    """
+    Bulk assignments and status changes write every device in one transaction,
+    with a number of queries independent of the number of items.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def create_devices(self, count):
+        return [
+            Device.objects.create(user=self.admin, brand='Brand', name='Device', serial_number=f"SN-{index}",
+                                  purchase_date=datetime.date(2024, 1, 1))
+            for index in range(count)
+        ]
+
+    def post(self, url_name, items):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse(url_name), {'items': items}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), len(context.captured_queries)
+
+    def test_bulk_assign(self):
+        devices = self.create_devices(4)
+        devices[3].assigned_to = self.member
+        devices[3].save()
+        sales = create_verified_user('sales', department=Department.objects.create(name='Sales'))
+        response, _ = self.post('device-bulk-assign', [
+            {'device_id': devices[0].pk, 'user_id': self.member.pk},
+            {'device_id': devices[1].pk, 'user_id': sales.pk},
+            {'device_id': devices[2].pk, 'user_id': 0},
+            {'device_id': devices[3].pk, 'user_id': self.member.pk},
+            {'device_id': 0, 'user_id': self.member.pk},
+            {'device_id': 'x', 'user_id': self.member.pk},
+        ])
+        self.assertEqual((response['updated'], response['unchanged'], response['rejected']), (2, 1, 3))
+        self.assertEqual([item['result'] for item in response['results']],
+                         ['updated', 'updated', 'rejected', 'unchanged', 'rejected', 'rejected'])
+        self.assertEqual(response['results'][2]['error'], 'User does not exist.')
+        self.assertEqual(response['results'][4]['error'], 'Device does not exist.')
+        self.assertIn('device_id', response['results'][5]['error'])
+        self.assertEqual(
+            list(Device.objects.order_by('pk').values_list('assigned_to', flat=True)),
+            [self.member.pk, sales.pk, None, self.member.pk]
+        )
+        self.assertGreater(Device.objects.get(pk=devices[0].pk).updated_at, devices[0].updated_at)
+        self.assertEqual(stats.check(), {})
+
+    def test_bulk_status(self):
+        devices = self.create_devices(3)
+        response, _ = self.post('device-bulk-status', [
+            {'device_id': devices[0].pk, 'status': INACTIVE},
+            {'device_id': devices[1].pk, 'status': ACTIVE},
+            {'device_id': devices[2].pk, 'status': 'BROKEN'},
+            {'device_id': devices[0].pk, 'status': ON_MAINTENANCE},
+        ])
+        self.assertEqual((response['updated'], response['unchanged'], response['rejected']), (0, 1, 3))
+        self.assertEqual(response['results'][0]['error'], 'Device listed more than once.')
+        self.assertIn('status', response['results'][2]['error'])
+
+        response, _ = self.post('device-bulk-status', [
+            {'device_id': device.pk, 'status': ON_MAINTENANCE} for device in devices
+        ])
+        self.assertEqual(response['updated'], 3)
+        self.assertEqual(set(Device.objects.values_list('status', flat=True)), {ON_MAINTENANCE})
+        self.assertEqual(stats.check(), {})
+
+    def test_queries_do_not_grow_with_items(self):
+        devices = self.create_devices(20)
+        users = [self.admin, self.member]
+        # Warm up the per-user caches and create the counters the assignments move to.
+        self.post('device-bulk-assign', [{'device_id': devices[0].pk, 'user_id': self.member.pk}])
+        self.post('device-bulk-status', [{'device_id': devices[0].pk, 'status': INACTIVE}])
+        _, few = self.post('device-bulk-assign', [
+            {'device_id': device.pk, 'user_id': users[index % 2].pk} for index, device in enumerate(devices[:2])
+        ])
+        _, many = self.post('device-bulk-assign', [
+            {'device_id': device.pk, 'user_id': users[index % 2].pk} for index, device in enumerate(devices[2:])
+        ])
+        self.assertEqual(few, many)
+        _, few = self.post('device-bulk-status', [{'device_id': device.pk, 'status': INACTIVE}
+                                                  for device in devices[:2]])
+        _, many = self.post('device-bulk-status', [{'device_id': device.pk, 'status': INACTIVE}
+                                                   for device in devices[2:]])
+        self.assertEqual(few, many)
+
+    def test_invalid_requests(self):
+        url = reverse('device-bulk-assign')
+        self.assertEqual(self.client.post(url, {'items': []}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'items': {}}, format='json').status_code, 400)
+        with override_settings(BULK_MAX_ITEMS=1):
+            items = [{'device_id': 1, 'user_id': 1}] * 2
+            self.assertEqual(self.client.post(url, {'items': items}, format='json').status_code, 400)
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.post(url, {'items': [{'device_id': 1, 'user_id': 1}]},
+                                          format='json').status_code, 403)
+
+
+class BulkInstallationTests(AccountsAPITestCase):
+    """
+    Bulk installs claim their seats with one conditional UPDATE of installed_count.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.devices = [
+            Device.objects.create(user=self.admin, brand='Brand', name='Device', serial_number=f"SN-{index}",
+                                  purchase_date=datetime.date(2024, 1, 1))
+            for index in range(5)
+        ]
+        self.software = Software.objects.create(
+            name='Software', version='1.0', supplier=self.supplier, license_key='KEY',
+            expire_date=datetime.date(2030, 1, 1), max_installations=3
+        )
+
+    def post(self, url_name, device_ids):
+        response = self.client.post(reverse(url_name, args=[self.software.pk]),
+                                    {'items': [{'device_id': device_id} for device_id in device_ids]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def assertInstalled(self, devices):
+        self.software.refresh_from_db()
+        self.assertCountEqual(self.software.installed_on.all(), devices)
+        self.assertEqual(self.software.installed_count, len(devices))
+        self.assertEqual(stats.check(), {})
+
+    def test_bulk_install(self):
+        response = self.post('software-bulk-install', [self.devices[0].pk, self.devices[1].pk, 0])
+        self.assertEqual([item['result'] for item in response['results']], ['updated', 'updated', 'rejected'])
+        self.assertInstalled(self.devices[:2])
+
+        # Two new installations for one seat left: none of them is installed.
+        response = self.post('software-bulk-install', [self.devices[0].pk, self.devices[2].pk, self.devices[3].pk])
+        self.assertEqual([item['result'] for item in response['results']], ['unchanged', 'rejected', 'rejected'])
+        self.assertEqual(response['results'][1]['error'], 'Maximum number of installations reached.')
+        self.assertInstalled(self.devices[:2])
+
+        response = self.client.post(reverse('software-install', args=[self.software.pk]),
+                                    {'device_id': self.devices[2].pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(reverse('software-install', args=[self.software.pk]),
+                                    {'device_id': self.devices[3].pk}, format='json')
+        self.assertEqual(response.json(), {'error': 'Maximum number of installations reached.'})
+        self.assertInstalled(self.devices[:3])
+        self.assertEqual(self.get_stats_software()['at_capacity'], 1)
+
+    def test_bulk_uninstall(self):
+        self.software.installed_on.set(self.devices[:3])
+        response = self.post('software-bulk-uninstall', [self.devices[0].pk, self.devices[3].pk, self.devices[1].pk])
+        self.assertEqual([item['result'] for item in response['results']], ['updated', 'unchanged', 'updated'])
+        self.assertInstalled(self.devices[2:3])
+
+    def test_installed_count_follows_every_write(self):
+        stale = Software.objects.get(pk=self.software.pk)
+        self.post('software-bulk-install', [device.pk for device in self.devices[:2]])
+        # A save of an instance loaded before the installations keeps the counter.
+        stale.name = 'Renamed'
+        stale.save()
+        self.assertInstalled(self.devices[:2])
+        self.devices[0].softwares.clear()
+        self.devices[4].softwares.add(self.software)
+        self.devices[1].delete()
+        self.assertInstalled([self.devices[4]])
+
+        Software.objects.filter(pk=self.software.pk).update(installed_count=7)
+        self.assertEqual(stats.check(), {stats.SOFTWARE: {f"installed_count:{self.software.pk}": (7, 1)}})
+        stats.rebuild()
+        self.assertInstalled([self.devices[4]])
+
+    def get_stats_software(self):
+        return self.client.get(reverse('stats')).json()['software']
+
+
+class BulkWriteTests(AccountsAPITestCase):
+    """
+    A JSON array posted or patched to a list endpoint is written with one upsert,
+    each item reported as created, updated or rejected.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def write(self, method, url_name, items):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(reverse(url_name), items, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), len(context.captured_queries)
+
+    def device_item(self, index, **values):
+        return {'user': self.admin.pk, 'brand': 'Brand', 'name': f"Device {index}", 'serial_number': f"SN-{index}",
+                'purchase_date': '2024-01-01', **values}
+
+    def test_suppliers_upserted_by_telephone(self):
+        response, _ = self.write('post', 'supplier-list', [
+            {'name': 'Acme Renamed', 'telephone': self.supplier.telephone},
+            {'name': 'Globex', 'telephone': '1111111111'},
+            {'name': 'Initech', 'telephone': '2222222222'},
+            {'name': 'Initech again', 'telephone': '2222222222'},
+            {'name': 'No telephone'},
+        ])
+        self.assertEqual((response['created'], response['updated'], response['rejected']), (1, 1, 3))
+        self.assertEqual([item['result'] for item in response['results']],
+                         ['updated', 'created', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(response['results'][0]['id'], self.supplier.pk)
+        self.assertEqual(response['results'][2]['error'], 'Supplier listed more than once.')
+        self.assertIn('telephone', response['results'][4]['error'])
+        self.assertEqual(Supplier.objects.get(pk=self.supplier.pk).name, 'Acme Renamed')
+        self.assertEqual(Supplier.objects.get(pk=response['results'][1]['id']).name, 'Globex')
+        self.assertFalse(Supplier.objects.filter(telephone='2222222222').exists())
+
+        # A single object is still created by the regular endpoint.
+        response = self.client.post(reverse('supplier-list'), {'name': 'Umbrella', 'telephone': '3333333333'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_devices_upserted_by_device_id(self):
+        device = Device.objects.create(user=self.admin, brand='Brand', name='Device', serial_number='SN',
+                                       purchase_date=datetime.date(2024, 1, 1))
+        response, _ = self.write('post', 'device-list', [
+            self.device_item(0, device_id=str(device.device_id), status=INACTIVE, assigned_to=self.member.pk),
+            self.device_item(1),
+            self.device_item(2, user=0),
+        ])
+        self.assertEqual([item['result'] for item in response['results']], ['updated', 'created', 'rejected'])
+        self.assertIn('user', response['results'][2]['error'])
+        device.refresh_from_db()
+        self.assertEqual((device.name, device.status, device.assigned_to), ('Device 0', INACTIVE, self.member))
+        self.assertTrue(Device.objects.filter(pk=response['results'][1]['id'], serial_number='SN-1').exists())
+        self.assertEqual(stats.check(), {})
+
+    def test_software_upserted_by_name_and_version(self):
+        software = Software.objects.create(name='Office', version='2021', supplier=self.supplier,
+                                           license_key='KEY', expire_date=datetime.date(2030, 1, 1),
+                                           max_installations=1, expiry_notified_on=datetime.date(2029, 12, 1))
+        for _ in range(2):
+            Software.objects.create(name='Antivirus', version='1.0', supplier=self.supplier, license_key='KEY',
+                                    expire_date=datetime.date(2030, 1, 1), max_installations=1)
+        device = Device.objects.create(user=self.admin, brand='Brand', name='Device', serial_number='SN',
+                                       purchase_date=datetime.date(2024, 1, 1))
+        software.installed_on.add(device)
+        item = {'supplier': self.supplier.pk, 'license_key': 'NEW', 'expire_date': '2031-01-01',
+                'max_installations': 5}
+        response, _ = self.write('post', 'software-list', [
+            {'name': 'Office', 'version': '2021', **item},
+            {'name': 'Office', 'version': '2024', **item},
+            {'name': 'Antivirus', 'version': '1.0', **item},
+        ])
+        self.assertEqual([item['result'] for item in response['results']], ['updated', 'created', 'rejected'])
+        self.assertEqual(response['results'][2]['error'], 'Matches 2 softwares, update them by id.')
+        software.refresh_from_db()
+        self.assertEqual((software.license_key, software.max_installations, software.installed_count), ('NEW', 5, 1))
+        # Renewed: listed again in the expiry digests.
+        self.assertIsNone(software.expiry_notified_on)
+        self.assertEqual(stats.check(), {})
+
+    def test_partial_update_by_id(self):
+        devices = [Device.objects.create(user=self.admin, brand='Brand', name='Device', serial_number=f"SN-{index}",
+                                         purchase_date=datetime.date(2024, 1, 1)) for index in range(3)]
+        response, _ = self.write('patch', 'device-list', [
+            {'id': devices[0].pk, 'status': ON_MAINTENANCE},
+            {'id': devices[1].pk, 'name': 'Renamed', 'assigned_to': self.member.pk},
+            {'id': 0, 'name': 'Unknown'},
+            {'name': 'No id'},
+            {'id': devices[2].pk, 'device_id': str(devices[0].device_id)},
+        ])
+        self.assertEqual([item['result'] for item in response['results']],
+                         ['updated', 'updated', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(response['results'][2], {'id': 0, 'result': 'rejected', 'error': 'Device does not exist.'})
+        self.assertIn('id', response['results'][3]['error'])
+        self.assertEqual(response['results'][4]['error'], 'Device id already used.')
+        self.assertEqual(
+            list(Device.objects.order_by('pk').values_list('name', 'status', 'assigned_to')),
+            [('Device', ON_MAINTENANCE, None), ('Renamed', ACTIVE, self.member.pk), ('Device', ACTIVE, None)]
+        )
+        self.assertGreater(Device.objects.get(pk=devices[0].pk).updated_at, devices[0].updated_at)
+        self.assertEqual(stats.check(), {})
+
+    def test_members_only_write_visible_rows(self):
+        self.seed(1)
+        own = Device.objects.get()
+        other = Device.objects.create(user=self.admin, assigned_to=self.admin, brand='Brand', name='Other',
+                                      serial_number='SN-other', purchase_date=datetime.date(2024, 1, 1))
+        hidden = Software.objects.create(name='Office', version='2021', supplier=self.supplier, license_key='KEY',
+                                         expire_date=datetime.date(2030, 1, 1), max_installations=1)
+        self.client.force_authenticate(self.member)
+        self.assertEqual(
+            self.client.patch(reverse('device-detail', args=[other.pk]), {'name': 'pwned'}).status_code, 404
+        )
+
+        response, _ = self.write('patch', 'device-list', [
+            {'id': other.pk, 'name': 'pwned'},
+            {'id': own.pk, 'name': 'Mine'},
+        ])
+        self.assertEqual([item['result'] for item in response['results']], ['rejected', 'updated'])
+        self.assertEqual(response['results'][0]['error'], 'Device does not exist.')
+
+        response, _ = self.write('post', 'device-list', [self.device_item(0, device_id=str(other.device_id))])
+        self.assertEqual(response['results'][0]['result'], 'rejected')
+        self.assertEqual(response['results'][0]['error'], 'Device id already used.')
+        other.refresh_from_db()
+        self.assertEqual((other.name, other.assigned_to), ('Other', self.admin))
+
+        response, _ = self.write('post', 'software-list', [{
+            'name': 'Office', 'version': '2021', 'supplier': self.supplier.pk, 'license_key': 'STOLEN',
+            'expire_date': '2031-01-01', 'max_installations': 999
+        }])
+        self.assertEqual(response['results'][0]['result'], 'rejected')
+        hidden.refresh_from_db()
+        self.assertEqual((hidden.license_key, hidden.max_installations), ('KEY', 1))
+        self.assertEqual(Device.objects.get(pk=own.pk).name, 'Mine')
+
+    def test_queries_do_not_grow_with_items(self):
+        # Warm up the per-user caches and create the counters the devices are added to.
+        self.write('post', 'device-list', [self.device_item(0, assigned_to=self.member.pk)])
+        self.write('post', 'supplier-list', [{'name': 'Supplier', 'telephone': f"1{index:09d}"} for index in range(2)])
+        # Both requests update some suppliers and create others.
+        _, few = self.write('post', 'supplier-list', [
+            {'name': 'Supplier', 'telephone': f"1{index:09d}"} for index in range(4)
+        ])
+        _, many = self.write('post', 'supplier-list', [
+            {'name': 'Supplier', 'telephone': f"1{index:09d}"} for index in range(20)
+        ])
+        self.assertEqual(few, many)
+        # The owners and assignees of all the devices are read with one query.
+        _, few = self.write('post', 'device-list', [
+            self.device_item(index, assigned_to=self.member.pk) for index in range(2)
+        ])
+        _, many = self.write('post', 'device-list', [
+            self.device_item(index, assigned_to=self.member.pk) for index in range(20)
+        ])
+        self.assertEqual(few, many)
+
+    def test_invalid_requests(self):
+        url = reverse('supplier-list')
+        self.assertEqual(self.client.post(url, [], format='json').status_code, 400)
+        self.assertEqual(self.client.patch(url, {'name': 'Acme'}, format='json').status_code, 400)
+        with override_settings(BULK_MAX_ITEMS=1):
+            items = [{'name': 'Acme', 'telephone': '1111111111'}] * 2
+            self.assertEqual(self.client.post(url, items, format='json').status_code, 400)
+        self.assertEqual(self.client.patch(reverse('department-list'), [], format='json').status_code, 405)
+
+
+class RelatedFieldBatchingTests(AccountsAPITestCase):
+    """
+    Related ids are resolved with one IN query per model, whatever their number.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        self.devices = Device.objects.bulk_create(
+            Device(user=self.admin, brand='Brand', name='Device', serial_number=f"SN-{index}",
+                   purchase_date=datetime.date(2024, 1, 1))
+            for index in range(30)
+        )
+
+    def create_software(self, devices):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('software-list'), {
+                'name': 'Software', 'version': '1.0', 'supplier': self.supplier.pk, 'license_key': 'KEY',
+                'expire_date': '2030-01-01', 'max_installations': 50, 'installed_on': [device.pk for device in devices]
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return [query['sql'] for query in context.captured_queries]
+
+    def test_many_ids_resolved_with_one_query(self):
+        self.create_software(self.devices[:1])
+        few = self.create_software(self.devices[:2])
+        many = self.create_software(self.devices)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Software.objects.get(pk=Software.objects.latest('pk').pk).installed_on.count(), 30)
+        device_reads = [sql for sql in many if 'FROM "accounts_device" WHERE "accounts_device"."id" IN' in sql]
+        self.assertEqual(len(device_reads), 1)
+
+    def test_same_model_resolved_once(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('device-list'), {
+                'user': self.admin.pk, 'assigned_to': self.member.pk, 'brand': 'Brand', 'name': 'Device',
+                'serial_number': 'SN', 'purchase_date': '2024-01-01'
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        user_reads = [query['sql'] for query in context.captured_queries
+                      if '"accounts_user"."password"' in query['sql']]
+        self.assertEqual(len(user_reads), 1)
+
+    def test_invalid_ids(self):
+        response = self.client.post(reverse('software-list'), {
+            'name': 'Software', 'version': '1.0', 'supplier': 0, 'license_key': 'KEY', 'expire_date': '2030-01-01',
+            'max_installations': 50, 'installed_on': [self.devices[0].pk, 0, 'x', True]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'supplier': ['Invalid pk "0" - object does not exist.'],
+            'installed_on': ['Invalid pk "0" - object does not exist.'],
+        })
+        response = self.client.post(reverse('maintenanceintervention-list'), {
+            'device': 'x', 'description': 'Check', 'date_intervention': '2024-01-01', 'technician': self.member.pk
+        }, format='json')
+        self.assertEqual(response.json(), {
+            'device': ['Incorrect type. Expected pk value, received str.'],
+            # Only staff users are technicians, the filter of the field applies.
+            'technician': [f'Invalid pk "{self.member.pk}" - object does not exist.'],
+        })
+
+
+@override_settings(EMBEDDED_ITEMS=3)
+class EmbeddedRelationsTests(AccountsAPITestCase):
+    """
+    Devices and software embed their latest interventions and installations only,
+    the others are paged through their sub-resources.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.device = Device.objects.create(
+            user=self.admin, assigned_to=self.member, brand='Brand', name='Device', serial_number='SN',
+            purchase_date=datetime.date(2024, 1, 1)
+        )
+        self.interventions = [
+            MaintenanceIntervention.objects.create(
+                device=self.device, description='Check', date_intervention=datetime.date(2024, 1, day),
+                status=COMPLETED if day % 2 else PENDING
+            )
+            for day in range(1, 6)
+        ]
+        self.software = Software.objects.create(
+            name='Software', version='1.0', supplier=self.supplier, license_key='KEY',
+            expire_date=datetime.date(2030, 1, 1), max_installations=10
+        )
+        self.devices = [self.device] + [
+            Device.objects.create(user=self.admin, brand='Brand', name='Device', serial_number=f"SN-{index}",
+                                  purchase_date=datetime.date(2024, 1, 1))
+            for index in range(4)
+        ]
+        start = timezone.now() - datetime.timedelta(days=10)
+        for index, device in enumerate(self.devices):
+            self.software.installed_on.add(
+                device, through_defaults={'installed_at': start + datetime.timedelta(days=index)}
+            )
+
+    def test_device_embeds_latest_interventions(self):
+        self.client.force_authenticate(self.admin)
+        detail = self.client.get(reverse('device-detail', args=[self.device.pk])).json()
+        page = self.client.get(reverse('device-list'), {'assigned_to': self.member.pk}).json()
+        for data in (detail, page['results'][0]):
+            self.assertEqual(
+                [item['id'] for item in data['maintenance_interventions']],
+                [intervention.pk for intervention in reversed(self.interventions[2:])]
+            )
+            self.assertEqual(data['maintenance_interventions_count'], 5)
+
+    def test_software_embeds_latest_installations(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse('software-detail', args=[self.software.pk])
+        latest = [device.pk for device in reversed(self.devices[2:])]
+        data = self.client.get(url).json()
+        self.assertEqual(data['installed_on'], latest)
+        self.assertEqual(data['installed_count'], 5)
+        data = self.client.get(url, {'expand': 'installed_on'}).json()
+        self.assertEqual([device['id'] for device in data['installed_on']], latest)
+        # Writes still set the whole relation.
+        response = self.client.patch(url, {'installed_on': [self.devices[0].pk]}, format='json')
+        self.assertEqual(response.json()['installed_on'], [self.devices[0].pk])
+
+    def test_device_interventions(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse('device-intervention-list', args=[self.device.pk])
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual([item['id'] for item in response.json()['results']],
+                         [intervention.pk for intervention in reversed(self.interventions[3:])])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([item['id'] for item in response.json()['results']],
+                         [intervention.pk for intervention in reversed(self.interventions[1:3])])
+        response = self.client.get(url, {'status': PENDING})
+        self.assertEqual([item['id'] for item in response.json()['results']],
+                         [self.interventions[3].pk, self.interventions[1].pk])
+
+    def test_software_installations(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse('software-installation-list', args=[self.software.pk])
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual([item['device']['id'] for item in response.json()['results']],
+                         [device.pk for device in reversed(self.devices[3:])])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([item['device']['id'] for item in response.json()['results']],
+                         [device.pk for device in reversed(self.devices[1:3])])
+        installed_at = Installation.objects.get(software=self.software, device=self.devices[2]).installed_at
+        response = self.client.get(url, {'installed_at_before': installed_at.isoformat()})
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_sub_resources_of_other_users(self):
+        self.client.force_authenticate(self.member)
+        response = self.client.get(reverse('software-installation-list', args=[self.software.pk]))
+        self.assertEqual([item['device']['id'] for item in response.json()['results']], [self.device.pk])
+        self.assertEqual(self.client.get(reverse('device-intervention-list', args=[self.device.pk])).status_code, 200)
+        other = self.devices[1]
+        self.assertEqual(self.client.get(reverse('device-intervention-list', args=[other.pk])).status_code, 404)
+        self.software.installed_on.remove(self.device)
+        response = self.client.get(reverse('software-installation-list', args=[self.software.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SyncTests(TransactionTestCase):
+    """
+    The delta sync serves the rows changed and deleted since the cursor. Every write
+    commits on its own, the cursor being made of transaction ids.
+    """
+    client_class = APIClient
+
+    def setUp(self):
+        self.admin = create_verified_user('admin', is_staff=True)
+        self.member = create_verified_user('member')
+        self.supplier = Supplier.objects.create(name='Acme', telephone='0000000000')
+        self.devices = [
+            Device.objects.create(user=self.admin, assigned_to=self.member, brand='Brand', name='Device',
+                                  serial_number=f"SN-{index}", purchase_date=datetime.date(2024, 1, 1))
+            for index in range(3)
+        ]
+        self.intervention = MaintenanceIntervention.objects.create(
+            device=self.devices[0], description='Check', date_intervention=datetime.date(2024, 2, 1)
+        )
+        self.software = Software.objects.create(
+            name='Software', version='1.0', supplier=self.supplier, license_key='KEY',
+            expire_date=datetime.date(2030, 1, 1), max_installations=10
+        )
+        self.software.installed_on.add(self.devices[1])
+        self.client.force_authenticate(self.admin)
+
+    def sync(self, cursor=None, **params):
+        """
+        Read every page of a sync, return the merged changes and deletions and the cursor.
+        """
+        changes, deleted = {}, {}
+        while True:
+            if cursor is not None:
+                params['changed_since'] = cursor
+            response = self.client.get(reverse('sync'), params)
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            for name, rows in data['changes'].items():
+                changes.setdefault(name, []).extend(row['id'] for row in rows)
+            for name, ids in data['deleted'].items():
+                deleted.setdefault(name, []).extend(ids)
+            cursor = data['cursor']
+            if not data['has_more']:
+                return changes, deleted, cursor
+
+    def test_full_sync(self):
+        changes, deleted, _ = self.sync(limit=2)
+        self.assertEqual(sorted(changes['devices']), [device.pk for device in self.devices])
+        self.assertEqual(changes['maintenance-interventions'], [self.intervention.pk])
+        self.assertEqual(changes['softwares'], [self.software.pk])
+        self.assertEqual(changes['suppliers'], [self.supplier.pk])
+        self.assertFalse(any(deleted.values()))
+
+    def test_changes_since_cursor(self):
+        _, _, cursor = self.sync()
+        changes, deleted, cursor = self.sync(cursor)
+        self.assertFalse(any(changes.values()) or any(deleted.values()))
+
+        self.devices[2].status = INACTIVE
+        self.devices[2].save()
+        self.software.installed_on.add(self.devices[0])
+        changes, deleted, cursor = self.sync(cursor, limit=1)
+        # An installation changes both sides.
+        self.assertEqual(sorted(changes['devices']), [self.devices[0].pk, self.devices[2].pk])
+        self.assertEqual(changes['softwares'], [self.software.pk])
+        self.assertEqual(changes['maintenance-interventions'], [])
+        self.assertFalse(any(deleted.values()))
+
+    def test_deletions_and_cascades(self):
+        _, _, cursor = self.sync()
+        response = self.client.delete(reverse('device-detail', args=[self.devices[0].pk]))
+        self.assertEqual(response.status_code, 204)
+        supplier_id, software_id = self.supplier.pk, self.software.pk
+        self.supplier.delete()
+        changes, deleted, cursor = self.sync(cursor, types='devices,maintenance-interventions,softwares,suppliers')
+        self.assertEqual(deleted['devices'], [self.devices[0].pk])
+        self.assertEqual(deleted['maintenance-interventions'], [self.intervention.pk])
+        self.assertEqual(deleted['softwares'], [software_id])
+        self.assertEqual(deleted['suppliers'], [supplier_id])
+        changes, deleted, _ = self.sync(cursor)
+        self.assertFalse(any(deleted.values()))
+
+    def test_rows_no_longer_visible(self):
+        self.client.force_authenticate(self.member)
+        changes, _, cursor = self.sync()
+        self.assertEqual(changes['softwares'], [self.software.pk])
+        self.assertEqual(changes['maintenance-interventions'], [])
+        # The software is no longer visible once its device is taken away, without changing.
+        self.devices[1].assigned_to = self.admin
+        self.devices[1].save()
+        changes, deleted, _ = self.sync(cursor)
+        self.assertEqual(changes['devices'], [])
+        self.assertEqual(deleted['devices'], [self.devices[1].pk])
+        self.assertEqual(deleted['softwares'], [self.software.pk])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('sync'), {'changed_since': 'cursor'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('sync'), {'types': 'devices,users'})
+        self.assertEqual(response.json(), {'types': 'Unknown resources: users.'})
+        expired = sync.encode_cursor({'since': 1, 'time': (timezone.now() - datetime.timedelta(days=100)).timestamp()})
+        response = self.client.get(reverse('sync'), {'changed_since': expired})
+        self.assertEqual(response.status_code, 410)
+
+    def test_prune_tombstones(self):
+        self.devices[2].delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - datetime.timedelta(days=100))
+        kept = self.devices[1].pk
+        self.devices[1].delete()
+        self.assertEqual(tasks.prune_tombstones.delay().get(), 1)
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [kept])
+
+
+class InstallationConcurrencyTests(TransactionTestCase):
+    """
+    Concurrent installs of one license, each in its own thread and connection, never
+    exceed max_installations.
+    """
+    threads = 8
+
+    def setUp(self):
+        owner = User.objects.create_user(username='owner', password='password', is_staff=True)
+        supplier = Supplier.objects.create(name='Acme', telephone='0000000000')
+        self.devices = Device.objects.bulk_create(
+            Device(user=owner, brand='Brand', name='Device', serial_number=f"SN-{index}",
+                   purchase_date=datetime.date(2024, 1, 1))
+            for index in range(self.threads * 3)
+        )
+        self.software = Software.objects.create(name='Software', version='1.0', supplier=supplier,
+                                                license_key='KEY', expire_date=datetime.date(2030, 1, 1),
+                                                max_installations=5)
+
+    def hammer(self, batches):
+        barrier = threading.Barrier(len(batches))
+        results = []
+        errors = []
+
+        def install(device_ids):
+            try:
+                barrier.wait()
+                results.extend(bulk.install_software(self.software.pk, device_ids))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=install, args=[batch]) for batch in batches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return [item for item in results if item['result'] == bulk.UPDATED]
+
+    def assertWithinCap(self, installed):
+        self.software.refresh_from_db()
+        rows = self.software.installed_on.count()
+        self.assertLessEqual(rows, self.software.max_installations)
+        self.assertEqual(rows, len(installed))
+        self.assertEqual(self.software.installed_count, rows)
+        self.assertEqual(stats.check([stats.SOFTWARE]), {})
+
+    def test_single_installs(self):
+        installed = self.hammer([[device.pk] for device in self.devices[:self.threads]])
+        self.assertEqual(len(installed), self.software.max_installations)
+        self.assertWithinCap(installed)
+
+    def test_device_installed_while_claiming_is_unchanged(self):
+        # The first install stops before its commit, holding the software row; the
+        # second one claims the last seat for the same device, waits for the first one,
+        # and finds the seat taken by that very installation.
+        self.software.max_installations = 1
+        self.software.save()
+        device_id = self.devices[0].pk
+        proceed = threading.Event()
+        bulk_create = QuerySet.bulk_create
+        results = {}
+
+        def paused_bulk_create(queryset, *args, **kwargs):
+            if threading.current_thread().name == 'first':
+                proceed.wait(5)
+            return bulk_create(queryset, *args, **kwargs)
+
+        def install(name):
+            try:
+                results[name] = bulk.install_software(self.software.pk, [device_id])
+            finally:
+                connection.close()
+
+        with mock.patch.object(QuerySet, 'bulk_create', paused_bulk_create):
+            threads = [threading.Thread(target=install, args=[name], name=name) for name in ('first', 'second')]
+            threads[0].start()
+            time.sleep(0.5)
+            threads[1].start()
+            time.sleep(0.5)
+            proceed.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results['first'][0]['result'], bulk.UPDATED)
+        self.assertEqual(results['second'][0]['result'], bulk.UNCHANGED)
+        self.assertWithinCap([device_id])
+
+    def test_batches_and_repeated_devices(self):
+        # Batches of two devices, every device requested by two threads.
+        pks = [device.pk for device in self.devices[:self.threads]]
+        installed = self.hammer([[pks[index], pks[(index + 1) % len(pks)]] for index in range(self.threads)])
+        self.assertWithinCap(installed)
+        self.assertEqual(len({item['id'] for item in installed}), len(installed))
+
+
+class DatabaseStatsTests(AccountsAPITestCase):
+    """
+    The connection metrics of the worker process are exposed to admin users.
+    """
+
+    def test_connection_metrics(self):
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get(reverse('stats-database')).status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('stats-database'))
+        self.assertEqual(response.status_code, 200)
+        metrics = response.json()['databases']['default']
+        if not connection.settings_dict['OPTIONS'].get('pool'):
+            self.assertEqual(metrics, {'pooled': False, 'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                                       'health_checks': True})
+            return
+        self.assertTrue(metrics['pooled'])
+        self.assertEqual(metrics['max_size'], settings.DB_POOL_MAX_SIZE)
+        self.assertGreaterEqual(metrics['in_use'], 1)  # The connection of the test.
+        self.assertEqual(metrics['saturation'], round(metrics['in_use'] / metrics['max_size'], 4))
+        self.assertGreaterEqual(metrics['requests'], 1)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1.0, METRICS_SERVER_TIMING=True, METRICS_TOKEN='secret')
+class RequestMetricsTests(AccountsAPITestCase):
+    """
+    Requests are measured by viewset and action; sampled requests report their
+    database and serialization time, and /metrics serves the histograms.
+    """
+
+    def setUp(self):
+        super().setUp()
+        metrics_registry.reset()
+
+    def get_histogram(self, name, **labels):
+        histograms, _ = metrics_registry.collect()
+        for (metric, metric_labels), histogram in histograms.items():
+            if metric == name and labels.items() <= dict(metric_labels).items():
+                return histogram
+        return None
+
+    def test_request_histograms(self):
+        self.seed(3)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('device-list'))
+        self.assertEqual(response.status_code, 200)
+
+        db, serialize, total = response['Server-Timing'].split(', ')
+        self.assertRegex(db, r'^db;dur=[\d.]+;desc="\d+ queries"$')
+        self.assertRegex(serialize, r'^serialize;dur=[\d.]+$')
+        self.assertRegex(total, r'^total;dur=[\d.]+$')
+
+        labels = {'view': 'DeviceViewSet', 'action': 'list'}
+        counts, _, count = self.get_histogram(REQUEST_DURATION, method='GET', status='200', **labels)
+        self.assertEqual((sum(counts), count), (1, 1))
+        _, queries, _ = self.get_histogram(REQUEST_DB_QUERIES, **labels)
+        self.assertEqual(queries, int(db.split('desc="')[1].split()[0]))
+        self.assertGreater(queries, 0)
+        self.assertGreater(self.get_histogram(REQUEST_SERIALIZATION_DURATION, **labels)[1], 0)
+
+    def test_custom_actions(self):
+        self.seed(1)
+        device, software = Device.objects.get(), Software.objects.get()
+        self.client.force_authenticate(self.admin)
+        self.client.post(reverse('device-assign', args=[device.pk]), {'user_id': self.member.pk}, format='json')
+        self.client.post(reverse('software-install', args=[software.pk]), {'device_id': device.pk}, format='json')
+        self.client.post(reverse('user-activate', args=[self.member.pk]))
+
+        for view, action in [('DeviceViewSet', 'assign'), ('SoftwareViewSet', 'install'),
+                             ('UserViewSet', 'activate')]:
+            with self.subTest(action=action):
+                self.assertIsNotNone(self.get_histogram(REQUEST_DURATION, view=view, action=action, method='POST'))
+                self.assertGreater(self.get_histogram(REQUEST_DB_QUERIES, view=view, action=action)[1], 0)
+
+    @override_settings(METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_requests(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('device-list'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertIsNotNone(self.get_histogram(REQUEST_DURATION, view='DeviceViewSet', action='list'))
+        self.assertIsNone(self.get_histogram(REQUEST_DB_QUERIES, view='DeviceViewSet', action='list'))
+
+    def test_metrics_endpoint(self):
+        self.client.force_authenticate(self.admin)
+        self.client.get(reverse('device-list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 404)
+
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn(f"# TYPE {REQUEST_DURATION} histogram", body)
+        self.assertRegex(
+            body, f'{REQUEST_DURATION}_count{{worker="[^"]+",view="DeviceViewSet",action="list",method="GET",'
+                  f'status="200"}} 1'
+        )
+        self.assertRegex(body, f'{REQUEST_DURATION}_bucket{{worker="[^"]+",view="DeviceViewSet",action="list",'
+                               f'method="GET",status="200",le="\\+Inf"}} 1')
+        self.assertIn('accounts_log_records_dropped_total{worker=', body)
+
+    def test_workers_are_merged(self):
+        labels = (('view', 'DeviceViewSet'), ('action', 'list'))
+        other = MetricsRegistry()
+        other.observe(REQUEST_DB_QUERIES, labels, 4)
+        with mock.patch('socket.gethostname', return_value='other'):
+            other.publish(force=True)
+        metrics_registry.observe(REQUEST_DB_QUERIES, labels, 2)
+
+        # One series per worker, so the expiry of a worker never lowers a series.
+        other_worker = f"other:{os.getpid()}"
+        counts, total, count = self.get_histogram(REQUEST_DB_QUERIES, worker=other_worker, **dict(labels))
+        self.assertEqual((total, count, sum(counts)), (4, 1, 1))
+        histograms, _ = metrics_registry.collect()
+        series = [
+            dict(metric_labels)['worker'] for metric, metric_labels in histograms
+            if metric == REQUEST_DB_QUERIES
+        ]
+        self.assertEqual(len(series), 2)
+        self.assertIn(other_worker, series)
+
+        cache.delete(WORKER_KEY.format(slot=other._slot))
+        _, total, count = self.get_histogram(REQUEST_DB_QUERIES, **dict(labels))
+        self.assertEqual((total, count), (2, 1))
+
+
+class DatasetTests(AccountsAPITestCase):
+    """
+    The synthetic dataset generator writes consistent data, usable through the API.
+    """
+    scale = ['--departments', '3', '--users', '20', '--suppliers', '2', '--softwares', '5', '--devices', '30',
+             '--batch-size', '7']
+
+    def generate(self, *args):
+        output = io.StringIO()
+        call_command('generate_dataset', *self.scale, *args, stdout=output, stderr=io.StringIO())
+        return json.loads(output.getvalue())
+
+    def test_generate_dataset(self):
+        methods = ['bulk', 'copy'] if connection.vendor == 'postgresql' else ['bulk']
+        for method in methods:
+            with self.subTest(method=method):
+                counts = self.generate('--prefix', method, '--method', method)
+                self.assertEqual(
+                    (counts['departments'], counts['users'], counts['suppliers'], counts['softwares'],
+                     counts['devices']),
+                    (3, 20, 2, 5, 30)
+                )
+                devices = Device.objects.filter(user__username__startswith=f"{method}-")
+                self.assertEqual(devices.count(), 30)
+                self.assertEqual(
+                    MaintenanceIntervention.objects.filter(device__in=devices).count(), counts['interventions']
+                )
+                self.assertEqual(
+                    Software.installed_on.through.objects.filter(device__in=devices).count(), counts['installations']
+                )
+        # Installations never exceed the seats, and the counters are rebuilt.
+        self.assertFalse(Software.objects.annotate(
+            installation_count=Count('installed_on')).filter(installation_count__gt=F('max_installations')).exists())
+        self.assertEqual(stats.check(), {})
+
+        with self.assertRaises(CommandError):
+            self.generate('--prefix', methods[0])
+
+    def test_generated_users_can_log_in(self):
+        self.generate('--password', 'generated-password')
+        response = self.client.post(reverse('rest_login'), {
+            'username': 'synthetic-user-0', 'password': 'generated-password'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.json()['key']}")
+        response = self.client.get(reverse('device-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['results'])
+
+    def test_benchmark_comparison(self):
+        baseline = {'endpoints': {'device_list': {'p50_us': 100.0, 'p95_us': 200.0, 'queries': 4},
+                                  'stats': {'p50_us': 10.0, 'p95_us': 20.0, 'queries': 2}}}
+        results = {'endpoints': {'device_list': {'p50_us': 100.0, 'p95_us': 210.0, 'queries': 5},
+                                 'stats': {'p50_us': 10.0, 'p95_us': 30.0, 'queries': 2},
+                                 'search': {'p50_us': 10.0, 'p95_us': 30.0, 'queries': 2}}}
+        regressions = compare_benchmarks(results, baseline, threshold=0.2)
+        self.assertEqual(set(regressions), {'endpoints.device_list', 'endpoints.stats'})
+        self.assertEqual(regressions['endpoints.stats']['ratio'], 1.5)
+        self.assertEqual(regressions['endpoints.device_list']['queries'], [4, 5])
+
+
+class PreflightTests(TestCase):
+    """
+    The preflight command only does the startup work that is needed.
+    """
+
+    def test_pending_migrations(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_pending_migrations(), [])
+        MigrationRecorder(connection).record_unapplied('accounts', '0008_audit_events')
+        self.assertEqual(get_pending_migrations(), [('accounts', '0008_audit_events')])
+        with self.assertRaisesMessage(CommandError, 'accounts.0008_audit_events'):
+            call_command('preflight', '--no-static', '--no-warm-up', stdout=io.StringIO())
+
+    def test_static_files_are_collected_when_changed(self):
+        with tempfile.TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root):
+            self.assertTrue(collect_static())
+            self.assertTrue(os.path.exists(os.path.join(static_root, 'admin', 'css', 'base.css')))
+            self.assertFalse(collect_static())
+            with mock.patch('accounts.preflight.get_static_hash', return_value='changed'):
+                self.assertTrue(collect_static())
+
+    def test_warm_up(self):
+        output = io.StringIO()
+        call_command('preflight', '--no-static', stdout=output)
+        self.assertIn('Migrations: up to date', output.getvalue())
+        self.assertEqual(set(warm_up()), {'urls', 'serializers', 'database'})
+
+
+class AuditLogTests(AccountsAPITestCase):
+    """
+    API writes are recorded as structured audit events, emitted by the log writer
+    thread and optionally stored in batches in the audit table.
+    """
+
+    def test_writes_are_audited(self):
+        self.client.force_authenticate(self.admin)
+        with self.assertLogs(audit_logger, 'INFO') as logs:
+            response = self.client.post(reverse('device-list'), {
+                'user': self.admin.pk, 'brand': 'Brand', 'name': 'Laptop', 'serial_number': 'SN-AUDIT',
+                'purchase_date': '2024-01-01'
+            })
+            device_id = response.json()['id']
+            self.client.post(reverse('device-assign', args=[device_id]), {})
+            self.client.delete(reverse('device-detail', args=[device_id]))
+
+        create, rejected, delete = [record.audit for record in logs.records]
+        self.assertEqual(create['action'], 'device.create')
+        self.assertEqual(create['outcome'], 'success')
+        self.assertEqual(create['actor'], {'id': self.admin.pk, 'username': 'admin'})
+        self.assertEqual(create['object']['type'], 'accounts.device')
+        self.assertEqual(create['object']['id'], device_id)
+        self.assertGreater(create['latency_ms'], 0)
+        self.assertEqual((rejected['action'], rejected['outcome']), ('device.assign', 'rejected'))
+        self.assertEqual(rejected['details'], {'reason': 'User ID is required.'})
+        self.assertEqual(logs.records[1].levelno, logging.WARNING)
+        # The description is taken before the deletion clears the primary key.
+        self.assertEqual((delete['action'], delete['object']['id']), ('device.delete', device_id))
+
+        line = json.loads(JSONFormatter().format(logs.records[0]))
+        self.assertEqual(line['action'], 'device.create')
+        self.assertEqual(line['logger'], 'accounts.audit')
+        self.assertIn('device.create success', line['message'])
+
+    def test_log_writer_thread(self):
+        emitted = []
+        release = threading.Event()
+
+        class SlowHandler(logging.Handler):
+            def emit(self, record):
+                release.wait(5)
+                emitted.append((record.getMessage(), threading.current_thread().name))
+
+        writer = LogWriter(max_size=2, flush_interval=0.05)
+        logger = logging.getLogger('accounts.tests.writer')
+        logger.propagate = False
+        logger.addHandler(QueueHandler([SlowHandler()], writer=writer))
+        try:
+            # The first record blocks the writer, two fill the queue, the others are dropped.
+            for index in range(6):
+                logger.warning('record %s', index)
+            self.assertGreaterEqual(writer.dropped, 2)
+            release.set()
+            writer.flush(timeout=5)
+            self.assertEqual(emitted[0], ('record 0', 'log-writer'))
+            self.assertEqual(len(emitted), 6 - writer.dropped)
+        finally:
+            release.set()
+            writer.stop()
+            logger.handlers.clear()
+
+    def test_audit_table_batches(self):
+        self.client.force_authenticate(self.admin)
+        with self.assertLogs(audit_logger, 'INFO') as logs:
+            for index in range(4):
+                self.client.post(reverse('supplier-list'), {'name': f"Supplier {index}", 'telephone': f"555000000{index}"})
+        handler = AuditTableHandler(batch_size=3)
+        with CaptureQueriesContext(connection) as context:
+            for record in logs.records:
+                handler.handle(record)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(AuditEvent.objects.count(), 3)
+        handler.flush()
+        self.assertEqual(AuditEvent.objects.count(), 4)
+        event = AuditEvent.objects.order_by('pk').first()
+        self.assertEqual((event.action, event.outcome, event.actor_username), ('supplier.create', 'success', 'admin'))
+        self.assertEqual(event.object_type, 'accounts.supplier')
+        self.assertEqual(event.object_repr, 'Supplier 0')
+
+
+class BackgroundTaskTests(AccountsAPITestCase):
+    """
+    Periodic tasks, run eagerly in the tests.
+    """
+
+    def create_software(self, name, expires_in, device=None):
+        software = Software.objects.create(
+            name=name, version='1.0', supplier=self.supplier, license_key='KEY',
+            expire_date=timezone.localdate() + datetime.timedelta(days=expires_in), max_installations=10
+        )
+        if device is not None:
+            software.installed_on.add(device)
+        return software
+
+    def test_license_expiry_digests(self):
+        other = Department.objects.create(name='Sales')
+        manager = create_verified_user('manager', is_staff=True, department=other)
+        device = Device.objects.create(user=self.admin, assigned_to=self.member, brand='Brand', name='Device',
+                                       serial_number='SN', purchase_date=datetime.date(2024, 1, 1))
+        expiring = self.create_software('Expiring', 10, device)
+        self.create_software('Later', 90, device)
+        self.create_software('Unused', 5)
+
+        result = tasks.scan_license_expiry.delay().get()
+        self.assertEqual(result, {'licenses': 1, 'digests': 1})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.admin.email])
+        self.assertIn('Expiring 1.0', mail.outbox[0].body)
+        self.assertNotIn(manager.email, mail.outbox[0].to)
+        # Nobody received the unused license: it is left for the next scan.
+        self.assertIsNone(Software.objects.get(name='Unused').expiry_notified_on)
+
+        # Notified licenses are not sent again, until they are renewed.
+        self.assertEqual(tasks.scan_license_expiry.delay().get(), {'licenses': 0, 'digests': 0})
+        expiring.expire_date += datetime.timedelta(days=1)
+        expiring.save()
+        self.assertEqual(tasks.scan_license_expiry.delay().get(), {'licenses': 1, 'digests': 1})
+
+    def test_license_expiry_digests_without_staff_go_to_superusers(self):
+        self.admin.is_superuser = True
+        self.admin.save()
+        other = Department.objects.create(name='Sales')
+        user = create_verified_user('seller', department=other)
+        device = Device.objects.create(user=user, assigned_to=user, brand='Brand', name='Device',
+                                       serial_number='SN', purchase_date=datetime.date(2024, 1, 1))
+        self.create_software('Expiring', 10, device)
+        self.create_software('Unused', 5)
+
+        self.assertEqual(tasks.scan_license_expiry.delay().get(), {'licenses': 2, 'digests': 2})
+        self.assertEqual([message.to for message in mail.outbox], [[self.admin.email]] * 2)
+        self.assertFalse(Software.objects.filter(expiry_notified_on__isnull=True).exists())
+
+    def test_license_expiry_failed_digest_keeps_the_sent_ones(self):
+        self.admin.is_superuser = True
+        self.admin.save()
+        device = Device.objects.create(user=self.admin, assigned_to=self.member, brand='Brand', name='Device',
+                                       serial_number='SN', purchase_date=datetime.date(2024, 1, 1))
+        self.create_software('Expiring', 10, device)
+        self.create_software('Unused', 5)
+
+        backend = mail.get_connection().__class__
+        send_messages = backend.send_messages
+        calls = []
+
+        def fail_second(connection, messages):
+            calls.append(messages)
+            if len(calls) == 2:
+                raise ConnectionRefusedError()
+            return send_messages(connection, messages)
+
+        with mock.patch.object(backend, 'send_messages', fail_second), self.assertRaises(OSError):
+            tasks.scan_license_expiry.run()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Software.objects.filter(expiry_notified_on__isnull=False).count(), 1)
+
+        # The retry only sends the digest that failed.
+        self.assertEqual(tasks.scan_license_expiry.delay().get(), {'licenses': 1, 'digests': 1})
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertNotEqual(mail.outbox[0].body, mail.outbox[1].body)
+
+    def test_license_expiry_shared_license_waits_for_every_digest(self):
+        other = Department.objects.create(name='Sales')
+        create_verified_user('manager', is_staff=True, department=other)
+        seller = create_verified_user('seller', department=other)
+        software = self.create_software('Shared', 10)
+        for user in (self.member, seller):
+            software.installed_on.add(Device.objects.create(
+                user=self.admin, assigned_to=user, brand='Brand', name='Device', serial_number=f"SN-{user.pk}",
+                purchase_date=datetime.date(2024, 1, 1)
+            ))
+
+        backend = mail.get_connection().__class__
+        send_messages = backend.send_messages
+        calls = []
+
+        def fail_second(connection, messages):
+            calls.append(messages)
+            if len(calls) == 2:
+                raise ConnectionRefusedError()
+            return send_messages(connection, messages)
+
+        with mock.patch.object(backend, 'send_messages', fail_second), self.assertRaises(OSError):
+            tasks.scan_license_expiry.run()
+        self.assertEqual(len(mail.outbox), 1)
+        # One department was not warned: the license is still pending, for both.
+        software.refresh_from_db()
+        self.assertIsNone(software.expiry_notified_on)
+        self.assertEqual(tasks.scan_license_expiry.delay().get(), {'licenses': 1, 'digests': 2})
+        self.assertEqual(len(mail.outbox), 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Scans are kept apart with an advisory lock on PostgreSQL')
+    def test_license_expiry_concurrent_scan_sends_nothing(self):
+        device = Device.objects.create(user=self.admin, assigned_to=self.member, brand='Brand', name='Device',
+                                       serial_number='SN', purchase_date=datetime.date(2024, 1, 1))
+        self.create_software('Expiring', 10, device)
+        running = connection.copy()
+        with running.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [tasks.SCAN_LOCK_KEY])
+            try:
+                self.assertEqual(tasks.scan_license_expiry.delay().get(), {'licenses': 0, 'digests': 0})
+            finally:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [tasks.SCAN_LOCK_KEY])
+        running.close()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(tasks.scan_license_expiry.delay().get(), {'licenses': 1, 'digests': 1})
+
+    def test_recompute_derived_data(self):
+        self.seed(2)
+        SummaryCounter.objects.all().delete()
+        repaired = tasks.recompute_derived_data.delay().get()
+        self.assertEqual(set(repaired), set(stats.METRICS))
+        self.assertEqual(stats.check(), {})
+
+    def test_beat_schedule(self):
+        for entry in settings.CELERY_BEAT_SCHEDULE.values():
+            self.assertIn(entry['task'], celery_app.tasks)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are checked on PostgreSQL only')
+class FilterIndexTests(TestCase):
+    """
+    Every declared filter is served by an index on a large dataset: the paginated
+    query of each filter must not fall back to a sequential scan.
+    """
+    devices = 20000
+    large_tables = [Device, MaintenanceIntervention, Software, Supplier, Software.installed_on.through]
+
+    @classmethod
+    def setUpTestData(cls):
+        departments = Department.objects.bulk_create(
+            Department(name=f"Department {index}") for index in range(50)
+        )
+        users = User.objects.bulk_create(
+            User(username=f"user-{index}", email=f"user-{index}@example.com",
+                 department=departments[index % len(departments)])
+            for index in range(2000)
+        )
+        suppliers = Supplier.objects.bulk_create(
+            Supplier(name=f"Supplier {index}", telephone=f"{index:010d}") for index in range(5000)
+        )
+        statuses = [ACTIVE] * 18 + [ON_MAINTENANCE, INACTIVE]
+        devices = Device.objects.bulk_create(
+            Device(
+                user=users[index % len(users)],
+                assigned_to=users[(index * 7) % len(users)],
+                brand=f"Brand {index % 500}",
+                name=f"Device {index}",
+                serial_number=f"SN-{index}",
+                status=statuses[index % len(statuses)],
+                purchase_date=datetime.date(2015, 1, 1) + datetime.timedelta(days=index % 3000)
+            )
+            for index in range(cls.devices)
+        )
+        MaintenanceIntervention.objects.bulk_create(
+            MaintenanceIntervention(
+                device=devices[index % len(devices)],
+                description='Check',
+                date_intervention=datetime.date(2015, 1, 1) + datetime.timedelta(days=index % 3000),
+                technician=users[index % len(users)],
+                status=PENDING if index % 50 == 0 else COMPLETED
+            )
+            for index in range(cls.devices)
+        )
+        softwares = Software.objects.bulk_create(
+            Software(
+                name=f"Software {index % 2000}",
+                version=f"{index % 7}.0",
+                supplier=suppliers[index % len(suppliers)],
+                license_key=f"KEY-{index}",
+                expire_date=datetime.date(2025, 1, 1) + datetime.timedelta(days=index % 3000),
+                max_installations=10
+            )
+            for index in range(cls.devices)
+        )
+        Software.installed_on.through.objects.bulk_create(
+            Software.installed_on.through(device=devices[index % len(devices)],
+                                          software=softwares[(index * 13 + index // len(devices)) % len(softwares)])
+            for index in range(cls.devices * 2)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = users[3]
+        cls.supplier = suppliers[3]
+        cls.device = devices[3]
+
+    def get_cases(self):
+        """
+        Return (viewset, filter parameters) for every declared filter.
+        """
+        return [
+            (DeviceViewSet, {'status': INACTIVE}),
+            (DeviceViewSet, {'status__in': f"{INACTIVE},{ON_MAINTENANCE}"}),
+            (DeviceViewSet, {'brand': 'Brand 3'}),
+            (DeviceViewSet, {'user': self.user.pk}),
+            (DeviceViewSet, {'assigned_to': self.user.pk}),
+            (DeviceViewSet, {'department': self.user.department_id}),
+            (DeviceViewSet, {'purchase_date_after': '2020-01-01', 'purchase_date_before': '2020-01-31'}),
+            (MaintenanceInterventionViewSet, {'status': PENDING}),
+            (MaintenanceInterventionViewSet, {'status__in': f"{PENDING},{IN_PROGRESS}"}),
+            (MaintenanceInterventionViewSet, {'open': 'true'}),
+            (MaintenanceInterventionViewSet, {'device': self.device.pk}),
+            (MaintenanceInterventionViewSet, {'technician': self.user.pk}),
+            (MaintenanceInterventionViewSet, {
+                'date_intervention_after': '2020-01-01', 'date_intervention_before': '2020-01-31'
+            }),
+            (SoftwareViewSet, {'name': 'Software 3'}),
+            (SoftwareViewSet, {'supplier': self.supplier.pk}),
+            (SoftwareViewSet, {'expire_date_after': '2026-01-01', 'expire_date_before': '2026-01-31'}),
+            (SupplierViewSet, {'name': 'Supplier 3'}),
+            (SupplierViewSet, {'telephone': self.supplier.telephone}),
+            (UserViewSet, {'department': self.user.department_id}),
+        ]
+
+    def test_filters_do_not_scan_large_tables(self):
+        for viewset, params in self.get_cases():
+            with self.subTest(viewset=viewset.__name__, params=params):
+                model = viewset.queryset.model
+                filterset = viewset.filterset_class(params, queryset=model.objects.all())
+                self.assertTrue(filterset.is_valid(), filterset.errors)
+                ordering = [
+                    field for field in viewset.ordering if field.lstrip('-') != 'is_current_user'
+                ]
+                queryset = filterset.qs.order_by(*ordering)[:KeysetPagination.page_size + 1]
+                plan = queryset.explain()
+                for table in self.large_tables:
+                    self.assertNotIn(f"Seq Scan on {table._meta.db_table}", plan)
+
+    def test_visibility_rules_do_not_scan_large_tables(self):
+        for viewset in (DeviceViewSet, MaintenanceInterventionViewSet, SoftwareViewSet):
+            with self.subTest(viewset=viewset.__name__):
+                model = viewset.queryset.model
+                queryset = model.objects.visible_to(self.user).order_by(*viewset.ordering)
+                plan = queryset[:KeysetPagination.page_size + 1].explain()
+                for table in self.large_tables:
+                    self.assertNotIn(f"Seq Scan on {table._meta.db_table}", plan)
+        # The software of the user are found without a DISTINCT over their installations.
+        plan = Software.objects.visible_to(self.user).explain()
+        self.assertNotIn('Unique', plan)
+        visible = list(Software.objects.visible_to(self.user).values_list('pk', flat=True))
+        self.assertEqual(len(visible), len(set(visible)))
+        self.assertEqual(set(visible), set(Software.objects.filter(installed_on__assigned_to=self.user)
+                                           .values_list('pk', flat=True)))
+
+    def test_search_uses_trigram_indexes(self):
+        # At this size the planner may still prefer a sequential scan, so sequential
+        # scans are disabled to check that every condition can be answered by an index.
+        cases = [
+            (DeviceViewSet, 'SN-1234'),
+            (DeviceViewSet, 'device 4242'),
+            (SoftwareViewSet, 'KEY-777'),
+            (SupplierViewSet, 'supplier 3131'),
+            (UserViewSet, 'user-99@'),
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            for viewset, term in cases:
+                with self.subTest(viewset=viewset.__name__, term=term):
+                    model = viewset.queryset.model
+                    queryset = search_queryset(model.objects.all(), viewset.search_fields, term.split())
+                    plan = queryset[:KeysetPagination.page_size + 1].explain()
+                    self.assertNotIn(f"Seq Scan on {model._meta.db_table}", plan)
+                    self.assertIn('_trgm_idx', plan)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
@@ -1,16 +1,35 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
+from rest_framework.routers import DefaultRouter, Route
 from .views import (
     DepartmentViewSet,
     UserViewSet,
     MaintenanceInterventionViewSet,
     DeviceViewSet,
     SupplierViewSet,
-    SoftwareViewSet
+    SoftwareViewSet,
+    DeviceInterventionViewSet,
+    SoftwareInstallationViewSet,
+    SearchView,
+    SyncView,
+    StatsView,
+    DatabaseStatsView
 )
 
-# Initialize the DefaultRouter
-router = DefaultRouter()
+
+class BulkRouter(DefaultRouter):
+    """
+    DefaultRouter also routing PATCH on the list endpoints, to the
+    `bulk_partial_update` action of the viewsets that have one (BulkWriteMixin).
+    """
+    routes = [
+        route._replace(mapping={**route.mapping, 'patch': 'bulk_partial_update'})
+        if isinstance(route, Route) and route.name == '{basename}-list' else route
+        for route in DefaultRouter.routes
+    ]
+
+
+# Initialize the router
+router = BulkRouter()
 
 # Register each ViewSet with the router
 # The 'basename' argument ensures unique URL naming, especially useful if querysets lack a .model attribute
@@ -20,8 +39,18 @@ router.register(r'maintenance-interventions', MaintenanceInterventionViewSet, ba
 router.register(r'devices', DeviceViewSet, basename='device')
 router.register(r'suppliers', SupplierViewSet, basename='supplier')
 router.register(r'softwares', SoftwareViewSet, basename='software')
+router.register(
+    r'devices/(?P<device_pk>[^/.]+)/interventions', DeviceInterventionViewSet, basename='device-intervention'
+)
+router.register(
+    r'softwares/(?P<software_pk>[^/.]+)/installations', SoftwareInstallationViewSet, basename='software-installation'
+)
 
 # Define the URL patterns by including the router's URLs
 urlpatterns = [
+    path('search/', SearchView.as_view(), name='search'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('stats/database/', DatabaseStatsView.as_view(), name='stats-database'),
     path('', include(router.urls)),  # Includes all routes generated by the router
 ]
@@ -1,19 +1,53 @@
 import logging
 
+from django.conf import settings
 from django.db.models import Case, When, Value, IntegerField
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.mixins import ListModelMixin
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
-
+from rest_framework.views import APIView
+
+from .database import get_connection_metrics
+from .filters import (
+    DeviceFilterSet,
+    InstallationFilterSet,
+    MaintenanceInterventionFilterSet,
+    SoftwareFilterSet,
+    SupplierFilterSet,
+    UserFilterSet
+)
+from .exports import DeviceExport, MaintenanceInterventionExport, SoftwareExport
+from .audit import ERROR, REJECTED
+from .bulk import assign_devices, install_software, transition_devices, uninstall_software
+from .mixins import (
+    AsyncReadMixin,
+    AuditMixin,
+    BulkWriteMixin,
+    CachedResponseMixin,
+    ConditionalRequestMixin,
+    ExportMixin,
+    QueryPlanMixin
+)
 from .permissions import IsActiveAndVerified
+from .metrics import registry, render_prometheus
+from .search import clean_search_term, search_queryset
+from .stats import get_dashboard
+from .sync import RESOURCES as SYNC_RESOURCES, get_changes
 from .models import (
     Department,
     User,
     MaintenanceIntervention,
     Device,
     Supplier,
-    Software
+    Software,
+    Installation
 )
 from .serializers import (
     DepartmentSerializer,
@@ -21,20 +55,38 @@ from .serializers import (
     MaintenanceInterventionSerializer,
     DeviceSerializer,
     SupplierSerializer,
-    SoftwareSerializer
+    SoftwareSerializer,
+    SoftwareInstallationSerializer,
+    UserSearchSerializer,
+    DeviceSearchSerializer,
+    SupplierSearchSerializer,
+    SoftwareSearchSerializer,
+    DeviceAssignmentSerializer,
+    DeviceTransitionSerializer,
+    InstallationSerializer,
+    DeviceBulkSerializer,
+    SupplierBulkSerializer,
+    SoftwareBulkSerializer
+)
+from .query_plans import (
+    USER_READ_PLAN,
+    MAINTENANCE_INTERVENTION_READ_PLAN,
+    DEVICE_READ_PLAN,
+    SOFTWARE_READ_PLAN,
+    INSTALLATION_READ_PLAN
 )
-
-# Configure a logger for this module
-logger = logging.getLogger(__name__)
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class DepartmentViewSet(AuditMixin, ConditionalRequestMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing departments.
     Allows all authenticated users to perform CRUD operations.
     """
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
+    ordering = ('id',)
+    ordering_fields = ['id', 'name']
+    cache_dependencies = (Department,)
 
     def get_permissions(self):
         """
@@ -48,29 +100,14 @@ class DepartmentViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated, IsActiveAndVerified]
         return [permission() for permission in permission_classes]
 
-    def perform_create(self, serializer):
+    def get_cache_scope(self):
         """
-        Log department creation.
+        Departments are public, every user shares the same cached responses.
         """
-        department = serializer.save()
-        logger.info(f"Department created: {department.name} by user {self.request.user.username}")
+        return 'public'
 
-    def perform_update(self, serializer):
-        """
-        Log department update.
-        """
-        department = serializer.save()
-        logger.info(f"Department updated: {department.name} by user {self.request.user.username}")
 
-    def perform_destroy(self, instance):
-        """
-        Log department deletion.
-        """
-        logger.info(f"Department deleted: {instance.name} by user {self.request.user.username}")
-        instance.delete()
-
-
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(AuditMixin, CachedResponseMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing users.
     - Admin users can create, update, and delete users.
@@ -78,7 +115,16 @@ class UserViewSet(viewsets.ModelViewSet):
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    ordering = ('is_current_user', 'id')
+    ordering_fields = ['id', 'username']
+    filterset_class = UserFilterSet
+    search_fields = ['first_name', 'last_name', 'email']
+    cache_dependencies = (User, Department)
     permission_classes = [IsAuthenticated, IsActiveAndVerified]
+    query_plans = {
+        'list': USER_READ_PLAN,
+        'retrieve': USER_READ_PLAN,
+    }
 
     def get_permissions(self):
         """
@@ -92,43 +138,38 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated, IsActiveAndVerified]
         return [permission() for permission in permission_classes]
 
+    def get_cache_scope(self):
+        """
+        Every user sees a different list, as the current user is listed first.
+        """
+        return f"user:{self.request.user.pk}"
+
     def get_queryset(self):
         """
         Optionally restricts the returned users to active users only.
         Admins see all users; others see only their user.
+        The current user is always listed first through the `is_current_user`
+        annotation, which is also the leading key of the pagination cursor.
         """
         user = self.request.user
-        if user.is_staff or user.is_superuser:
-            return User.objects.annotate(
-                is_current_user=Case(
-                    When(id=user.id, then=Value(0)),
-                    default=Value(1),
-                    output_field=IntegerField(),
-                )
-            ).order_by('is_current_user')
-        return User.objects.filter(id=user.id)
-
-    def perform_create(self, serializer):
-        """
-        Log user creation.
-        """
-        user = serializer.save()
-        logger.info(f"User created: {user.username} by admin {self.request.user.username}")
-
-    def perform_update(self, serializer):
-        """
-        Log user update.
-        """
-        user = serializer.save()
-        logger.info(f"User updated: {user.username} by user {self.request.user.username}")
+        queryset = User.objects.annotate(
+            is_current_user=Case(
+                When(id=user.id, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('is_current_user', 'id')
+        if not (user.is_staff or user.is_superuser):
+            queryset = queryset.filter(id=user.id)
+        return self.apply_query_plan(queryset)
 
     def perform_destroy(self, instance):
         """
-        Log user deactivation.
+        Deactivate the user instead of deleting it.
         """
         instance.is_active = False
         instance.save()
-        logger.info(f"User deactivated: {instance.username} by user {self.request.user.username}")
+        self.audit('deactivate', instance)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser, IsActiveAndVerified])
     def activate(self, request, pk=None):
@@ -140,14 +181,15 @@ class UserViewSet(viewsets.ModelViewSet):
             user = self.get_object()
             user.is_active = True
             user.save()
-            logger.info(f"User activated: {user.username} by admin {request.user.username}")
+            self.audit('activate', user)
             return Response({'status': 'User activated successfully.'}, status=status.HTTP_200_OK)
         except Exception as e:
-            logger.error(f"Error activating user {pk}: {str(e)}")
+            self.audit('activate', outcome=ERROR, level=logging.ERROR, user_id=pk, error=str(e))
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MaintenanceInterventionViewSet(viewsets.ModelViewSet):
+class MaintenanceInterventionViewSet(AuditMixin, ConditionalRequestMixin, CachedResponseMixin, ExportMixin, QueryPlanMixin,
+                                     AsyncReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing maintenance interventions.
     - Admin users can view all interventions.
@@ -155,25 +197,32 @@ class MaintenanceInterventionViewSet(viewsets.ModelViewSet):
     """
     queryset = MaintenanceIntervention.objects.all()
     serializer_class = MaintenanceInterventionSerializer
+    ordering = ('-date_intervention', '-id')
+    ordering_fields = ['date_intervention', 'id']
+    filterset_class = MaintenanceInterventionFilterSet
+    cache_dependencies = (MaintenanceIntervention,)
     permission_classes = [IsAuthenticated, IsActiveAndVerified]
+    export_class = MaintenanceInterventionExport
+    query_plans = {
+        'list': MAINTENANCE_INTERVENTION_READ_PLAN,
+        'retrieve': MAINTENANCE_INTERVENTION_READ_PLAN,
+    }
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_staff:
-            return MaintenanceIntervention.objects.all()
         # Regular users see only interventions where they are the technician.
-        return MaintenanceIntervention.objects.filter(technician=user)
+        return self.apply_query_plan(MaintenanceIntervention.objects.visible_to(self.request.user))
 
     def perform_create(self, serializer):
         """
-        Assign the current user as the technician if none is provided and log the creation.
+        Assign the current user as the technician if none is provided.
         """
         technician = serializer.validated_data.get('technician', self.request.user)
         intervention = serializer.save(technician=technician)
-        logger.info(f"Maintenance Intervention created: {intervention.id} by user {self.request.user.username}")
+        self.audit('create', intervention)
 
 
-class DeviceViewSet(viewsets.ModelViewSet):
+class DeviceViewSet(AuditMixin, ConditionalRequestMixin, CachedResponseMixin, ExportMixin, QueryPlanMixin,
+                    BulkWriteMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing devices.
     - Admin users can view and manage all devices.
@@ -181,35 +230,22 @@ class DeviceViewSet(viewsets.ModelViewSet):
     """
     queryset = Device.objects.all()
     serializer_class = DeviceSerializer
+    bulk_serializer_class = DeviceBulkSerializer
+    ordering = ('-purchase_date', '-id')
+    ordering_fields = ['purchase_date', 'id']
+    filterset_class = DeviceFilterSet
+    search_fields = ['serial_number', 'brand', 'name']
+    cache_dependencies = (Device, MaintenanceIntervention, Software)
     permission_classes = [IsAuthenticated, IsActiveAndVerified]
+    export_class = DeviceExport
+    query_plans = {
+        'list': DEVICE_READ_PLAN,
+        'retrieve': DEVICE_READ_PLAN,
+    }
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_staff:
-            return Device.objects.all()
         # Regular users see only devices assigned to them.
-        return Device.objects.filter(assigned_to=user)
-
-    def perform_create(self, serializer):
-        """
-        Log device creation.
-        """
-        device = serializer.save()
-        logger.info(f"Device created: {device.serial_number} by user {self.request.user.username}")
-
-    def perform_update(self, serializer):
-        """
-        Log device update.
-        """
-        device = serializer.save()
-        logger.info(f"Device updated: {device.serial_number} by user {self.request.user.username}")
-
-    def perform_destroy(self, instance):
-        """
-        Log device deletion.
-        """
-        logger.info(f"Device deleted: {instance.serial_number} by user {self.request.user.username}")
-        instance.delete()
+        return self.apply_query_plan(Device.objects.visible_to(self.request.user))
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser, IsActiveAndVerified])
     def assign(self, request, pk=None):
@@ -220,52 +256,70 @@ class DeviceViewSet(viewsets.ModelViewSet):
         device = self.get_object()
         user_id = request.data.get('user_id')
         if not user_id:
-            logger.warning(f"Assign device failed: No user_id provided by user {request.user.username}")
+            self.audit('assign', device, outcome=REJECTED, level=logging.WARNING, reason='User ID is required.')
             return Response({'error': 'User ID is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             user = User.objects.get(pk=user_id)
             device.assigned_to = user
             device.save()
-            logger.info(f"Device {device.serial_number} assigned to user {user.username} by admin {request.user.username}")
+            self.audit('assign', device, user_id=user.pk)
             return Response({'status': 'Device assigned successfully.'}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
-            logger.warning(f"Assign device failed: User ID {user_id} does not exist (requested by user {request.user.username})")
+            self.audit('assign', device, outcome=REJECTED, level=logging.WARNING, reason='User does not exist.',
+                       user_id=user_id)
             return Response({'error': 'User does not exist.'}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='bulk-assign',
+            permission_classes=[IsAdminUser, IsActiveAndVerified])
+    def bulk_assign(self, request):
+        """
+        Assign many devices to users in one transaction.
+        Body: {"items": [{"device_id": 1, "user_id": 2}, ...]}
+        Returns the result of each item: updated, unchanged or rejected (with the error).
+        """
+        summary = self.perform_bulk(
+            DeviceAssignmentSerializer, 'device_id',
+            lambda items: assign_devices([(item['device_id'], item['user_id']) for item in items])
+        )
+        self.audit_bulk('bulk_assign', summary)
+        return Response(summary, status=status.HTTP_200_OK)
 
-class SupplierViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], url_path='bulk-status',
+            permission_classes=[IsAdminUser, IsActiveAndVerified])
+    def bulk_status(self, request):
+        """
+        Move many devices to a new status in one transaction.
+        Body: {"items": [{"device_id": 1, "status": "INACTIVE"}, ...]}
+        Returns the result of each item: updated, unchanged or rejected (with the error).
+        """
+        summary = self.perform_bulk(
+            DeviceTransitionSerializer, 'device_id',
+            lambda items: transition_devices([(item['device_id'], item['status']) for item in items])
+        )
+        self.audit_bulk('bulk_status', summary)
+        return Response(summary, status=status.HTTP_200_OK)
+
+
+class SupplierViewSet(AuditMixin, ConditionalRequestMixin, CachedResponseMixin, BulkWriteMixin,
+                      viewsets.ModelViewSet):
     """
     ViewSet for managing suppliers.
     Allows all authenticated users to perform CRUD operations.
     """
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
+    bulk_serializer_class = SupplierBulkSerializer
+    ordering = ('id',)
+    ordering_fields = ['id', 'name']
+    filterset_class = SupplierFilterSet
+    search_fields = ['name']
+    cache_dependencies = (Supplier,)
     permission_classes = [IsAuthenticated, IsActiveAndVerified]
 
-    def perform_create(self, serializer):
-        """
-        Log supplier creation.
-        """
-        supplier = serializer.save()
-        logger.info(f"Supplier created: {supplier.name} by user {self.request.user.username}")
-
-    def perform_update(self, serializer):
-        """
-        Log supplier update.
-        """
-        supplier = serializer.save()
-        logger.info(f"Supplier updated: {supplier.name} by user {self.request.user.username}")
-
-    def perform_destroy(self, instance):
-        """
-        Log supplier deletion.
-        """
-        logger.info(f"Supplier deleted: {instance.name} by user {self.request.user.username}")
-        instance.delete()
-
 
-class SoftwareViewSet(viewsets.ModelViewSet):
+class SoftwareViewSet(AuditMixin, ConditionalRequestMixin, CachedResponseMixin, ExportMixin, QueryPlanMixin,
+                      BulkWriteMixin, AsyncReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing software.
     - Admin users can view and manage all software.
@@ -273,35 +327,22 @@ class SoftwareViewSet(viewsets.ModelViewSet):
     """
     queryset = Software.objects.all()
     serializer_class = SoftwareSerializer
+    bulk_serializer_class = SoftwareBulkSerializer
+    ordering = ('expire_date', 'id')
+    ordering_fields = ['expire_date', 'name', 'id']
+    filterset_class = SoftwareFilterSet
+    search_fields = ['name', 'license_key']
+    cache_dependencies = (Software, Device)
     permission_classes = [IsAuthenticated, IsActiveAndVerified]
+    export_class = SoftwareExport
+    query_plans = {
+        'list': SOFTWARE_READ_PLAN,
+        'retrieve': SOFTWARE_READ_PLAN,
+    }
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_staff:
-            return Software.objects.all()
         # Regular users see only software installed on their devices.
-        return Software.objects.filter(installed_on__assigned_to=user).distinct()
-
-    def perform_create(self, serializer):
-        """
-        Log software creation.
-        """
-        software = serializer.save()
-        logger.info(f"Software created: {software.name} by user {self.request.user.username}")
-
-    def perform_update(self, serializer):
-        """
-        Log software update.
-        """
-        software = serializer.save()
-        logger.info(f"Software updated: {software.name} by user {self.request.user.username}")
-
-    def perform_destroy(self, instance):
-        """
-        Log software deletion.
-        """
-        logger.info(f"Software deleted: {instance.name} by user {self.request.user.username}")
-        instance.delete()
+        return self.apply_query_plan(Software.objects.visible_to(self.request.user))
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser, IsActiveAndVerified])
     def install(self, request, pk=None):
@@ -312,19 +353,225 @@ class SoftwareViewSet(viewsets.ModelViewSet):
         software = self.get_object()
         device_id = request.data.get('device_id')
         if not device_id:
-            logger.warning(f"Install software failed: No device_id provided by user {request.user.username}")
+            self.audit('install', software, outcome=REJECTED, level=logging.WARNING, reason='Device ID is required.')
             return Response({'error': 'Device ID is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            device_id = int(device_id)
+        except (TypeError, ValueError):
+            device_id = None
+
+        [item] = install_software(software.pk, [device_id])
+        if 'error' in item:
+            self.audit('install', software, outcome=REJECTED, level=logging.WARNING, reason=item['error'],
+                       device_id=device_id)
+            return Response({'error': item['error']}, status=status.HTTP_400_BAD_REQUEST)
+        self.audit('install', software, device_id=device_id)
+        return Response({'status': 'Software installed on device successfully.'}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], url_path='bulk-install',
+            permission_classes=[IsAdminUser, IsActiveAndVerified])
+    def bulk_install(self, request, pk=None):
+        """
+        Install the software on many devices in one transaction, all of them or none
+        when there are not enough seats left.
+        Body: {"items": [{"device_id": 1}, ...]}
+        Returns the result of each item: updated, unchanged or rejected (with the error).
+        """
+        software = self.get_object()
+        summary = self.perform_bulk(
+            InstallationSerializer, 'device_id',
+            lambda items: install_software(software.pk, [item['device_id'] for item in items])
+        )
+        self.audit_bulk('bulk_install', summary, target=software)
+        return Response(summary, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], url_path='bulk-uninstall',
+            permission_classes=[IsAdminUser, IsActiveAndVerified])
+    def bulk_uninstall(self, request, pk=None):
+        """
+        Remove the software from many devices in one transaction.
+        Body: {"items": [{"device_id": 1}, ...]}
+        Returns the result of each item: updated, unchanged or rejected (with the error).
+        """
+        software = self.get_object()
+        summary = self.perform_bulk(
+            InstallationSerializer, 'device_id',
+            lambda items: uninstall_software(software.pk, [item['device_id'] for item in items])
+        )
+        self.audit_bulk('bulk_uninstall', summary, target=software)
+        return Response(summary, status=status.HTTP_200_OK)
+
+
+class DeviceInterventionViewSet(CachedResponseMixin, QueryPlanMixin, ListModelMixin, viewsets.GenericViewSet):
+    """
+    Paginated, filterable list of the interventions of a device
+    (/devices/{id}/interventions/), of which the device payload embeds the latest ones.
+    The device has to be visible to the user, otherwise the response is a 404.
+    """
+    queryset = MaintenanceIntervention.objects.all()
+    serializer_class = MaintenanceInterventionSerializer
+    ordering = ('-date_intervention', '-id')
+    ordering_fields = ['date_intervention', 'id']
+    filterset_class = MaintenanceInterventionFilterSet
+    cache_dependencies = (MaintenanceIntervention, Device)
+    permission_classes = [IsAuthenticated, IsActiveAndVerified]
+    query_plans = {
+        'list': MAINTENANCE_INTERVENTION_READ_PLAN,
+    }
+
+    def get_queryset(self):
+        device = get_object_or_404(Device.objects.visible_to(self.request.user).only('id'), pk=self.kwargs['device_pk'])
+        return self.apply_query_plan(MaintenanceIntervention.objects.filter(device=device))
+
+
+class SoftwareInstallationViewSet(CachedResponseMixin, QueryPlanMixin, ListModelMixin, viewsets.GenericViewSet):
+    """
+    Paginated, filterable installation history of a software, latest first
+    (/softwares/{id}/installations/), of which the software payload embeds the latest ones.
+    - Admin users see every installation.
+    - Regular users see only the installations on their devices, of the software
+      visible to them (a 404 otherwise).
+    """
+    queryset = Installation.objects.all()
+    serializer_class = SoftwareInstallationSerializer
+    ordering = ('-installed_at', '-id')
+    ordering_fields = ['installed_at', 'id']
+    filterset_class = InstallationFilterSet
+    cache_dependencies = (Software, Device)
+    permission_classes = [IsAuthenticated, IsActiveAndVerified]
+    query_plans = {
+        'list': INSTALLATION_READ_PLAN,
+    }
 
+    def get_queryset(self):
+        user = self.request.user
+        software = get_object_or_404(Software.objects.visible_to(user).only('id'), pk=self.kwargs['software_pk'])
+        return self.apply_query_plan(Installation.objects.visible_to(user).filter(software=software))
+
+
+class SearchView(APIView):
+    """
+    Global typeahead search over devices, software, suppliers and users.
+    - q: Search words, each one must match; at least one of three characters
+    - types: Comma separated resources to search, all of them by default
+    - limit: Results per resource (default 5, at most 20)
+    Every resource is matched through its trigram indexes and ranked by relevance.
+    Users only find the rows they can see through the corresponding endpoints.
+    """
+    permission_classes = [IsAuthenticated, IsActiveAndVerified]
+    default_limit = 5
+    max_limit = 20
+
+    def get_resources(self):
+        """
+        Return the searchable resources: name -> (visible queryset, search fields, serializer).
+        """
+        user = self.request.user
+        users = User.objects.all()
+        if not (user.is_staff or user.is_superuser):
+            users = users.filter(id=user.id)
+        return {
+            'devices': (Device.objects.visible_to(user), DeviceViewSet.search_fields, DeviceSearchSerializer),
+            'softwares': (Software.objects.visible_to(user), SoftwareViewSet.search_fields, SoftwareSearchSerializer),
+            'suppliers': (Supplier.objects.all(), SupplierViewSet.search_fields, SupplierSearchSerializer),
+            'users': (users, UserViewSet.search_fields, UserSearchSerializer),
+        }
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        return max(1, min(limit, self.max_limit))
+
+    def get(self, request):
+        words = clean_search_term(request.query_params.get('q', ''), 'q')
+        limit = self.get_limit()
+        resources = self.get_resources()
+        types = request.query_params.get('types')
+        names = [name.strip() for name in types.split(',') if name.strip()] if types else list(resources)
+        unknown = [name for name in names if name not in resources]
+        if unknown:
+            raise ValidationError({'types': f"Unknown resources: {', '.join(unknown)}."})
+
+        results = {}
+        for name in names:
+            queryset, fields, serializer_class = resources[name]
+            columns = [field for field in serializer_class.Meta.fields if field != 'rank']
+            queryset = search_queryset(queryset.only(*columns), fields, words)[:limit]
+            results[name] = serializer_class(queryset, many=True).data
+        return Response({'query': ' '.join(words), 'results': results})
+
+
+class SyncView(APIView):
+    """
+    Delta sync of the inventory for offline clients (accounts.sync).
+    - changed_since: Cursor returned by the previous request, a full sync without it
+    - types: Comma separated resources to sync, all of them by default
+    - limit: Rows and deletions per response (at most SYNC_PAGE_SIZE, the default)
+    The response holds the changed rows and the ids of the deleted (or no longer
+    visible) ones by resource, and the cursor of the next request. While `has_more`
+    is true the next page is read with the cursor right away, afterwards the cursor
+    is kept for the next sync. A cursor older than SYNC_TOMBSTONE_DAYS is answered
+    with a 410, the client has to sync from scratch.
+    """
+    permission_classes = [IsAuthenticated, IsActiveAndVerified]
+
+    def get_limit(self):
         try:
-            device = Device.objects.get(pk=device_id)
-            if software.installed_on.count() >= software.max_installations:
-                logger.warning(f"Install software failed: Maximum installations reached for software {software.name} by user {request.user.username}")
-                return Response({'error': 'Maximum number of installations reached.'},
-                                status=status.HTTP_400_BAD_REQUEST)
-
-            software.installed_on.add(device)
-            logger.info(f"Software {software.name} installed on device {device.serial_number} by admin {request.user.username}")
-            return Response({'status': 'Software installed on device successfully.'}, status=status.HTTP_200_OK)
-        except Device.DoesNotExist:
-            logger.warning(f"Install software failed: Device ID {device_id} does not exist (requested by user {request.user.username})")
-            return Response({'error': 'Device does not exist.'}, status=status.HTTP_400_BAD_REQUEST)
+            limit = int(self.request.query_params.get('limit', settings.SYNC_PAGE_SIZE))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        return max(1, min(limit, settings.SYNC_PAGE_SIZE))
+
+    def get(self, request):
+        types = request.query_params.get('types')
+        names = [name.strip() for name in types.split(',') if name.strip()] if types else list(SYNC_RESOURCES)
+        unknown = [name for name in names if name not in SYNC_RESOURCES]
+        if unknown:
+            raise ValidationError({'types': f"Unknown resources: {', '.join(unknown)}."})
+        names = list(dict.fromkeys(names))
+        return Response(get_changes(request.user, names, request.query_params.get('changed_since'), self.get_limit()))
+
+
+class StatsView(APIView):
+    """
+    Fleet dashboard: devices by status and department, interventions by status and
+    software installations against the available seats.
+    Read from the summary counters maintained on every write (accounts.stats), so
+    the cost does not depend on the size of the inventory.
+    Only accessible by admin users.
+    """
+    permission_classes = [IsAdminUser, IsActiveAndVerified]
+
+    def get(self, request):
+        return Response(get_dashboard())
+
+
+class DatabaseStatsView(APIView):
+    """
+    Database connection metrics of the worker process serving the request: pool
+    saturation, requests waiting for a connection and time spent waiting.
+    Only accessible by admin users.
+    """
+    permission_classes = [IsAdminUser, IsActiveAndVerified]
+
+    def get(self, request):
+        return Response(get_connection_metrics())
+
+
+@require_GET
+def metrics(request):
+    """
+    Request histograms and database pool metrics of all the worker processes, in
+    the Prometheus text format. Only served to the clients sending the METRICS_TOKEN
+    as a bearer token, and not found when no token is configured.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    if not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {settings.METRICS_TOKEN}"):
+        return HttpResponse('Invalid metrics token.', status=401, content_type='text/plain')
+    return HttpResponse(
+        render_prometheus(*registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,5 +1,9 @@
+from importlib.util import find_spec
 from pathlib import Path
 import os
+import sys
+
+from celery.schedules import crontab
 from decouple import config, Csv
 
 # Use decouple to use environment variables
@@ -22,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django.contrib.sites',
@@ -38,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -81,6 +87,32 @@ ASGI_APPLICATION = 'core.asgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Database connections
+# Each web worker process keeps a pool of connections (psycopg 3 pool), handed out to
+# the requests and returned when they finish. The pools of the WEB_WORKERS gunicorn
+# workers share DB_MAX_CONNECTIONS connections: keep it below the max_connections of
+# Postgres minus the connections of the Celery workers and of the maintenance tools.
+# Without the pool (DB_POOL_ENABLED=False, or psycopg2 installed instead of psycopg 3,
+# which has no pool support) connections are persistent instead: each thread keeps
+# its connection for DB_CONN_MAX_AGE seconds. Under ASGI every request runs in its own
+# thread, so persistent connections are rarely reused there: use the pool, or put
+# PgBouncer in front of Postgres.
+# Both modes check the connection before handing it out, so a connection dropped by
+# Postgres or the network is replaced instead of failing the request.
+WEB_WORKERS = config('WEB_WORKERS', default=2, cast=int)
+DB_MAX_CONNECTIONS = config('DB_MAX_CONNECTIONS', default=80, cast=int)
+DB_POOL_ENABLED = (
+    config('DB_POOL_ENABLED', default=True, cast=bool)
+    and find_spec('psycopg') is not None
+    and find_spec('psycopg_pool') is not None
+)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=max(DB_MAX_CONNECTIONS // WEB_WORKERS, 1), cast=int)
+DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=min(2, DB_POOL_MAX_SIZE), cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=10, cast=float)  # Seconds waited for a free connection
+DB_POOL_MAX_IDLE = config('DB_POOL_MAX_IDLE', default=300, cast=int)  # Seconds before closing idle extra connections
+DB_POOL_MAX_LIFETIME = config('DB_POOL_MAX_LIFETIME', default=1800, cast=int)  # Seconds before recycling a connection
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)  # Seconds, without the pool
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -89,8 +121,53 @@ DATABASES = {
         'NAME': config('DB_NAME'),
         'USER': config('DB_USERNAME'),
         'PASSWORD': config('DB_PASSWORD'),
+        'CONN_MAX_AGE': 0 if DB_POOL_ENABLED else DB_CONN_MAX_AGE,
+        # With the pool, the check runs when a connection is taken from the pool.
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+}
+if DB_POOL_ENABLED:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': DB_POOL_MIN_SIZE,
+        'max_size': DB_POOL_MAX_SIZE,
+        'timeout': DB_POOL_TIMEOUT,
+        'max_idle': DB_POOL_MAX_IDLE,
+        'max_lifetime': DB_POOL_MAX_LIFETIME,
     }
+
+# Cache
+# The default cache is shared by every worker: Redis when REDIS_URL is set (configure
+# Redis with `maxmemory-policy allkeys-lru`), a local memory cache otherwise.
+# The 'local' cache is the per-process tier of the response cache.
+REDIS_URL = config('REDIS_URL', default='')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'local',
+        'OPTIONS': {
+            'MAX_ENTRIES': config('LOCAL_CACHE_MAX_ENTRIES', default=5000, cast=int),
+        },
+    },
 }
+# Whether the default cache is shared by the worker processes. The local memory
+# fallback is not: an entry invalidated by one worker would still be served by the
+# others, so the caches that must be invalidated everywhere skip it.
+SHARED_CACHE_ENABLED = bool(REDIS_URL)
+
+# Response cache of the accounts read endpoints
+RESPONSE_CACHE_ENABLED = config('RESPONSE_CACHE_ENABLED', default=True, cast=bool)
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=600, cast=int)  # Seconds
+RESPONSE_CACHE_LOCAL_ALIAS = 'local'
+RESPONSE_CACHE_SHARED_ALIAS = 'default'
 
 CSRF_TRUSTED_ORIGINS = os.getenv('DJANGO_CSRF_TRUSTED_ORIGINS').split(',')
 
@@ -122,25 +199,123 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Serve list/retrieve of devices, software and maintenance interventions natively on
+# the event loop under ASGI (accounts.mixins.AsyncReadMixin).
+ASYNC_READ_ENABLED = config('ASYNC_READ_ENABLED', default=True, cast=bool)
+
+# Request metrics (accounts.middleware.RequestMetricsMiddleware)
+# Latency histograms of every request, by viewset and action. A share of the requests
+# (METRICS_SAMPLE_RATE, 0 to 1) also gets its database queries and serialization timed
+# and reported in a Server-Timing header. The histograms of all the workers are served
+# in the Prometheus format on /metrics, to the clients sending the METRICS_TOKEN as a
+# bearer token (the endpoint is disabled without a token).
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=0.1, cast=float)
+METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', default=True, cast=bool)
+METRICS_PUBLISH_INTERVAL = config('METRICS_PUBLISH_INTERVAL', default=5, cast=float)  # Seconds
+METRICS_WORKER_TIMEOUT = config('METRICS_WORKER_TIMEOUT', default=600, cast=int)  # Seconds
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# API authentication
+# Basic authentication hashes the password on every request, set API_BASIC_AUTH_ENABLED=False
+# to accept only session and token authentication on the API routes.
+API_BASIC_AUTH_ENABLED = config('API_BASIC_AUTH_ENABLED', default=True, cast=bool)
+
+API_AUTHENTICATION_CLASSES = [
+    'accounts.authentication.AsyncSessionAuthentication',
+    'accounts.authentication.CachedTokenAuthentication',
+]
+if API_BASIC_AUTH_ENABLED:
+    API_AUTHENTICATION_CLASSES.insert(0, 'rest_framework.authentication.BasicAuthentication')
+
+# Token -> user cache used by CachedTokenAuthentication
+TOKEN_AUTH_CACHE_SIZE = config('TOKEN_AUTH_CACHE_SIZE', default=10000, cast=int)  # In-process LRU entries
+TOKEN_AUTH_LOCAL_CACHE_TIMEOUT = config('TOKEN_AUTH_LOCAL_CACHE_TIMEOUT', default=5, cast=int)  # Seconds
+TOKEN_AUTH_CACHE_TIMEOUT = config('TOKEN_AUTH_CACHE_TIMEOUT', default=300, cast=int)  # Seconds
+
 # Django Rest Framework settings
 REST_FRAMEWORK = {
     'DATETIME_FORMAT': "%d-%m-%Y %H:%M",
-    'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': API_AUTHENTICATION_CLASSES,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
+        'rest_framework.filters.OrderingFilter',
+        'accounts.search.TrigramSearchFilter',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'accounts.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
+# Seconds the email verified flag checked by IsActiveAndVerified is cached
+EMAIL_VERIFIED_CACHE_TIMEOUT = config('EMAIL_VERIFIED_CACHE_TIMEOUT', default=300, cast=int)
+
+# Items accepted by a request to the bulk endpoints (e.g. /devices/bulk-assign/)
+BULK_MAX_ITEMS = config('BULK_MAX_ITEMS', default=1000, cast=int)
+
+# Latest related objects embedded in the device and software payloads (interventions,
+# installations), the others are paged through their sub-resources
+EMBEDDED_ITEMS = config('EMBEDDED_ITEMS', default=10, cast=int)
+
+# Rows and deletions returned per response of the delta sync (/api/v1/accounts/sync/),
+# and days the tombstones of the deleted rows are kept: older sync cursors expire
+SYNC_PAGE_SIZE = config('SYNC_PAGE_SIZE', default=500, cast=int)
+SYNC_TOMBSTONE_DAYS = config('SYNC_TOMBSTONE_DAYS', default=90, cast=int)
+
+# Rows fetched per round trip by the streaming inventory exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Celery
+# Tasks are queued on CELERY_BROKER_URL (Redis) and run by the worker and beat
+# services. Without a broker, and always in the tests, they run eagerly in the
+# calling process on an in-memory broker.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+CELERY_BROKER_URL = 'memory://' if TESTING else config('CELERY_BROKER_URL', default='memory://')
+CELERY_TASK_ALWAYS_EAGER = TESTING or CELERY_BROKER_URL == 'memory://'
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'scan-license-expiry': {
+        'task': 'accounts.tasks.scan_license_expiry',
+        # Every day at 6:00 AM
+        'schedule': crontab(minute='0', hour='6'),
+    },
+    'recompute-derived-data': {
+        'task': 'accounts.tasks.recompute_derived_data',
+        # Every night at 3:30 AM
+        'schedule': crontab(minute='30', hour='3'),
+    },
+    'prune-tombstones': {
+        'task': 'accounts.tasks.prune_tombstones',
+        # Every night at 4:00 AM
+        'schedule': crontab(minute='0', hour='4'),
+    },
+}
+
+# Days before the expiry date a license is listed in the department digests
+LICENSE_EXPIRY_DAYS = config('LICENSE_EXPIRY_DAYS', default=30, cast=int)
+
 REST_AUTH = {
     'REGISTER_SERIALIZER': 'accounts.serializers.CustomRegisterSerializer',
 }
 
 
+# Logging
+# The handlers of the configured loggers run on a writer thread per process
+# (accounts.logs.LogWriter), requests only put their records on a queue. Records
+# beyond LOG_QUEUE_SIZE pending ones are dropped instead of blocking the requests.
+# Audit events of the API writes (accounts.audit) are logged as JSON lines to stdout
+# and logs/audit.log and, with AUDIT_TABLE_ENABLED, stored in the AuditEvent table in
+# batches of AUDIT_TABLE_BATCH_SIZE rows.
+LOG_WRITER_ENABLED = config('LOG_WRITER_ENABLED', default=True, cast=bool)
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+LOG_WRITER_FLUSH_INTERVAL = config('LOG_WRITER_FLUSH_INTERVAL', default=1.0, cast=float)  # Seconds
+AUDIT_TABLE_ENABLED = config('AUDIT_TABLE_ENABLED', default=False, cast=bool)
+AUDIT_TABLE_BATCH_SIZE = config('AUDIT_TABLE_BATCH_SIZE', default=100, cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,  # Keep Django's default loggers
@@ -153,6 +328,9 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'accounts.logs.JSONFormatter',
+        },
     },
     'handlers': {
         'console': {
@@ -167,6 +345,20 @@ LOGGING = {
             'filename': os.path.join(BASE_DIR, 'logs/django.log'),
             'formatter': 'verbose',
         },
+        'audit_console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+            'stream': 'ext://sys.stdout',
+        },
+        'audit_file': {
+            'class': 'logging.FileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs/audit.log'),
+            'formatter': 'json',
+        },
+        'audit_table': {
+            'class': 'accounts.logs.AuditTableHandler',
+            'batch_size': AUDIT_TABLE_BATCH_SIZE,
+        },
     },
     'root': {
         'handlers': ['console'],  # Log of all loggers to console
@@ -188,6 +380,11 @@ LOGGING = {
             'level': 'DEBUG', # or 'DEBUG' for more logs (testing)
             'propagate': False,
         },
+        'accounts.audit': {
+            'handlers': ['audit_console', 'audit_file'] + (['audit_table'] if AUDIT_TABLE_ENABLED else []),
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
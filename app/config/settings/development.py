@@ -1,7 +1,11 @@
-from celery.schedules import crontab
 from decouple import config
 from .base import *
 
+# Celery runs on the Redis service of docker-compose.yml
+if not TESTING:
+    CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://redis:6379/0')
+    CELERY_TASK_ALWAYS_EAGER = False
+
 # Media and static files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, '../../vol/', 'mediafiles')
@@ -0,0 +1,14 @@
+import os
+
+from celery import Celery
+from decouple import config
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', config('DJANGO_SETTINGS_MODULE'))
+
+app = Celery('core')
+
+# Every setting prefixed with CELERY_ in the Django settings configures Celery.
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Load the tasks.py module of every installed app.
+app.autodiscover_tasks()
@@ -7,8 +7,12 @@ from dj_rest_auth.views import (LoginView, LogoutView, PasswordResetView, Passwo
 from dj_rest_auth.registration.views import (RegisterView, ConfirmEmailView,
                                              ResendEmailVerificationView, VerifyEmailView)
 
+from accounts.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Prometheus metrics
+    path('metrics', metrics, name='metrics'),
     path('api/v1/', include([
         path('schema/', SpectacularAPIView.as_view(), name='schema'),
         path('schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
@@ -0,0 +1,14 @@
+# Gunicorn settings, read from the working directory (/app) on start.
+# Options passed on the command line (scripts/docker/starter.sh) take precedence.
+
+
+def post_worker_init(worker):
+    """
+    Warm up each worker (URL resolvers, serializers, database pool) after it loaded
+    the application and before it accepts requests.
+    """
+    from accounts.preflight import warm_up
+
+    timings = warm_up()
+    worker.log.info("Worker warmed up: %s", ', '.join(f"{name} {seconds * 1000:.0f} ms"
+                                                    for name, seconds in timings.items()))